@@ -0,0 +1,99 @@
+#
+#   Copyright 2022 Logical Clocks AB
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+"""Throughput of the archive codecs used to upload model files.
+
+Usage: python benchmarks/archive_codecs.py MODEL_DIR [MODEL_DIR ...]
+
+For each model directory, the archive is streamed into a null sink with every codec, and the
+single-threaded `gztar` archive previously used by `util.compress` is included as baseline.
+Throughput is reported in MB/s of model files, including the size computation pass.
+"""
+
+import argparse
+import os
+import tarfile
+import time
+
+from hsml.constants import ARCHIVE_CODEC
+from hsml.engine.archive_engine import ArchiveEngine
+
+READ_SIZE = 1048576
+
+
+class _NullWriter:
+    def __init__(self):
+        self.size = 0
+
+    def write(self, data):
+        self.size += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+
+def get_model_size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(
+        os.path.getsize(os.path.join(root, f))
+        for root, _, files in os.walk(path)
+        for f in files
+    )
+
+
+def run_codec(path, codec):
+    with ArchiveEngine().stream(path, "benchmark", codec) as archive:
+        while archive.read(READ_SIZE):
+            pass
+    return archive.name, archive.size
+
+
+def run_gztar_baseline(path):
+    sink = _NullWriter()
+    with tarfile.open(fileobj=sink, mode="w|gz") as tar:
+        tar.add(path, arcname=os.curdir)
+    return "gztar (baseline)", sink.size
+
+
+def report(path):
+    model_size = get_model_size(path)
+    print("{} ({:.1f} MB)".format(path, model_size / 1e6))
+    runs = [
+        (codec, lambda codec=codec: run_codec(path, codec))
+        for codec in (ARCHIVE_CODEC.NONE, ARCHIVE_CODEC.GZIP, ARCHIVE_CODEC.AUTO)
+    ]
+    runs.append(("BASELINE", lambda: run_gztar_baseline(path)))
+    for codec, run in runs:
+        start = time.perf_counter()
+        archive_name, archive_size = run()
+        elapsed = time.perf_counter() - start
+        print(
+            "  {:<9} {:<20} {:>10.1f} MB/s  ratio {:.3f}".format(
+                codec,
+                archive_name,
+                model_size / 1e6 / elapsed,
+                archive_size / model_size if model_size > 0 else 1,
+            )
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("paths", nargs="+", help="model directories")
+    for path in parser.parse_args().paths:
+        report(path)
@@ -0,0 +1,190 @@
+#
+#   Copyright 2022 Logical Clocks AB
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+"""Latency of inference requests over gRPC and HTTP/1.1, against a local stub server.
+
+Usage: python benchmarks/grpc_inference.py [--rows ROWS] [--columns COLUMNS] [--requests REQUESTS]
+       python benchmarks/grpc_inference.py --serve [--grpc-port PORT] [--http-port PORT]
+
+The stub server implements the KServe v2 gRPC inference service (`ModelInfer` and
+`ModelReady`) and the v2 HTTP inference endpoint with binary tensors, returning the input
+tensors as outputs. With `--serve`, it runs until interrupted, e.g., to test deployments with
+`enable_grpc(port=...)` against an `hsml.client.istio` client pointing to localhost.
+"""
+
+import argparse
+import json
+import threading
+import time
+
+from concurrent import futures
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from hsml import util
+from hsml.client import grpc_inference, transport
+
+import grpc
+
+
+class StubInferenceServer:
+    """Local inference server echoing the input tensors of each request as output tensors.
+
+    :param grpc_port: port of the gRPC server, 0 for any free port
+    :type grpc_port: int
+    :param http_port: port of the HTTP server, 0 for any free port
+    :type http_port: int
+    """
+
+    def __init__(self, grpc_port=0, http_port=0):
+        self._grpc_server = grpc.server(futures.ThreadPoolExecutor(max_workers=16))
+        self._grpc_server.add_generic_rpc_handlers(
+            [
+                grpc.method_handlers_generic_handler(
+                    grpc_inference.SERVICE,
+                    {
+                        "ModelInfer": grpc.unary_unary_rpc_method_handler(
+                            self._model_infer
+                        ),
+                        "ModelReady": grpc.unary_unary_rpc_method_handler(
+                            lambda request, context: b"\x08\x01"  # ready: true
+                        ),
+                    },
+                )
+            ]
+        )
+        self.grpc_port = self._grpc_server.add_insecure_port(
+            "127.0.0.1:{}".format(grpc_port)
+        )
+        self._http_server = ThreadingHTTPServer(
+            ("127.0.0.1", http_port), _EchoHTTPRequestHandler
+        )
+        self.http_port = self._http_server.server_port
+
+    def start(self):
+        self._grpc_server.start()
+        threading.Thread(target=self._http_server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._grpc_server.stop(None)
+        self._http_server.shutdown()
+
+    def _model_infer(self, request, context):
+        message = grpc_inference._decode_model_infer(
+            request, grpc_inference._RAW_INPUT_CONTENTS
+        )
+        return grpc_inference._encode_model_infer(
+            message["model_name"],
+            {tensor["name"]: tensor["data"] for tensor in message["inputs"]},
+            grpc_inference._RAW_OUTPUT_CONTENTS,
+        )
+
+
+class _EchoHTTPRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        header_length = int(self.headers[util.INFERENCE_HEADER_CONTENT_LENGTH])
+        header = json.loads(body[:header_length])
+        response_header = json.dumps(
+            {"model_name": self.path.split("/")[3], "outputs": header["inputs"]}
+        ).encode("utf-8")
+        self.send_response(200)
+        self.send_header(
+            util.INFERENCE_HEADER_CONTENT_LENGTH, str(len(response_header))
+        )
+        self.send_header(
+            "Content-Length", str(len(response_header) + len(body) - header_length)
+        )
+        self.end_headers()
+        self.wfile.write(response_header + body[header_length:])
+
+    def log_message(self, format, *args):
+        pass
+
+
+def measure(fn, requests):
+    fn()  # warm up, opening the connection
+    latencies = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return np.percentile(latencies, [50, 99])
+
+
+def report(rows, columns, requests):
+    server = StubInferenceServer().start()
+    try:
+        inputs = np.random.rand(rows, columns).astype(np.float32)
+
+        grpc_client = grpc_inference.GrpcInferenceClient(
+            "127.0.0.1:{}".format(server.grpc_port), "model.local", "key"
+        )
+        session = transport.create_session()
+        url = "http://127.0.0.1:{}/v2/models/model/infer".format(server.http_port)
+
+        def http_infer():
+            payload = util.BinaryInferenceRequest({"input-0": inputs})
+            response = session.post(
+                url,
+                data=payload,
+                headers={
+                    util.INFERENCE_HEADER_CONTENT_LENGTH: str(payload.header_length)
+                },
+            )
+            return util.decode_inference_response(
+                response.content,
+                response.headers[util.INFERENCE_HEADER_CONTENT_LENGTH],
+            )
+
+        print("{} x {} float32 inputs, {} requests".format(rows, columns, requests))
+        for name, fn in [
+            ("grpc", lambda: grpc_client.infer("model", inputs)),
+            ("http", http_infer),
+        ]:
+            p50, p99 = measure(fn, requests)
+            print("  {:<5} p50 {:>8.3f} ms  p99 {:>8.3f} ms".format(name, p50, p99))
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1)
+    parser.add_argument("--columns", type=int, default=128)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--serve", action="store_true")
+    parser.add_argument("--grpc-port", type=int, default=8081)
+    parser.add_argument("--http-port", type=int, default=8080)
+    args = parser.parse_args()
+    if args.serve:
+        server = StubInferenceServer(args.grpc_port, args.http_port).start()
+        print(
+            "Serving gRPC on port {} and HTTP on port {}".format(
+                server.grpc_port, server.http_port
+            )
+        )
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            server.stop()
+    else:
+        report(args.rows, args.columns, args.requests)
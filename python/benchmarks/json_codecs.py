@@ -0,0 +1,75 @@
+#
+#   Copyright 2022 Logical Clocks AB
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+"""Latency of the JSON codecs used to encode inference requests and decode responses.
+
+Usage: python benchmarks/json_codecs.py [--rows ROWS] [--columns COLUMNS] [--repeat REPEAT]
+
+Each codec encodes an inference request of float32 instances, given either as a NumPy array or
+as nested lists, and decodes an inference response with the same number of predictions. The
+stdlib codec is the fallback used when orjson is not installed.
+"""
+
+import argparse
+import os
+import time
+
+import numpy as np
+
+from hsml.client import serialization
+
+
+def measure(fn, repeat):
+    fn()  # warm up
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def report(rows, columns, repeat):
+    instances = np.random.rand(rows, columns).astype(np.float32)
+    cases = {
+        "encode ndarray": lambda: serialization.dumps({"instances": instances}),
+        "encode lists": lambda: serialization.dumps({"instances": instances.tolist()}),
+    }
+    response = serialization.dumps({"predictions": instances})
+
+    print("{} x {} float32 instances".format(rows, columns))
+    codecs = [serialization.CODEC_JSON]
+    if serialization.orjson is not None:
+        codecs.append(serialization.CODEC_ORJSON)
+    for codec in codecs:
+        os.environ[serialization.JSON_CODEC] = codec
+        results = [(name, measure(fn, repeat)) for name, fn in cases.items()]
+        results.append(
+            ("decode", measure(lambda: serialization.loads(response), repeat))
+        )
+        print(
+            "  {:<7} ".format(codec)
+            + "  ".join("{} {:>8.2f} ms".format(name, ms) for name, ms in results)
+        )
+    if serialization.orjson is None:
+        print("  orjson is not installed")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=512)
+    parser.add_argument("--columns", type=int, default=768)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+    report(args.rows, args.columns, args.repeat)
@@ -24,12 +24,15 @@ from hsml.client.istio import base as ist_base
 from hsml.client.istio import internal as ist_internal
 from hsml.client.istio import external as ist_external
 
+from hsml.client import health, transport
+
 
 _client_type = None
 _saas_connection = None
 
 _hopsworks_client = None
 _istio_client = None
+_health_checker = None
 
 _kserve_installed = None
 _serving_resource_limits = None
@@ -91,6 +94,71 @@ def get_istio_instance() -> ist_base.Client:
     return _istio_client
 
 
+def is_health_check_enabled() -> bool:
+    """Whether the health of the inference paths is checked, unless disabled by setting the
+    `HSML_HEALTH_CHECK_INTERVAL` environment variable to 0."""
+    return health.HealthChecker.get_interval() > 0
+
+
+def start_health_checks(istio_healthy=True):
+    """Start checking the health of the Istio and Hopsworks inference paths in the background,
+    if enabled.
+
+    :param istio_healthy: whether the Istio path is considered healthy before being checked
+    :type istio_healthy: bool
+    """
+    global _hopsworks_client, _istio_client, _health_checker
+    if _health_checker is not None or not is_health_check_enabled():
+        return
+    _health_checker = health.HealthChecker()
+    if _istio_client:
+        host, port = _istio_client._get_host_port_pair()
+        _health_checker.add_path(
+            health.HealthChecker.ISTIO, host, port, healthy=istio_healthy
+        )
+    if _hopsworks_client:
+        host, port = _hopsworks_client._get_host_port_pair()
+        _health_checker.add_path(health.HealthChecker.HOPSWORKS, host, port)
+    _health_checker.start()
+
+
+def get_health_checker() -> health.HealthChecker:
+    global _health_checker
+    return _health_checker
+
+
+def get_inference_path() -> str:
+    """Get the path to send inference requests to KServe deployments through, `istio` if the
+    Istio client is set and healthy or faster than Hopsworks, otherwise `hopsworks`."""
+    global _istio_client, _health_checker
+    if not _istio_client:
+        return health.HealthChecker.HOPSWORKS
+    if _health_checker is None:
+        return health.HealthChecker.ISTIO
+    return _health_checker.get_path(
+        [health.HealthChecker.ISTIO, health.HealthChecker.HOPSWORKS]
+    )
+
+
+def get_inference_health() -> dict:
+    """Get the health of the Istio and Hopsworks inference paths, if checked."""
+    global _health_checker
+    return _health_checker.to_dict() if _health_checker is not None else None
+
+
+def get_transport_metrics() -> dict:
+    """Get the connection pool metrics of the Hopsworks and Istio clients."""
+    global _hopsworks_client, _istio_client
+    return {
+        "hopsworks": transport.get_metrics(_hopsworks_client._session)
+        if _hopsworks_client
+        else None,
+        "istio": transport.get_metrics(_istio_client._session)
+        if _istio_client
+        else None,
+    }
+
+
 def get_client_type() -> str:
     global _client_type
     return _client_type
@@ -142,7 +210,10 @@ def set_knative_domain(knative_domain):
 
 
 def stop():
-    global _hopsworks_client, _istio_client
+    global _hopsworks_client, _istio_client, _health_checker
+    if _health_checker is not None:
+        _health_checker.stop()
+        _health_checker = None
     _hopsworks_client._close()
     _istio_client._close()
     _hopsworks_client = _istio_client = None
@@ -14,13 +14,15 @@
 #   limitations under the License.
 #
 
+import asyncio
 import furl
+import functools
 from abc import ABC, abstractmethod
 
 import requests
 import urllib3
 
-from hsml.client import exceptions
+from hsml.client import exceptions, serialization, transport
 from hsml.decorators import connected
 
 
@@ -59,6 +61,7 @@ class Client(ABC):
         data=None,
         stream=False,
         files=None,
+        timeout=None,
     ):
         """Send REST request to a REST endpoint.
 
@@ -80,6 +83,8 @@ class Client(ABC):
         :type stream: boolean, optional
         :param files: dictionary for multipart encoding upload
         :type files: dict, optional
+        :param timeout: seconds to wait for the server, defaults to None (no timeout)
+        :type timeout: float, optional
         :raises RestAPIError: Raised when request wasn't correctly received, understood or accepted
         :return: Response json
         :rtype: dict
@@ -98,12 +103,108 @@ class Client(ABC):
         )
 
         prepped = self._session.prepare_request(request)
-        response = self._session.send(prepped, verify=self._verify, stream=stream)
+        response = self._session.send(
+            prepped, verify=self._verify, stream=stream, timeout=timeout
+        )
 
         if self._get_retry(request, response):
             prepped = self._session.prepare_request(request)
-            response = self._session.send(prepped, verify=self._verify, stream=stream)
+            response = self._session.send(
+                prepped, verify=self._verify, stream=stream, timeout=timeout
+            )
+
+        return self._get_response_content(url, response, stream)
+
+    def _prepare_route(self, path_params, headers=None):
+        """Prepare the URL and headers, including authentication, of requests to an endpoint.
+
+        Routes are built once and reused by `_send_route_request`, so that the URL, session
+        headers and authentication are not resolved again on every request.
+
+        :param path_params: a list of path params to build the url from starting after
+            the api resource, for example `["v1", "models", "mymodel:predict"]`.
+        :type path_params: list
+        :param headers: Additional header information, defaults to None
+        :type headers: dict, optional
+        :return: prepared route
+        :rtype: Route
+        """
+        f_url = furl.furl(self._base_url)
+        f_url.path.segments = self.BASE_PATH_PARAMS + path_params
+        return Route(self, str(f_url), headers)
 
+    @connected
+    def _send_route_request(
+        self, method, route, headers=None, data=None, stream=False, timeout=None
+    ):
+        """Send REST request to a prepared route.
+
+        :param method: 'GET', 'PUT' or 'POST'
+        :type method: str
+        :param route: route prepared with `_prepare_route`
+        :type route: Route
+        :param headers: Additional header information of this request, defaults to None
+        :type headers: dict, optional
+        :param data: The payload to be sent, defaults to None
+        :type data: Union[bytes, Iterable], optional
+        :param stream: Set if response should be a stream, defaults to False
+        :type stream: boolean, optional
+        :param timeout: seconds to wait for the server, defaults to None (no timeout)
+        :type timeout: float, optional
+        :raises RestAPIError: Raised when request wasn't correctly received, understood or accepted
+        :return: Response json
+        :rtype: dict
+        """
+        prepped = route.prepare_request(method, headers, data)
+        response = self._session.send(
+            prepped, verify=self._verify, stream=stream, timeout=timeout
+        )
+
+        if self._get_retry(prepped, response):
+            # authentication was refreshed
+            prepped = route.prepare_request(method, headers, data)
+            response = self._session.send(
+                prepped, verify=self._verify, stream=stream, timeout=timeout
+            )
+
+        return self._get_response_content(route.url, response, stream)
+
+    async def _send_route_request_async(
+        self, method, route, headers=None, data=None, stream=False, timeout=None
+    ):
+        """Send REST request to a prepared route without blocking the event loop.
+
+        :param method: 'GET', 'PUT' or 'POST'
+        :type method: str
+        :param route: route prepared with `_prepare_route`
+        :type route: Route
+        :param headers: Additional header information of this request, defaults to None
+        :type headers: dict, optional
+        :param data: The payload to be sent, defaults to None
+        :type data: Union[bytes, Iterable], optional
+        :param stream: Set if response should be a stream, defaults to False
+        :type stream: boolean, optional
+        :param timeout: seconds to wait for the server, defaults to None (no timeout)
+        :type timeout: float, optional
+        :raises RestAPIError: Raised when request wasn't correctly received, understood or accepted
+        :return: Response json
+        :rtype: dict
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            transport.get_async_executor(),
+            functools.partial(
+                self._send_route_request,
+                method,
+                route,
+                headers=headers,
+                data=data,
+                stream=stream,
+                timeout=timeout,
+            ),
+        )
+
+    def _get_response_content(self, url, response, stream):
         if response.status_code // 100 != 2:
             raise exceptions.RestAPIError(url, response)
 
@@ -113,8 +214,117 @@ class Client(ABC):
             # handle different success response codes
             if len(response.content) == 0:
                 return None
-            return response.json()
+            return serialization.loads(response.content)
+
+    async def _send_request_async(
+        self,
+        method,
+        path_params,
+        query_params=None,
+        headers=None,
+        data=None,
+        stream=False,
+        files=None,
+        timeout=None,
+    ):
+        """Send REST request to a REST endpoint without blocking the event loop.
+
+        The request is sent with the same session, connection pools and authentication as
+        `_send_request`, by the bounded executor of asynchronous requests shared by all
+        clients. Awaiting coroutines do not hold a thread while they wait for a free worker.
+
+        :param method: 'GET', 'PUT' or 'POST'
+        :type method: str
+        :param path_params: a list of path params to build the query url from starting after
+            the api resource, for example `["project", 119]`.
+        :type path_params: list
+        :param query_params: A dictionary of key/value pairs to be added as query parameters,
+            defaults to None
+        :type query_params: dict, optional
+        :param headers: Additional header information, defaults to None
+        :type headers: dict, optional
+        :param data: The payload as a python dictionary to be sent as json, defaults to None
+        :type data: dict, optional
+        :param stream: Set if response should be a stream, defaults to False
+        :type stream: boolean, optional
+        :param files: dictionary for multipart encoding upload
+        :type files: dict, optional
+        :param timeout: seconds to wait for the server, defaults to None (no timeout)
+        :type timeout: float, optional
+        :raises RestAPIError: Raised when request wasn't correctly received, understood or accepted
+        :return: Response json
+        :rtype: dict
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            transport.get_async_executor(),
+            functools.partial(
+                self._send_request,
+                method,
+                path_params,
+                query_params=query_params,
+                headers=headers,
+                data=data,
+                stream=stream,
+                files=files,
+                timeout=timeout,
+            ),
+        )
 
     def _close(self):
         """Closes a client. Can be implemented for clean up purposes, not mandatory."""
         self._connected = False
+
+
+class Route:
+    """URL and headers of requests to an endpoint, prepared once with the session headers and
+    the authentication of a client.
+
+    :param client: client sending the requests
+    :type client: Client
+    :param url: url of the endpoint
+    :type url: str
+    :param headers: headers of the requests
+    :type headers: dict
+    """
+
+    def __init__(self, client, url, headers=None):
+        self.client = client
+        self.url = url
+        self._headers = headers
+        self._auth = None
+        self._prepared_headers = None
+
+    def prepare_request(self, method, headers=None, data=None):
+        """Prepare a request to the endpoint, without merging session settings again.
+
+        :param method: 'GET', 'PUT' or 'POST'
+        :type method: str
+        :param headers: Additional header information of this request, defaults to None
+        :type headers: dict, optional
+        :param data: The payload to be sent, defaults to None
+        :type data: Union[bytes, Iterable], optional
+        :return: prepared request
+        :rtype: requests.PreparedRequest
+        """
+        if self._auth is not self.client._auth:
+            # first request, or the authentication of the client was refreshed
+            self._prepare_headers()
+
+        prepped = requests.PreparedRequest()
+        prepped.method = method
+        prepped.url = self.url
+        prepped.headers = self._prepared_headers.copy()
+        if headers is not None:
+            prepped.headers.update(headers)
+        prepped.prepare_body(data, None)
+        return prepped
+
+    def _prepare_headers(self):
+        auth = self.client._auth
+        prepped = self.client._session.prepare_request(
+            requests.Request("POST", url=self.url, headers=self._headers, auth=auth)
+        )
+        prepped.headers.pop("Content-Length", None)
+        self._prepared_headers = prepped.headers
+        self._auth = auth
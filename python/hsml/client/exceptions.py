@@ -71,6 +71,10 @@ class ModelServingException(Exception):
     ERROR_CODE_DEPLOYMENT_NOT_RUNNING = 250001
 
 
+class GrpcUnavailableError(ModelServingException):
+    """Raised when the gRPC inference endpoint of a deployment cannot be reached."""
+
+
 class ExternalClientError(TypeError):
     """Raised when external client cannot be initialized due to missing arguments."""
 
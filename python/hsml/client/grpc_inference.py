@@ -0,0 +1,425 @@
+#
+#   Copyright 2022 Logical Clocks AB
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+import asyncio
+import threading
+import time
+
+import numpy as np
+
+from hsml import util
+from hsml.client.exceptions import GrpcUnavailableError, ModelServingException
+
+try:
+    import grpc
+except ImportError:
+    grpc = None
+
+SERVICE = "inference.GRPCInferenceService"
+MODEL_INFER = "/" + SERVICE + "/ModelInfer"
+MODEL_READY = "/" + SERVICE + "/ModelReady"
+
+# protobuf wire types
+_VARINT = 0
+_FIXED64 = 1
+_LENGTH_DELIMITED = 2
+_FIXED32 = 5
+
+# field numbers of raw tensor contents in ModelInferRequest and ModelInferResponse
+_RAW_INPUT_CONTENTS = 7
+_RAW_OUTPUT_CONTENTS = 6
+
+_channels = {}
+_channels_lock = threading.Lock()
+
+
+def is_available():
+    """Whether the grpcio package is installed."""
+    return grpc is not None
+
+
+def get_channel(target, authority):
+    """Get the channel to an inference endpoint.
+
+    Channels are created once per target and authority (i.e., deployment) and kept open, so
+    that all requests, including concurrent ones, are multiplexed over a persistent HTTP/2
+    connection.
+
+    :param target: host and port of the inference endpoint
+    :type target: str
+    :param authority: authority of the requests, i.e., the host of the deployment
+    :type authority: str
+    :return: gRPC channel
+    :rtype: grpc.Channel
+    """
+    key = (target, authority)
+    with _channels_lock:
+        if key not in _channels:
+            _channels[key] = grpc.insecure_channel(
+                target,
+                options=[
+                    ("grpc.default_authority", authority),
+                    ("grpc.max_send_message_length", -1),
+                    ("grpc.max_receive_message_length", -1),
+                    ("grpc.keepalive_time_ms", 60000),
+                    ("grpc.keepalive_permit_without_calls", 1),
+                ],
+            )
+        return _channels[key]
+
+
+class GrpcInferenceClient:
+    """Client sending inference requests to a deployment using the KServe v2 gRPC protocol.
+
+    Input and output tensors are sent as raw contents, without JSON serialization. If the
+    endpoint is unreachable, requests fail with `GrpcUnavailableError` and the client is marked
+    as unavailable for `RECONNECT_INTERVAL` seconds, so that callers can fall back to HTTP.
+
+    :param target: host and port of the inference endpoint
+    :type target: str
+    :param authority: host of the deployment
+    :type authority: str
+    :param api_key: API key authenticating the requests
+    :type api_key: str
+    :param timeout: seconds to wait for each response, or None to wait indefinitely
+    :type timeout: float
+    """
+
+    RECONNECT_INTERVAL = 30
+
+    def __init__(self, target, authority, api_key, timeout=None):
+        if grpc is None:
+            raise ModelServingException(
+                "gRPC inference requests require the grpcio package, install it with `pip install hsml[grpc]`"
+            )
+        channel = get_channel(target, authority)
+        self._target = target
+        self._metadata = (("authorization", "ApiKey " + api_key),)
+        self._timeout = timeout
+        # messages are encoded and decoded by this module, not by protobuf
+        self._model_infer = channel.unary_unary(MODEL_INFER)
+        self._model_ready = channel.unary_unary(MODEL_READY)
+        self._unavailable_until = 0
+
+    @property
+    def available(self):
+        """Whether the endpoint is considered reachable."""
+        return time.monotonic() >= self._unavailable_until
+
+    def infer(self, model_name, inputs, timeout=None):
+        """Send an inference request.
+
+        :param model_name: name of the model
+        :type model_name: str
+        :param inputs: input tensors, as a dictionary of names and arrays, or a single array
+        :type inputs: Union[dict, np.ndarray]
+        :param timeout: seconds to wait for the response, by default the timeout of the client
+        :type timeout: float
+        :return: inference response, with the output tensors as NumPy arrays
+        :rtype: dict
+        """
+        request = encode_model_infer_request(model_name, inputs)
+        try:
+            response = self._model_infer(
+                request, timeout=self._get_timeout(timeout), metadata=self._metadata
+            )
+        except grpc.RpcError as e:
+            raise self._get_error(e)
+        return decode_model_infer_response(response)
+
+    async def infer_async(self, model_name, inputs, timeout=None):
+        """Send an inference request without blocking the event loop. Requests are sent by the
+        gRPC runtime, not by a thread per request.
+
+        :param model_name: name of the model
+        :type model_name: str
+        :param inputs: input tensors, as a dictionary of names and arrays, or a single array
+        :type inputs: Union[dict, np.ndarray]
+        :param timeout: seconds to wait for the response, by default the timeout of the client
+        :type timeout: float
+        :return: inference response, with the output tensors as NumPy arrays
+        :rtype: dict
+        """
+        request = encode_model_infer_request(model_name, inputs)
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        call = self._model_infer.future(
+            request, timeout=self._get_timeout(timeout), metadata=self._metadata
+        )
+        call.add_done_callback(
+            lambda call: loop.call_soon_threadsafe(self._set_result, future, call)
+        )
+        try:
+            return await future
+        except asyncio.CancelledError:
+            call.cancel()
+            raise
+
+    def is_ready(self, model_name):
+        """Check whether a model is ready to serve inference requests.
+
+        :param model_name: name of the model
+        :type model_name: str
+        :return: whether the model is ready
+        :rtype: bool
+        """
+        try:
+            response = self._model_ready(
+                _encode_string(1, model_name),
+                timeout=self._timeout,
+                metadata=self._metadata,
+            )
+        except grpc.RpcError:
+            return False
+        return any(
+            number == 1 and value == 1
+            for number, _, value in _iter_fields(memoryview(response))
+        )
+
+    def _get_timeout(self, timeout):
+        if timeout is None:
+            return self._timeout
+        if self._timeout is None:
+            return timeout
+        return min(timeout, self._timeout)
+
+    def _set_result(self, future, call):
+        if future.cancelled():
+            return
+        try:
+            future.set_result(decode_model_infer_response(call.result()))
+        except grpc.RpcError as e:
+            future.set_exception(self._get_error(e))
+        except Exception as e:
+            future.set_exception(e)
+
+    def _get_error(self, e):
+        code = e.code()
+        if code in (grpc.StatusCode.UNAVAILABLE, grpc.StatusCode.UNIMPLEMENTED):
+            self._unavailable_until = time.monotonic() + self.RECONNECT_INTERVAL
+            return GrpcUnavailableError(
+                "gRPC inference endpoint {} is not reachable: {}".format(
+                    self._target, e.details()
+                )
+            )
+        return ModelServingException(
+            "gRPC inference request failed with status {}: {}".format(
+                code.name, e.details()
+            )
+        )
+
+
+# - protobuf wire format of the KServe v2 inference messages
+
+
+def encode_model_infer_request(model_name, inputs):
+    """Encode a `ModelInferRequest` message with the input tensors as raw contents.
+
+    :param model_name: name of the model
+    :type model_name: str
+    :param inputs: input tensors, as a dictionary of names and arrays, or a single array
+        named `input-0`
+    :type inputs: Union[dict, np.ndarray]
+    :return: serialized message
+    :rtype: bytes
+    """
+    if isinstance(inputs, np.ndarray):
+        inputs = {"input-0": inputs}
+    if not isinstance(inputs, dict) or len(inputs) == 0:
+        raise ValueError(
+            "gRPC inference inputs must be a NumPy array or a dictionary of NumPy arrays"
+        )
+    return _encode_model_infer(model_name, inputs, _RAW_INPUT_CONTENTS)
+
+
+def decode_model_infer_response(data):
+    """Decode a `ModelInferResponse` message.
+
+    :param data: serialized message
+    :type data: bytes
+    :return: inference response, where the `data` of each output is a NumPy array
+    :rtype: dict
+    """
+    return _decode_model_infer(data, _RAW_OUTPUT_CONTENTS)
+
+
+def _encode_model_infer(model_name, tensors, raw_contents_field):
+    # ModelInferRequest and ModelInferResponse share the field numbers of the model name and
+    # tensors, and so do their tensor messages
+    parts = [_encode_string(1, model_name)]
+    buffers = []
+    for name, tensor in tensors.items():
+        tensor = np.asarray(tensor)
+        datatype, buffer = util._encode_tensor(tensor)
+        tensor_message = _encode_string(1, name) + _encode_string(2, datatype)
+        if tensor.ndim > 0:
+            tensor_message += _encode_length_delimited(
+                3, b"".join(_encode_varint(dim) for dim in tensor.shape)
+            )
+        parts.append(_encode_length_delimited(5, tensor_message))
+        buffers.append(buffer)
+    for buffer in buffers:
+        # buffers are only copied once, when joining the message
+        parts.append(_encode_key(raw_contents_field, _LENGTH_DELIMITED))
+        parts.append(_encode_varint(len(buffer)))
+        parts.append(buffer)
+    return b"".join(parts)
+
+
+def _decode_model_infer(data, raw_contents_field):
+    message = {"model_name": "", "model_version": "", "id": ""}
+    tensors = []
+    buffers = []
+    for number, _, value in _iter_fields(memoryview(data)):
+        if number == 1:
+            message["model_name"] = bytes(value).decode("utf-8")
+        elif number == 2:
+            message["model_version"] = bytes(value).decode("utf-8")
+        elif number == 3:
+            message["id"] = bytes(value).decode("utf-8")
+        elif number == 5:
+            tensors.append(_decode_tensor_message(value))
+        elif number == raw_contents_field:
+            buffers.append(value)
+
+    for i, (tensor, contents) in enumerate(tensors):
+        if i < len(buffers):
+            tensor["data"] = util._decode_tensor(
+                buffers[i], tensor["datatype"], tensor["shape"]
+            )
+        else:
+            tensor["data"] = _decode_contents(
+                contents, tensor["datatype"], tensor["shape"]
+            )
+    message["inputs" if raw_contents_field == _RAW_INPUT_CONTENTS else "outputs"] = [
+        tensor for tensor, _ in tensors
+    ]
+    return message
+
+
+def _decode_tensor_message(buffer):
+    tensor = {"name": "", "datatype": "", "shape": []}
+    contents = None
+    for number, wire_type, value in _iter_fields(buffer):
+        if number == 1:
+            tensor["name"] = bytes(value).decode("utf-8")
+        elif number == 2:
+            tensor["datatype"] = bytes(value).decode("utf-8")
+        elif number == 3:
+            if wire_type == _LENGTH_DELIMITED:  # packed
+                tensor["shape"].extend(_to_signed(v) for v in _iter_varints(value))
+            else:
+                tensor["shape"].append(_to_signed(value))
+        elif number == 5:
+            contents = value
+    return tensor, contents
+
+
+def _decode_contents(contents, datatype, shape):
+    """Decode typed tensor contents, used by servers not returning raw contents."""
+    values = []
+    if contents is not None:
+        for number, wire_type, value in _iter_fields(contents):
+            if number == 8:  # bytes_contents
+                values.append(bytes(value))
+            elif number in (6, 7):  # fp32_contents and fp64_contents
+                values.extend(
+                    np.frombuffer(value, dtype="<f4" if number == 6 else "<f8").tolist()
+                )
+            elif wire_type == _LENGTH_DELIMITED:  # packed integers and booleans
+                values.extend(_iter_varints(value))
+            else:
+                values.append(value)
+
+    if datatype == "BYTES":
+        return np.array(values, dtype=np.object_).reshape(shape)
+    dtype = util._TENSOR_DTYPES[datatype]
+    if dtype.kind == "i":
+        values = [_to_signed(v) for v in values]
+    return np.array(values, dtype=dtype).reshape(shape)
+
+
+def _encode_varint(value):
+    value &= 0xFFFFFFFFFFFFFFFF  # negative values are encoded as 64-bit integers
+    encoded = bytearray()
+    while value > 0x7F:
+        encoded.append((value & 0x7F) | 0x80)
+        value >>= 7
+    encoded.append(value)
+    return bytes(encoded)
+
+
+def _encode_key(number, wire_type):
+    return _encode_varint(number << 3 | wire_type)
+
+
+def _encode_length_delimited(number, value):
+    return _encode_key(number, _LENGTH_DELIMITED) + _encode_varint(len(value)) + value
+
+
+def _encode_string(number, value):
+    return _encode_length_delimited(number, value.encode("utf-8"))
+
+
+def _decode_varint(buffer, offset):
+    value = 0
+    shift = 0
+    while True:
+        byte = buffer[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+
+def _iter_varints(buffer):
+    offset = 0
+    while offset < len(buffer):
+        value, offset = _decode_varint(buffer, offset)
+        yield value
+
+
+def _to_signed(value):
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def _iter_fields(buffer):
+    """Iterate over the fields of a message, as field number, wire type and value. Values of
+    length-delimited fields are views of the buffer, not copies."""
+    offset = 0
+    while offset < len(buffer):
+        key, offset = _decode_varint(buffer, offset)
+        number, wire_type = key >> 3, key & 0x7
+        if wire_type == _VARINT:
+            value, offset = _decode_varint(buffer, offset)
+        elif wire_type == _LENGTH_DELIMITED:
+            length, offset = _decode_varint(buffer, offset)
+            value = buffer[offset : offset + length]
+            offset += length
+        elif wire_type == _FIXED64:
+            value = buffer[offset : offset + 8]
+            offset += 8
+        elif wire_type == _FIXED32:
+            value = buffer[offset : offset + 4]
+            offset += 4
+        else:
+            raise ModelServingException(
+                "Unsupported protobuf wire type {} in gRPC inference message".format(
+                    wire_type
+                )
+            )
+        yield number, wire_type, value
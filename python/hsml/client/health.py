@@ -0,0 +1,308 @@
+#
+#   Copyright 2022 Logical Clocks AB
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+import os
+import socket
+import threading
+import time
+
+
+class PathHealth:
+    """Health of an inference path, scored from connection probes and inference requests.
+
+    Connection latencies, measured by probes, and inference latencies, measured by requests,
+    are averaged separately, since the latter include the time spent by the model server. The
+    error rate of recent inference requests is averaged as well.
+
+    :param max_failures: number of consecutive failures after which the path is unhealthy
+    :type max_failures: int
+    :param healthy: whether the path is considered healthy before being checked
+    :type healthy: bool
+    """
+
+    LATENCY_SMOOTHING = 0.3  # weight of the latest probe in the latency average
+    ERROR_RATE_SMOOTHING = 0.1  # weight of the latest request in the error rate average
+    MIN_SUCCESS_RATE = 0.01
+
+    def __init__(self, max_failures, healthy=True):
+        self._lock = threading.Lock()
+        self._max_failures = max_failures
+        self._failures = 0 if healthy else max_failures
+        self._latency = None
+        self._inference_latency = None
+        self._error_rate = 0
+        self._last_checked = None
+        self._last_error = None
+
+    @property
+    def healthy(self):
+        """Whether the path is healthy."""
+        return self._failures < self._max_failures
+
+    @property
+    def latency(self):
+        """Moving average of the connection latency in seconds, None if not probed yet."""
+        return self._latency
+
+    @property
+    def inference_latency(self):
+        """Moving average of the latency of inference requests in seconds, None if no request
+        was recorded yet."""
+        return self._inference_latency
+
+    @property
+    def error_rate(self):
+        """Moving average of the share of failed inference requests."""
+        return self._error_rate
+
+    def get_score(self):
+        """Get the expected time to get a successful inference response through the path, from
+        the inference latency, or the connection latency if no request was recorded yet, and
+        the error rate, lower is better.
+
+        :return: score in seconds, None if neither probed nor used yet
+        :rtype: float
+        """
+        latency = (
+            self._inference_latency
+            if self._inference_latency is not None
+            else self._latency
+        )
+        if latency is None:
+            return None
+        # failed requests are sent again, on average 1 / success rate times
+        return latency / max(1 - self._error_rate, self.MIN_SUCCESS_RATE)
+
+    def record_success(self, latency=None, inference_latency=None):
+        with self._lock:
+            self._failures = 0
+            if latency is not None:
+                self._latency = self._smooth(self._latency, latency)
+                self._last_checked = time.time()
+            if inference_latency is not None:
+                self._inference_latency = self._smooth(
+                    self._inference_latency, inference_latency
+                )
+                self._error_rate = (1 - self.ERROR_RATE_SMOOTHING) * self._error_rate
+
+    def record_failure(self, error=None, fatal=False, inference=False):
+        with self._lock:
+            if inference:
+                self._error_rate = (
+                    self.ERROR_RATE_SMOOTHING
+                    + (1 - self.ERROR_RATE_SMOOTHING) * self._error_rate
+                )
+            # fatal failures, e.g., inference requests failing to connect, make the path
+            # unhealthy right away
+            self._failures = (
+                self._max_failures
+                if fatal
+                else min(self._failures + 1, self._max_failures)
+            )
+            self._last_error = str(error) if error is not None else None
+
+    def to_dict(self):
+        return {
+            "healthy": self.healthy,
+            "latency": self._latency,
+            "inference_latency": self._inference_latency,
+            "error_rate": self._error_rate,
+            "consecutive_failures": self._failures,
+            "last_checked": self._last_checked,
+            "last_error": self._last_error,
+        }
+
+    def _smooth(self, average, latency):
+        if average is None:
+            return latency
+        return self.LATENCY_SMOOTHING * latency + (1 - self.LATENCY_SMOOTHING) * average
+
+
+class HealthChecker:
+    """Background checker scoring the inference paths of a connection, i.e., the Istio ingress
+    gateway and the Hopsworks REST API proxy.
+
+    Each path is probed every `interval` seconds by opening a TCP connection to its host, and
+    the outcome and latency of inference requests is reported with `record`. A path becomes
+    unhealthy after `max_failures` consecutive failed probes, or right away if an inference
+    request cannot connect to it, and healthy again with the next successful probe or request.
+    Predictions are routed to the preferred healthy path, unless another healthy path is
+    expected to answer at least twice as fast, scoring paths by their inference latency, or
+    their connection latency if no request was sent through them yet, and their error rate.
+    A slow preferred path is therefore compared with the other path once, which is then scored
+    by its own inference requests.
+
+    The probe interval can be set with the `HSML_HEALTH_CHECK_INTERVAL` environment variable.
+    An interval of 0 disables the health checks.
+
+    :param interval: seconds between probes
+    :type interval: float
+    :param timeout: seconds to wait for a connection
+    :type timeout: float
+    :param max_failures: number of consecutive failures after which a path is unhealthy
+    :type max_failures: int
+    """
+
+    ISTIO = "istio"
+    HOPSWORKS = "hopsworks"
+
+    CHECK_INTERVAL = "HSML_HEALTH_CHECK_INTERVAL"
+
+    DEFAULT_CHECK_INTERVAL = 10
+    DEFAULT_CHECK_TIMEOUT = 2
+    DEFAULT_MAX_FAILURES = 3
+
+    SWITCH_RATIO = (
+        0.5  # other paths are preferred only if their score is lower by this factor
+    )
+
+    def __init__(self, interval=None, timeout=None, max_failures=None):
+        self._interval = interval if interval is not None else self.get_interval()
+        self._timeout = timeout if timeout is not None else self.DEFAULT_CHECK_TIMEOUT
+        self._max_failures = (
+            max_failures if max_failures is not None else self.DEFAULT_MAX_FAILURES
+        )
+        self._paths = {}
+        self._addresses = {}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @classmethod
+    def get_interval(cls):
+        """Get the probe interval set with the `HSML_HEALTH_CHECK_INTERVAL` environment
+        variable, or the default interval.
+
+        :return: seconds between probes, 0 if health checks are disabled
+        :rtype: float
+        """
+        return float(os.environ.get(cls.CHECK_INTERVAL, cls.DEFAULT_CHECK_INTERVAL))
+
+    def add_path(self, name, host, port, healthy=True):
+        """Add an inference path to check.
+
+        :param name: name of the path, e.g., `istio`
+        :type name: str
+        :param host: host of the path
+        :type host: str
+        :param port: port of the path
+        :type port: int
+        :param healthy: whether the path is considered healthy before being probed
+        :type healthy: bool
+        """
+        with self._lock:
+            self._paths[name] = PathHealth(self._max_failures, healthy)
+            self._addresses[name] = (host, int(port))
+
+    def start(self):
+        """Start probing the paths in the background, if not started yet."""
+        with self._lock:
+            if self._thread is not None or self._interval <= 0:
+                return
+            self._stop_event.clear()
+            self._thread = threading.Thread(
+                target=self._run, name="hsml-health", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self):
+        """Stop probing the paths."""
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread is not None:
+            self._stop_event.set()
+            thread.join(self._timeout)
+
+    def is_healthy(self, name):
+        """Whether a path is healthy. Paths not checked are considered healthy."""
+        path = self._paths.get(name)
+        return path is None or path.healthy
+
+    def get_path(self, candidates):
+        """Get the path to route requests through.
+
+        :param candidates: names of the candidate paths, in order of preference
+        :type candidates: List[str]
+        :return: the first healthy candidate, or a healthy candidate expected to answer at
+            least twice as fast, or the first candidate if none is healthy
+        :rtype: str
+        """
+        healthy = [name for name in candidates if self.is_healthy(name)]
+        if len(healthy) == 0:
+            return candidates[0]
+        selected = healthy[0]
+        for name in healthy[1:]:
+            score = self._get_score(name)
+            selected_score = self._get_score(selected)
+            if (
+                score is not None
+                and selected_score is not None
+                and score < self.SWITCH_RATIO * selected_score
+            ):
+                selected = name
+        return selected
+
+    def record(self, name, error=None, fatal=False, latency=None):
+        """Record the outcome of an inference request sent through a path.
+
+        :param name: name of the path
+        :type name: str
+        :param error: error of the request, None if it succeeded
+        :type error: Exception
+        :param fatal: whether the error makes the path unhealthy right away
+        :type fatal: bool
+        :param latency: seconds the request took, if it succeeded
+        :type latency: float
+        """
+        path = self._paths.get(name)
+        if path is None:
+            return
+        if error is None:
+            path.record_success(inference_latency=latency)
+        else:
+            path.record_failure(error, fatal, inference=True)
+
+    def check(self):
+        """Probe all paths once."""
+        for name, (host, port) in list(self._addresses.items()):
+            start = time.perf_counter()
+            try:
+                with socket.create_connection((host, port), timeout=self._timeout):
+                    pass
+            except OSError as e:
+                self._paths[name].record_failure(e)
+                continue
+            self._paths[name].record_success(time.perf_counter() - start)
+
+    def to_dict(self):
+        """Get the health of each path.
+
+        :return: whether each path is healthy, the average connection and inference latencies
+            in seconds, the error rate of inference requests, the number of consecutive
+            failures, the time of the last successful probe and the last error
+        :rtype: dict
+        """
+        return {name: path.to_dict() for name, path in self._paths.items()}
+
+    def _get_score(self, name):
+        path = self._paths.get(name)
+        return path.get_score() if path is not None else None
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            self.check()
+            self._stop_event.wait(self._interval)
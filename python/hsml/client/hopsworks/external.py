@@ -14,9 +14,7 @@
 #   limitations under the License.
 #
 
-import requests
-
-from hsml.client import auth, exceptions
+from hsml.client import auth, exceptions, transport
 from hsml.client.hopsworks import base as hopsworks
 
 
@@ -51,7 +49,7 @@ class Client(hopsworks.Client):
         api_key = auth.get_api_key(api_key_value, api_key_file)
         self._auth = auth.ApiKeyAuth(api_key)
 
-        self._session = requests.session()
+        self._session = transport.create_session()
         self._connected = True
         self._verify = self._get_verify(self._host, trust_store_path)
 
@@ -15,12 +15,11 @@
 #
 
 import os
-import requests
 import textwrap
 import base64
 
 from pathlib import Path
-from hsml.client import auth
+from hsml.client import auth, transport
 from hsml.client.hopsworks import base as hopsworks
 
 try:
@@ -67,7 +66,7 @@ class Client(hopsworks.Client):
         except FileNotFoundError:
             self._auth = auth.ApiKeyAuth(self._read_apikey())
         self._verify = self._get_verify(hostname_verification, trust_store_path)
-        self._session = requests.session()
+        self._session = transport.create_session()
 
         self._connected = True
 
@@ -14,9 +14,7 @@
 #   limitations under the License.
 #
 
-import requests
-
-from hsml.client import auth
+from hsml.client import auth, transport
 from hsml.client.istio import base as istio
 
 
@@ -38,7 +36,7 @@ class Client(istio.Client):
 
         self._auth = auth.ApiKeyAuth(api_key_value)
 
-        self._session = requests.session()
+        self._session = transport.create_session()
         self._connected = True
         self._verify = self._get_verify(hostname_verification, trust_store_path)
 
@@ -15,13 +15,12 @@
 #
 
 import os
-import requests
 import textwrap
 import base64
 
 from pathlib import Path
 
-from hsml.client import auth
+from hsml.client import auth, transport
 from hsml.client.istio import base as istio
 
 try:
@@ -64,7 +63,7 @@ class Client(istio.Client):
         self._project_name = self._project_name()
         self._auth = auth.ApiKeyAuth(self._get_serving_api_key())
         self._verify = self._get_verify(hostname_verification, trust_store_path)
-        self._session = requests.session()
+        self._session = transport.create_session()
 
         self._connected = True
 
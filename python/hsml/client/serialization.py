@@ -0,0 +1,169 @@
+#
+#   Copyright 2022 Logical Clocks AB
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+import base64
+import datetime
+import json
+import math
+import os
+
+import numpy as np
+import pandas as pd
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+JSON_CODEC = "HSML_JSON_CODEC"
+
+CODEC_ORJSON = "orjson"
+CODEC_JSON = "json"
+
+
+def convert(obj):
+    """Convert an object not supported by JSON serializers into a serializable object.
+
+    :param obj: object to convert, e.g., NumPy arrays and scalars, pandas timestamps, dates
+        or bytes
+    :return: converted object, and whether the object was converted
+    :rtype: Tuple[object, bool]
+    """
+
+    def encode_binary(x):
+        return base64.encodebytes(x).decode("ascii")
+
+    if isinstance(obj, np.ndarray):
+        if obj.dtype == np.bytes_:
+            return np.vectorize(encode_binary)(obj), True
+        # elements of object arrays not supported by the serializer are converted lazily
+        return obj.tolist(), True
+
+    if isinstance(obj, (pd.Timestamp, datetime.date)):
+        return obj.isoformat(), True
+    if isinstance(obj, bytes) or isinstance(obj, bytearray):
+        return encode_binary(obj), True
+    if isinstance(obj, np.generic):
+        return obj.item(), True
+    if isinstance(obj, np.datetime64):
+        return np.datetime_as_string(obj), True
+    return obj, False
+
+
+def _default(obj):
+    res, converted = convert(obj)
+    if converted:
+        return res
+    raise TypeError(
+        "Object of type {} is not JSON serializable".format(type(obj).__name__)
+    )
+
+
+class _JSONEncoder(json.JSONEncoder):
+    def default(self, obj):  # pylint: disable=E0202
+        res, converted = convert(obj)
+        if converted:
+            return res
+        return super().default(obj)
+
+
+def get_codec():
+    """Get the JSON codec in use, `orjson` if installed, unless the `HSML_JSON_CODEC`
+    environment variable is set to `json`."""
+    codec = os.environ.get(JSON_CODEC, CODEC_ORJSON).lower()
+    if codec == CODEC_ORJSON and orjson is not None:
+        return CODEC_ORJSON
+    return CODEC_JSON
+
+
+def dumps(obj):
+    """Serialize an object to JSON, including NumPy arrays and scalars, pandas timestamps and dates.
+
+    NumPy arrays are serialized natively by orjson, without converting them to lists first.
+    Objects containing NaN or infinite floats, which orjson serializes as null, or integers
+    out of the 64-bit range are serialized with the json module, as `NaN`, `Infinity` and
+    `-Infinity` and arbitrary precision integers respectively.
+
+    :param obj: object to serialize
+    :return: JSON document
+    :rtype: bytes
+    """
+    if get_codec() == CODEC_ORJSON:
+        try:
+            return orjson.dumps(
+                _to_orjson_compatible(obj),
+                default=_default,
+                option=orjson.OPT_SERIALIZE_NUMPY
+                | orjson.OPT_NON_STR_KEYS
+                | orjson.OPT_PASSTHROUGH_DATETIME,
+            )
+        except (_NonFiniteFloatError, orjson.JSONEncodeError):
+            pass
+    return json.dumps(obj, cls=_JSONEncoder).encode("utf-8")
+
+
+class _NonFiniteFloatError(ValueError):
+    pass
+
+
+def _to_orjson_compatible(obj):
+    """Prepare an object to be serialized by orjson, raising `_NonFiniteFloatError` if it
+    contains NaN or infinite floats."""
+    if isinstance(obj, np.ndarray):
+        if obj.dtype == np.object_:
+            return _to_orjson_compatible(obj.tolist())
+        if obj.dtype.kind == "f" and not np.isfinite(obj).all():
+            raise _NonFiniteFloatError()
+        # orjson serializes arrays in non-native byte order as if they were native
+        if not obj.dtype.isnative:
+            return obj.astype(obj.dtype.newbyteorder("="))
+        return obj
+    if isinstance(obj, (float, np.floating)):
+        if not math.isfinite(obj):
+            raise _NonFiniteFloatError()
+        return obj
+    if isinstance(obj, dict):
+        return {key: _to_orjson_compatible(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        if len(obj) > 0 and type(obj[0]) in (int, float):
+            # lists of numbers are only walked if their sum is not finite, as the sum is
+            # finite only if all the numbers are
+            try:
+                total = sum(obj)
+                if type(total) in (int, float) and math.isfinite(total):
+                    return obj
+            except (TypeError, OverflowError):
+                pass
+        return [_to_orjson_compatible(value) for value in obj]
+    return obj
+
+
+def loads(data):
+    """Deserialize a JSON document.
+
+    Documents not accepted by orjson, such as documents with `NaN` or `Infinity` values, are
+    deserialized with the json module.
+
+    :param data: JSON document
+    :type data: Union[bytes, str]
+    :return: deserialized object
+    """
+    if get_codec() == CODEC_ORJSON:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(data)
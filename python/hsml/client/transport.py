@@ -0,0 +1,358 @@
+#
+#   Copyright 2022 Logical Clocks AB
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+import os
+import socket
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3 import connection, connectionpool
+from urllib3.poolmanager import PoolManager
+from urllib3.util.retry import Retry
+
+
+class TransportMetrics:
+    """Connection pool metrics of a transport, updated by the threads sending requests."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._requests = 0
+            self._connections = 0
+            self._connection_time = 0.0
+            self._max_connection_time = 0.0
+
+    def _add_request(self):
+        with self._lock:
+            self._requests += 1
+
+    def _add_connection(self, elapsed):
+        with self._lock:
+            self._connections += 1
+            self._connection_time += elapsed
+            self._max_connection_time = max(self._max_connection_time, elapsed)
+
+    def to_dict(self):
+        """Get a snapshot of the metrics.
+
+        :return: number of connections taken from the pools (`requests`), of requests sent on
+            an already open connection (`pool_hits`) and of connections opened (`pool_misses`),
+            and the total, mean and max seconds spent opening connections, including TLS
+            handshakes
+        :rtype: dict
+        """
+        with self._lock:
+            return {
+                "requests": self._requests,
+                "pool_hits": max(self._requests - self._connections, 0),
+                "pool_misses": self._connections,
+                "connection_setup_time": self._connection_time,
+                "mean_connection_setup_time": (
+                    self._connection_time / self._connections
+                    if self._connections > 0
+                    else 0.0
+                ),
+                "max_connection_setup_time": self._max_connection_time,
+            }
+
+
+class _TimedConnectionMixin:
+    metrics = None
+
+    def connect(self):
+        start = time.perf_counter()
+        super().connect()
+        if self.metrics is not None:
+            self.metrics._add_connection(time.perf_counter() - start)
+
+
+class _TimedHTTPConnection(_TimedConnectionMixin, connection.HTTPConnection):
+    pass
+
+
+class _TimedHTTPSConnection(_TimedConnectionMixin, connection.HTTPSConnection):
+    pass
+
+
+class _InstrumentedPoolMixin:
+    metrics = None
+
+    def _new_conn(self):
+        conn = super()._new_conn()
+        conn.metrics = self.metrics
+        return conn
+
+    def _get_conn(self, timeout=None):
+        if self.metrics is not None:
+            self.metrics._add_request()
+        return super()._get_conn(timeout)
+
+
+class _InstrumentedHTTPConnectionPool(
+    _InstrumentedPoolMixin, connectionpool.HTTPConnectionPool
+):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _InstrumentedHTTPSConnectionPool(
+    _InstrumentedPoolMixin, connectionpool.HTTPSConnectionPool
+):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class _InstrumentedPoolManager(PoolManager):
+    def __init__(self, metrics, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = metrics
+        self.pool_classes_by_scheme = {
+            "http": _InstrumentedHTTPConnectionPool,
+            "https": _InstrumentedHTTPSConnectionPool,
+        }
+
+    def _new_pool(self, scheme, host, port, request_context=None):
+        pool = super()._new_pool(scheme, host, port, request_context)
+        pool.metrics = self.metrics
+        return pool
+
+
+class PooledHTTPAdapter(HTTPAdapter):
+    """HTTP adapter with tuned connection pools, socket options and retries.
+
+    Each host gets a pool of up to `pool_maxsize` persistent connections. Sockets disable
+    Nagle's algorithm and enable TCP keep-alive probes, so idle pooled connections are not
+    silently dropped by load balancers. Connection failures are retried for all methods, while
+    read failures and 502, 503 and 504 responses are only retried for idempotent methods,
+    with exponential backoff. Range requests are not retried, since their callers retry them
+    resuming from the last byte received.
+
+    :param pool_connections: number of hosts with a connection pool
+    :type pool_connections: int
+    :param pool_maxsize: number of connections kept per host
+    :type pool_maxsize: int
+    :param max_retries: number of retries of a failed request
+    :type max_retries: int
+    :param backoff_factor: backoff factor in seconds between retries
+    :type backoff_factor: float
+    :param keep_alive_idle: seconds of inactivity before sending TCP keep-alive probes
+    :type keep_alive_idle: int
+    """
+
+    POOL_CONNECTIONS = "HSML_HTTP_POOL_CONNECTIONS"
+    POOL_MAXSIZE = "HSML_HTTP_POOL_MAXSIZE"
+    MAX_RETRIES = "HSML_HTTP_MAX_RETRIES"
+    BACKOFF_FACTOR = "HSML_HTTP_BACKOFF_FACTOR"
+    KEEP_ALIVE_IDLE = "HSML_HTTP_KEEP_ALIVE_IDLE"
+
+    DEFAULT_POOL_CONNECTIONS = 4
+    DEFAULT_POOL_MAXSIZE = 32
+    DEFAULT_MAX_RETRIES = 3
+    DEFAULT_BACKOFF_FACTOR = 0.1
+    DEFAULT_KEEP_ALIVE_IDLE = 60
+
+    RETRY_STATUS_CODES = [502, 503, 504]
+
+    def __init__(
+        self,
+        pool_connections=None,
+        pool_maxsize=None,
+        max_retries=None,
+        backoff_factor=None,
+        keep_alive_idle=None,
+    ):
+        self.metrics = TransportMetrics()
+        self._keep_alive_idle = _get_setting(
+            keep_alive_idle, self.KEEP_ALIVE_IDLE, self.DEFAULT_KEEP_ALIVE_IDLE, int
+        )
+        max_retries = _get_setting(
+            max_retries, self.MAX_RETRIES, self.DEFAULT_MAX_RETRIES, int
+        )
+        retry = _create_retry(
+            total=max_retries,
+            connect=max_retries,
+            read=max_retries,
+            status=max_retries,
+            status_forcelist=self.RETRY_STATUS_CODES,
+            backoff_factor=_get_setting(
+                backoff_factor,
+                self.BACKOFF_FACTOR,
+                self.DEFAULT_BACKOFF_FACTOR,
+                float,
+            ),
+            # the last response is returned, so that clients raise their own errors
+            raise_on_status=False,
+        )
+        super().__init__(
+            pool_connections=_get_setting(
+                pool_connections,
+                self.POOL_CONNECTIONS,
+                self.DEFAULT_POOL_CONNECTIONS,
+                int,
+            ),
+            pool_maxsize=_get_setting(
+                pool_maxsize, self.POOL_MAXSIZE, self.DEFAULT_POOL_MAXSIZE, int
+            ),
+            max_retries=retry,
+        )
+        # sends range requests through the same connection pools, without retries
+        self._range_adapter = HTTPAdapter(max_retries=Retry(0, read=False))
+        self._range_adapter.poolmanager = self.poolmanager
+
+    def send(self, request, **kwargs):
+        if "Range" in request.headers:
+            return self._range_adapter.send(request, **kwargs)
+        return super().send(request, **kwargs)
+
+    def init_poolmanager(self, connections, maxsize, block=False, **pool_kwargs):
+        self._pool_connections = connections
+        self._pool_maxsize = maxsize
+        self._pool_block = block
+        self.poolmanager = _InstrumentedPoolManager(
+            self.metrics,
+            num_pools=connections,
+            maxsize=maxsize,
+            block=block,
+            socket_options=self._get_socket_options(),
+            **pool_kwargs
+        )
+
+    def _get_socket_options(self):
+        options = list(connection.HTTPConnection.default_socket_options)
+        if (socket.IPPROTO_TCP, socket.TCP_NODELAY, 1) not in options:
+            options.append((socket.IPPROTO_TCP, socket.TCP_NODELAY, 1))
+        options.append((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1))
+        # keep-alive timings are not configurable on every platform
+        if hasattr(socket, "TCP_KEEPIDLE"):
+            options.append(
+                (socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, self._keep_alive_idle)
+            )
+        if hasattr(socket, "TCP_KEEPINTVL"):
+            options.append((socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, 10))
+        if hasattr(socket, "TCP_KEEPCNT"):
+            options.append((socket.IPPROTO_TCP, socket.TCP_KEEPCNT, 3))
+        return options
+
+
+def create_session(**kwargs):
+    """Create a session sending requests through a `PooledHTTPAdapter`.
+
+    :param kwargs: settings of the adapter, by default read from the `HSML_HTTP_*`
+        environment variables
+    :return: requests session
+    :rtype: requests.Session
+    """
+    session = requests.session()
+    adapter = PooledHTTPAdapter(**kwargs)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def get_metrics(session):
+    """Get the transport metrics of a session created with `create_session`.
+
+    :param session: requests session
+    :type session: requests.Session
+    :return: transport metrics, or None if the session does not use a `PooledHTTPAdapter`
+    :rtype: dict
+    """
+    adapter = session.get_adapter("https://")
+    if not isinstance(adapter, PooledHTTPAdapter):
+        return None
+    return adapter.metrics.to_dict()
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Get the executor sending the requests of asynchronous calls.
+
+    The executor is shared by all clients and has as many threads as connections kept per
+    host, so any number of concurrent asynchronous requests is served by a bounded number of
+    threads, without opening more connections than the pools keep alive.
+
+    :return: shared thread pool executor
+    :rtype: concurrent.futures.ThreadPoolExecutor
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=_get_setting(
+                    None,
+                    PooledHTTPAdapter.POOL_MAXSIZE,
+                    PooledHTTPAdapter.DEFAULT_POOL_MAXSIZE,
+                    int,
+                ),
+                thread_name_prefix="hsml-transport",
+            )
+        return _executor
+
+
+ASYNC_MAX_WORKERS = "HSML_ASYNC_MAX_WORKERS"
+DEFAULT_ASYNC_MAX_WORKERS = 128
+
+_async_executor = None
+
+
+def get_async_executor():
+    """Get the executor sending the inference requests of asynchronous calls.
+
+    Asynchronous inference requests have their own pool of threads, so that they do not queue
+    behind the batches, hedged requests and other work of the executor returned by
+    `get_executor`. Its size bounds the number of asynchronous inference requests in flight,
+    further requests wait for a free thread without holding one. It can be set with the
+    `HSML_ASYNC_MAX_WORKERS` environment variable, independently of the connections kept per
+    host: requests beyond `HSML_HTTP_POOL_MAXSIZE` open connections closed after use.
+
+    :return: thread pool executor of asynchronous inference requests
+    :rtype: concurrent.futures.ThreadPoolExecutor
+    """
+    global _async_executor
+    with _executor_lock:
+        if _async_executor is None:
+            _async_executor = ThreadPoolExecutor(
+                max_workers=_get_setting(
+                    None, ASYNC_MAX_WORKERS, DEFAULT_ASYNC_MAX_WORKERS, int
+                ),
+                thread_name_prefix="hsml-async",
+            )
+        return _async_executor
+
+
+def _create_retry(**kwargs):
+    """Create a retry configuration retrying idempotent methods only, as `Retry` does by default.
+
+    urllib3 1.26 renamed the `method_whitelist` argument of `Retry` to `allowed_methods`, and
+    removed the former in 2.0.
+    """
+    if hasattr(Retry, "DEFAULT_ALLOWED_METHODS"):
+        return Retry(allowed_methods=Retry.DEFAULT_ALLOWED_METHODS, **kwargs)
+    return Retry(method_whitelist=Retry.DEFAULT_METHOD_WHITELIST, **kwargs)
+
+
+def _get_setting(value, env_var, default, parse):
+    if value is not None:
+        return value
+    return parse(os.environ.get(env_var, default))
@@ -29,6 +29,12 @@ class MODEL_SERVING:
     MODELS_DATASET = "Models"
 
 
+class ARCHIVE_CODEC:
+    AUTO = "AUTO"
+    NONE = "NONE"
+    GZIP = "GZIP"
+
+
 class ARTIFACT_VERSION:
     CREATE = "CREATE"
 
@@ -64,6 +70,16 @@ class INFERENCE_BATCHER:
 class DEPLOYMENT:
     ACTION_START = "START"
     ACTION_STOP = "STOP"
+    STATE_TTL = 1  # seconds a fetched state is reused
+
+
+class DEPLOYMENT_STATE_CHANGE:
+    TYPE_ADDED = "ADDED"
+    TYPE_MODIFIED = "MODIFIED"
+    TYPE_DELETED = "DELETED"
+    FIELD_STATUS = "status"
+    FIELD_CONDITION = "condition"
+    FIELD_AVAILABLE_INSTANCES = "available_instances"
 
 
 class PREDICTOR:
@@ -75,6 +91,11 @@ class PREDICTOR:
     SERVING_TOOL_KSERVE = "KSERVE"
 
 
+class INFERENCE_PROTOCOL:
+    V1 = "V1"
+    V2 = "V2"
+
+
 class PREDICTOR_STATE:
     # status
     STATUS_CREATING = "Creating"
@@ -14,13 +14,149 @@
 #   limitations under the License.
 #
 
+import hashlib
 import math
 import os
 import json
+import tempfile
+import threading
+import zlib
 from hsml.client.exceptions import RestAPIError
 import time
 
-from hsml import client, tag
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ThreadPoolExecutor,
+    as_completed,
+    wait,
+)
+
+from requests.exceptions import RequestException
+
+from hsml import client, tag, util
+
+
+class UploadManifest:
+    """Local record of the flow chunks acknowledged by the server during an upload.
+
+    The manifest is an append-only file with a JSON header describing the upload, followed
+    by one line per acknowledged chunk containing the chunk number and its CRC32 checksum.
+    It is kept when an upload fails so that a later upload of the same file to the same path
+    only sends the chunks that are missing, and removed once the upload completes.
+    """
+
+    MANIFESTS_DIR = os.path.join(tempfile.gettempdir(), "hsml", "uploads")
+
+    def __init__(self, upload_path, flow_params):
+        self._header = {
+            "uploadPath": upload_path,
+            "flowIdentifier": flow_params["flowIdentifier"],
+            "flowChunkSize": flow_params["flowChunkSize"],
+            "flowTotalSize": flow_params["flowTotalSize"],
+            "flowTotalChunks": flow_params["flowTotalChunks"],
+        }
+        key = hashlib.sha1(
+            json.dumps(self._header, sort_keys=True).encode("utf-8")
+        ).hexdigest()
+        self._path = os.path.join(self.MANIFESTS_DIR, key)
+        self._file = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def exists(cls, upload_path, file_names):
+        """Check whether this client has the manifest of an interrupted upload of any of the
+        given files to a path.
+
+        :param upload_path: path in datasets the files were uploaded to
+        :type upload_path: str
+        :param file_names: names of the uploaded files
+        :type file_names: Set[str]
+        :return: whether a manifest of an upload of one of the files exists
+        :rtype: bool
+        """
+        try:
+            manifests = os.listdir(cls.MANIFESTS_DIR)
+        except OSError:
+            return False
+        for manifest in manifests:
+            try:
+                with open(os.path.join(cls.MANIFESTS_DIR, manifest), "r") as f:
+                    header = json.loads(f.readline())
+                # flow identifiers are the file size and name separated by an underscore
+                _, file_name = header["flowIdentifier"].split("_", 1)
+            except (OSError, ValueError, TypeError, KeyError):
+                continue
+            if header["uploadPath"] == upload_path and file_name in file_names:
+                return True
+        return False
+
+    def load(self):
+        """Load the chunks acknowledged in previous attempts of this upload.
+
+        :return: checksums of the acknowledged chunks by chunk number
+        :rtype: dict
+        """
+        acknowledged = {}
+        try:
+            with open(self._path, "r") as f:
+                if json.loads(f.readline()) != self._header:
+                    return acknowledged
+                for line in f:
+                    try:
+                        chunk_number, checksum = line.split()
+                        acknowledged[int(chunk_number)] = int(checksum)
+                    except ValueError:
+                        break  # truncated line written by an interrupted upload
+        except (OSError, ValueError):
+            pass
+        return acknowledged
+
+    def open(self, acknowledged):
+        """Start recording acknowledged chunks, keeping the ones already acknowledged."""
+        os.makedirs(self.MANIFESTS_DIR, exist_ok=True)
+        self._file = open(self._path, "w")
+        self._file.write(json.dumps(self._header, sort_keys=True) + "\n")
+        for chunk_number, checksum in acknowledged.items():
+            self._file.write("{} {}\n".format(chunk_number, checksum))
+        self._file.flush()
+
+    def add(self, chunk_number, checksum):
+        """Record a chunk acknowledged by the server."""
+        with self._lock:
+            self._file.write("{} {}\n".format(chunk_number, checksum))
+            self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def remove(self):
+        """Remove the manifest once the upload is complete."""
+        self.close()
+        if os.path.exists(self._path):
+            os.remove(self._path)
+
+
+class _PositionalWriter:
+    """Writes data at given offsets of a file, from multiple threads."""
+
+    def __init__(self, fd):
+        self._fd = fd
+        self._lock = threading.Lock()
+
+    def write(self, data, offset):
+        data = memoryview(data)
+        if hasattr(os, "pwrite"):
+            while len(data) > 0:
+                written = os.pwrite(self._fd, data, offset)
+                data = data[written:]
+                offset += written
+        else:
+            with self._lock:
+                os.lseek(self._fd, offset, os.SEEK_SET)
+                while len(data) > 0:
+                    data = data[os.write(self._fd, data) :]
 
 
 class DatasetApi:
@@ -28,43 +164,175 @@ class DatasetApi:
         pass
 
     DEFAULT_FLOW_CHUNK_SIZE = 1048576
+    DEFAULT_UPLOAD_SIMULTANEOUS_UPLOADS = 3
+    DEFAULT_UPLOAD_MAX_CHUNK_RETRIES = 3
+    DEFAULT_UPLOAD_CHUNK_RETRY_INTERVAL = 1
+    DEFAULT_DOWNLOAD_RANGE_SIZE = 67108864
+    DEFAULT_DOWNLOAD_SIMULTANEOUS_RANGES = 4
+    DEFAULT_DOWNLOAD_MAX_RANGE_RETRIES = 3
+
+    STATUS_CODE_RANGE_NOT_SATISFIABLE = 416
 
-    def upload(self, local_abs_path, upload_path):
+    def upload(
+        self,
+        local_abs_path,
+        upload_path,
+        chunk_size=DEFAULT_FLOW_CHUNK_SIZE,
+        simultaneous_uploads=DEFAULT_UPLOAD_SIMULTANEOUS_UPLOADS,
+        max_chunk_retries=DEFAULT_UPLOAD_MAX_CHUNK_RETRIES,
+        chunk_retry_interval=DEFAULT_UPLOAD_CHUNK_RETRY_INTERVAL,
+        resume=True,
+    ):
         """Upload file/directory in local path to datasets
 
+        The file is split into flow chunks which are sent concurrently by a bounded pool of
+        threads, reusing the connections kept alive by the client session. Failed chunks are
+        retried individually. If the upload still fails, the chunks acknowledged so far are
+        recorded in a local manifest and a later upload of the same file only sends the
+        chunks that the server is missing.
+
         :param local_abs_path: local path to upload
         :type local_abs_path: str
         :param upload_path: path in datasets to upload
         :type upload_path: str
+        :param chunk_size: size in bytes of each flow chunk
+        :type chunk_size: int
+        :param simultaneous_uploads: number of chunks uploaded concurrently
+        :type simultaneous_uploads: int
+        :param max_chunk_retries: number of times a failed chunk is retried
+        :type max_chunk_retries: int
+        :param chunk_retry_interval: seconds to wait before retrying a failed chunk
+        :type chunk_retry_interval: float
+        :param resume: whether to skip chunks acknowledged in previous attempts
+        :type resume: bool
         """
 
         size = os.path.getsize(local_abs_path)
 
         _, file_name = os.path.split(local_abs_path)
 
-        num_chunks = math.ceil(size / self.DEFAULT_FLOW_CHUNK_SIZE)
+        with open(local_abs_path, "rb") as f:
+            self.upload_stream(
+                f,
+                file_name,
+                size,
+                upload_path,
+                chunk_size=chunk_size,
+                simultaneous_uploads=simultaneous_uploads,
+                max_chunk_retries=max_chunk_retries,
+                chunk_retry_interval=chunk_retry_interval,
+                resume=resume,
+            )
 
-        base_params = self._get_flow_base_params(file_name, num_chunks, size)
+    def upload_stream(
+        self,
+        stream,
+        file_name,
+        size,
+        upload_path,
+        chunk_size=DEFAULT_FLOW_CHUNK_SIZE,
+        simultaneous_uploads=DEFAULT_UPLOAD_SIMULTANEOUS_UPLOADS,
+        max_chunk_retries=DEFAULT_UPLOAD_MAX_CHUNK_RETRIES,
+        chunk_retry_interval=DEFAULT_UPLOAD_CHUNK_RETRY_INTERVAL,
+        resume=True,
+    ):
+        """Upload the content of a readable stream as a file in datasets
 
-        chunk_number = 1
-        with open(local_abs_path, "rb") as f:
-            while True:
-                chunk = f.read(self.DEFAULT_FLOW_CHUNK_SIZE)
-                if not chunk:
-                    break
+        The stream is read sequentially, one flow chunk at a time, so it does not need to be
+        seekable. See `upload` for the details on concurrency, retries and resumption.
 
-                query_params = base_params
-                query_params["flowCurrentChunkSize"] = len(chunk)
-                query_params["flowChunkNumber"] = chunk_number
+        :param stream: readable binary stream with the file content
+        :type stream: io.RawIOBase
+        :param file_name: name of the uploaded file
+        :type file_name: str
+        :param size: total size in bytes of the stream content
+        :type size: int
+        :param upload_path: path in datasets to upload
+        :type upload_path: str
+        :param chunk_size: size in bytes of each flow chunk
+        :type chunk_size: int
+        :param simultaneous_uploads: number of chunks uploaded concurrently
+        :type simultaneous_uploads: int
+        :param max_chunk_retries: number of times a failed chunk is retried
+        :type max_chunk_retries: int
+        :param chunk_retry_interval: seconds to wait before retrying a failed chunk
+        :type chunk_retry_interval: float
+        :param resume: whether to skip chunks acknowledged in previous attempts
+        :type resume: bool
+        """
 
-                self._upload_request(query_params, upload_path, file_name, chunk)
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be a positive number of bytes")
+        if simultaneous_uploads < 1:
+            raise ValueError("simultaneous_uploads must be at least 1")
 
-                chunk_number += 1
+        num_chunks = math.ceil(size / chunk_size)
+
+        base_params = self._get_flow_base_params(
+            file_name, num_chunks, size, chunk_size
+        )
 
-    def _get_flow_base_params(self, file_name, num_chunks, size):
+        manifest = UploadManifest(upload_path, base_params)
+        acknowledged = manifest.load() if resume else {}
+        manifest.open(acknowledged)
+
+        # bound the number of chunks held in memory while waiting to be sent
+        max_pending_chunks = simultaneous_uploads * 2
+
+        chunk_number = 1
+        pending = set()
+        try:
+            with ThreadPoolExecutor(max_workers=simultaneous_uploads) as executor:
+                try:
+                    while True:
+                        chunk = stream.read(chunk_size)
+                        if not chunk:
+                            break
+
+                        query_params = dict(base_params)
+                        query_params["flowCurrentChunkSize"] = len(chunk)
+                        query_params["flowChunkNumber"] = chunk_number
+
+                        checksum = zlib.crc32(chunk)
+                        pending.add(
+                            executor.submit(
+                                self._upload_chunk,
+                                query_params,
+                                upload_path,
+                                file_name,
+                                chunk,
+                                checksum,
+                                manifest,
+                                acknowledged.get(chunk_number) == checksum,
+                                max_chunk_retries,
+                                chunk_retry_interval,
+                            )
+                        )
+                        chunk_number += 1
+
+                        if len(pending) >= max_pending_chunks:
+                            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                            for future in done:
+                                future.result()  # raise upload errors early
+
+                    for future in as_completed(pending):
+                        future.result()
+                except BaseException:
+                    for future in pending:
+                        future.cancel()
+                    raise
+        except BaseException:
+            manifest.close()  # keep acknowledged chunks for resuming the upload
+            raise
+
+        manifest.remove()
+
+    def _get_flow_base_params(
+        self, file_name, num_chunks, size, chunk_size=DEFAULT_FLOW_CHUNK_SIZE
+    ):
         return {
             "templateId": -1,
-            "flowChunkSize": self.DEFAULT_FLOW_CHUNK_SIZE,
+            "flowChunkSize": chunk_size,
             "flowTotalSize": size,
             "flowIdentifier": str(size) + "_" + file_name,
             "flowFilename": file_name,
@@ -72,6 +340,63 @@ class DatasetApi:
             "flowTotalChunks": num_chunks,
         }
 
+    def _upload_chunk(
+        self,
+        params,
+        path,
+        file_name,
+        chunk,
+        checksum,
+        manifest,
+        acknowledged,
+        max_chunk_retries,
+        chunk_retry_interval,
+    ):
+        # chunks acknowledged in a previous attempt are only skipped if the server still has them
+        if acknowledged and self._is_chunk_uploaded(params, path):
+            return
+
+        attempt = 0
+        while True:
+            try:
+                self._upload_request(params, path, file_name, chunk)
+                break
+            except (RestAPIError, RequestException) as e:
+                if attempt >= max_chunk_retries or not self._is_retryable(e):
+                    raise e
+                attempt += 1
+                time.sleep(chunk_retry_interval)
+
+        manifest.add(params["flowChunkNumber"], checksum)
+
+    def _is_retryable(self, error):
+        if isinstance(error, RestAPIError):
+            return (
+                error.response.status_code
+                >= RestAPIError.STATUS_CODE_INTERNAL_SERVER_ERROR
+            )
+        return True  # connection errors and timeouts
+
+    def _is_chunk_uploaded(self, params, path):
+        """Check whether the server already has a flow chunk, following the flow test-chunk protocol.
+
+        :param params: flow params of the chunk
+        :type params: dict
+        :param path: path in datasets where the file is uploaded
+        :type path: str
+        :return: whether the chunk is already uploaded
+        :rtype: bool
+        """
+        _client = client.get_instance()
+        path_params = ["project", _client._project_id, "dataset", "upload", path]
+        try:
+            with _client._send_request(
+                "GET", path_params, query_params=params, stream=True
+            ) as response:
+                return response.status_code == 200
+        except (RestAPIError, RequestException):
+            return False
+
     def _upload_request(self, params, path, file_name, chunk):
         _client = client.get_instance()
         path_params = ["project", _client._project_id, "dataset", "upload", path]
@@ -81,14 +406,105 @@ class DatasetApi:
             "POST", path_params, data=params, files={"file": (file_name, chunk)}
         )
 
-    def download(self, path, local_path):
+    def download(
+        self,
+        path,
+        local_path,
+        range_size=DEFAULT_DOWNLOAD_RANGE_SIZE,
+        simultaneous_ranges=DEFAULT_DOWNLOAD_SIMULTANEOUS_RANGES,
+        max_range_retries=DEFAULT_DOWNLOAD_MAX_RANGE_RETRIES,
+    ):
         """Download file/directory on a path in datasets.
+
+        Files larger than the range size are downloaded in byte ranges fetched concurrently
+        with HTTP Range requests, and written in place into a preallocated local file. Each
+        range is retried individually, resuming from the last byte received. If the server
+        does not support range requests, or the file is empty, the file is downloaded in a
+        single stream.
+
         :param path: path to download
         :type path: str
         :param local_path: path to download in datasets
         :type local_path: str
+        :param range_size: size in bytes of each range downloaded concurrently
+        :type range_size: int
+        :param simultaneous_ranges: number of ranges downloaded concurrently
+        :type simultaneous_ranges: int
+        :param max_range_retries: number of times a failed range is retried
+        :type max_range_retries: int
         """
 
+        # the first range doubles as a probe of range support and of the file size
+        try:
+            response = self._download_request(
+                path, first_byte=0, last_byte=range_size - 1
+            )
+        except RestAPIError as e:
+            if e.response.status_code != self.STATUS_CODE_RANGE_NOT_SATISFIABLE:
+                raise e
+            # no range of an empty file can be satisfied
+            response = self._download_request(path)
+
+        with response:
+            file_size = self._get_range_total_size(response)
+            if file_size is None or file_size <= range_size:
+                # ranges not supported, or the file fits in a single range
+                with open(local_path, "wb") as f:
+                    if not response.headers.get("Content-Length"):
+                        print("Downloading file ...", end=" ")
+                    for chunk in response.iter_content(
+                        chunk_size=self.DEFAULT_FLOW_CHUNK_SIZE
+                    ):
+                        f.write(chunk)
+                return
+
+            fd = os.open(
+                local_path,
+                os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0),
+                0o666,
+            )
+            try:
+                self._preallocate(fd, file_size)
+                writer = _PositionalWriter(fd)
+                ranges = [
+                    (first_byte, min(first_byte + range_size, file_size) - 1)
+                    for first_byte in range(range_size, file_size, range_size)
+                ]
+                pending = []
+                with ThreadPoolExecutor(max_workers=simultaneous_ranges) as executor:
+                    try:
+                        pending.append(
+                            executor.submit(
+                                self._download_range,
+                                path,
+                                writer,
+                                0,
+                                range_size - 1,
+                                max_range_retries,
+                                response,
+                            )
+                        )
+                        for first_byte, last_byte in ranges:
+                            pending.append(
+                                executor.submit(
+                                    self._download_range,
+                                    path,
+                                    writer,
+                                    first_byte,
+                                    last_byte,
+                                    max_range_retries,
+                                )
+                            )
+                        for future in as_completed(pending):
+                            future.result()
+                    except BaseException:
+                        for future in pending:
+                            future.cancel()
+                        raise
+            finally:
+                os.close(fd)
+
+    def _download_request(self, path, first_byte=None, last_byte=None):
         _client = client.get_instance()
         path_params = [
             "project",
@@ -99,20 +515,70 @@ class DatasetApi:
             path,
         ]
         query_params = {"type": "DATASET"}
+        headers = (
+            {"Range": "bytes={}-{}".format(first_byte, last_byte)}
+            if first_byte is not None
+            else None
+        )
+
+        return _client._send_request(
+            "GET", path_params, query_params=query_params, headers=headers, stream=True
+        )
 
-        with _client._send_request(
-            "GET", path_params, query_params=query_params, stream=True
-        ) as response:
-            with open(local_path, "wb") as f:
-                downloaded = 0
-                file_size = response.headers.get("Content-Length")
-                if not file_size:
-                    print("Downloading file ...", end=" ")
-                for chunk in response.iter_content(
-                    chunk_size=self.DEFAULT_FLOW_CHUNK_SIZE
+    def _download_range(
+        self, path, writer, first_byte, last_byte, max_range_retries, response=None
+    ):
+        offset = first_byte
+        attempt = 0
+        while offset <= last_byte:
+            try:
+                if response is None:
+                    response = self._download_request(path, offset, last_byte)
+                with response:
+                    if self._get_range_start(response) != offset:
+                        raise IOError(
+                            "Unexpected range returned while downloading {}: {}".format(
+                                path, response.headers.get("Content-Range")
+                            )
+                        )
+                    for chunk in response.iter_content(
+                        chunk_size=self.DEFAULT_FLOW_CHUNK_SIZE
+                    ):
+                        writer.write(chunk, offset)
+                        offset += len(chunk)
+                if offset <= last_byte:
+                    raise IOError(
+                        "Incomplete range received while downloading {}".format(path)
+                    )
+            except (RestAPIError, RequestException, IOError) as e:
+                if attempt >= max_range_retries or (
+                    isinstance(e, RestAPIError) and not self._is_retryable(e)
                 ):
-                    f.write(chunk)
-                    downloaded += len(chunk)
+                    raise e
+                attempt += 1
+                time.sleep(self.DEFAULT_UPLOAD_CHUNK_RETRY_INTERVAL)
+            finally:
+                response = None  # resume from the last byte received
+
+    def _get_range_total_size(self, response):
+        if response.status_code != 206:
+            return None
+        try:
+            return int(response.headers["Content-Range"].split("/")[1])
+        except (KeyError, IndexError, ValueError):
+            return None
+
+    def _get_range_start(self, response):
+        try:
+            return int(response.headers["Content-Range"].split()[1].split("-")[0])
+        except (KeyError, IndexError, ValueError):
+            return None
+
+    def _preallocate(self, fd, size):
+        try:
+            os.posix_fallocate(fd, 0, size)
+        except (AttributeError, OSError):
+            os.ftruncate(fd, size)  # e.g., on Windows or unsupported file systems
 
     def get(self, remote_path):
         """Get metadata about a path in datasets.
@@ -141,7 +607,7 @@ class DatasetApi:
         except RestAPIError:
             return False
 
-    def list(self, remote_path, sort_by=None, limit=1000):
+    def list(self, remote_path, sort_by=None, limit=1000, offset=0):
         """List all files in a directory in datasets.
 
         :param remote_path: path to list
@@ -150,15 +616,52 @@ class DatasetApi:
         :type sort_by: str
         :param limit: max number of returned files
         :type limit: int
+        :param offset: number of files to skip
+        :type offset: int
         """
         _client = client.get_instance()
         path_params = ["project", _client._project_id, "dataset", remote_path]
-        query_params = {"action": "listing", "sort_by": sort_by, "limit": limit}
+        query_params = {
+            "action": "listing",
+            "sort_by": sort_by,
+            "limit": limit,
+            "offset": offset,
+        }
         headers = {"content-type": "application/json"}
         return _client._send_request(
             "GET", path_params, headers=headers, query_params=query_params
         )
 
+    def walk(self, remote_path, recursive=True, page_size=1000):
+        """Iterate over all the entries in a directory in datasets.
+
+        Listings are fetched page by page, so directories with more entries than the page
+        size are fully traversed. Directories are yielded before their content.
+
+        :param remote_path: path to the directory
+        :type remote_path: str
+        :param recursive: whether to traverse nested directories
+        :type recursive: bool
+        :param page_size: number of entries fetched per listing request
+        :type page_size: int
+        :return: generator of dataset entry attributes, including `path`, `dir` and `size`
+        :rtype: Generator[dict]
+        """
+        offset = 0
+        while True:
+            listing = self.list(
+                remote_path, sort_by="NAME:asc", limit=page_size, offset=offset
+            )
+            items = listing.get("items", []) if listing is not None else []
+            for item in items:
+                attributes = item["attributes"]
+                yield attributes
+                if recursive and attributes.get("dir", False):
+                    yield from self.walk(attributes["path"], recursive, page_size)
+            offset += len(items)
+            if len(items) == 0 or offset >= listing.get("count", 0):
+                break
+
     def chmod(self, remote_path, permissions):
         """Chmod operation on file or directory in datasets.
 
@@ -243,46 +746,32 @@ class DatasetApi:
 
         if block is True:
             # Wait for zip file to appear. When it does, check that parent dir zipState is not set to CHOWNING
-            count = 0
-            while count < timeout:
+            def is_archived():
                 if action == "zip":
                     zip_path = remote_path + ".zip"
                     # Get the status of the zipped file
                     if destination_path is None:
-                        zip_exists = self.path_exists(zip_path)
+                        archive_exists = self.path_exists(zip_path)
                     else:
-                        zip_exists = self.path_exists(
+                        archive_exists = self.path_exists(
                             destination_path + "/" + os.path.split(zip_path)[1]
                         )
-                    # Get the zipState of the directory being zipped
-                    dir_status = self.get(remote_path)
-                    zip_state = (
-                        dir_status["zipState"] if "zipState" in dir_status else None
-                    )
-                    if zip_exists and zip_state == "NONE":
-                        return
-                    else:
-                        time.sleep(1)
-                elif action == "unzip":
+                else:
                     # Get the status of the unzipped dir
-                    unzipped_dir_exists = self.path_exists(
+                    archive_exists = self.path_exists(
                         remote_path[: remote_path.index(".")]
                     )
-                    # Get the zipState of the zip being extracted
-                    dir_status = self.get(remote_path)
-                    zip_state = (
-                        dir_status["zipState"] if "zipState" in dir_status else None
+                # Get the zipState of the directory being zipped or the zip being extracted
+                dir_status = self.get(remote_path)
+                zip_state = dir_status["zipState"] if "zipState" in dir_status else None
+                return True if archive_exists and zip_state == "NONE" else None
+
+            if util.poll(is_archived, timeout) is None:
+                raise Exception(
+                    "Timeout of {} seconds exceeded while {} {}.".format(
+                        timeout, action, remote_path
                     )
-                    if unzipped_dir_exists and zip_state == "NONE":
-                        return
-                    else:
-                        time.sleep(1)
-                count += 1
-            raise Exception(
-                "Timeout of {} seconds exceeded while {} {}.".format(
-                    timeout, action, remote_path
                 )
-            )
 
     def unzip(self, remote_path, block=False, timeout=120):
         """Unzip an archive in the dataset.
@@ -57,7 +57,10 @@ class ModelServingApi:
         client.set_kserve_installed(is_kserve_installed)
 
         # istio client
-        self._set_istio_client_if_available()
+        istio_reachable = self._set_istio_client_if_available()
+        if client.get_istio_instance() is not None:
+            # keep checking istio and hopsworks paths, to fail over between them
+            client.start_health_checks(istio_reachable)
 
         # resource limits
         max_resources = self._serving_api.get_resource_limits()
@@ -72,13 +75,17 @@ class ModelServingApi:
         client.set_knative_domain(knative_domain)
 
     def _set_istio_client_if_available(self):
-        """Set istio client if available"""
+        """Set istio client if available
+
+        :return: whether the istio client is reachable
+        :rtype: bool
+        """
 
         if client.is_kserve_installed():
             # check existing istio client
             try:
                 if client.get_istio_instance() is not None:
-                    return  # istio client already set
+                    return True  # istio client already set
             except Exception:
                 pass
 
@@ -113,7 +120,7 @@ class ModelServingApi:
                         _client._project_name,
                         _client._auth._token,  # reuse hopsworks client token
                     )
-                    return
+                    return True
                 # in case there's not load balancer, check if node port is open
                 endpoint = get_endpoint_by_type(
                     inference_endpoints, INFERENCE_ENDPOINTS.ENDPOINT_TYPE_NODE
@@ -123,19 +130,31 @@ class ModelServingApi:
                     _client = client.get_instance()
                     host = _client.host
                     port = endpoint.get_port(INFERENCE_ENDPOINTS.PORT_NAME_HTTP).number
-                    if self._is_host_port_open(host, port):
-                        # and it is open
+                    istio_reachable = self._is_host_port_open(host, port)
+                    if istio_reachable or client.is_health_check_enabled():
+                        # if health checks are enabled, set even if it is not open yet,
+                        # inference requests are routed through it once the checks find it
+                        # open. Otherwise, v2, binary and gRPC requests would be sent to an
+                        # unreachable endpoint
                         client.set_istio_client(
                             host,
                             port,
                             _client._project_name,
                             _client._auth._token,  # reuse hopsworks client token
                         )
-                        return
+                    if istio_reachable:
+                        return True
                 # otherwise, fallback to hopsworks client
                 print(
-                    "External IP not configured for the Istio ingress gateway, the Hopsworks client will be used for model inference instead"
+                    "External IP not configured for the Istio ingress gateway, the Hopsworks client will be used for model inference"
+                    + (
+                        " until it is reachable"
+                        if client.is_health_check_enabled()
+                        else ""
+                    )
                 )
+                return False
+        return True
 
     def _is_host_port_open(self, host, port):
         sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
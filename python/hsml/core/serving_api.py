@@ -14,12 +14,16 @@
 #   limitations under the License.
 #
 
-import json
+import time
 
-from hsml import client, deployment, predictor_state
+import requests
+
+from hsml import client, deployment, predictor_state, util
 from hsml import inference_endpoint
 from hsml import deployable_component_logs
-from hsml.constants import ARTIFACT_VERSION
+from hsml.constants import ARTIFACT_VERSION, INFERENCE_PROTOCOL, PREDICTOR
+from hsml.client import grpc_inference, health, serialization
+from hsml.client.exceptions import ModelServingException, RestAPIError
 
 
 class ServingApi:
@@ -150,13 +154,18 @@ class ServingApi:
         ]
         return _client._send_request("DELETE", path_params)
 
-    def get_state(self, deployment_instance):
+    def get_state(self, deployment_instance, etag=None):
         """Get the state of a given deployment
 
+        If an entity tag is given and the backend supports conditional requests, the state is
+        only returned if it changed since it was tagged.
+
         :param deployment_instance: metadata object of the deployment to get state of
         :type deployment_instance: Deployment
-        :return: predictor state
-        :rtype: PredictorState
+        :param etag: entity tag of the state last fetched, defaults to None
+        :type etag: str, optional
+        :return: predictor state, or None if it did not change, and its entity tag
+        :rtype: Tuple[PredictorState, str]
         """
 
         _client = client.get_instance()
@@ -166,8 +175,20 @@ class ServingApi:
             "serving",
             str(deployment_instance.id),
         ]
-        deployment_json = _client._send_request("GET", path_params)
-        return predictor_state.PredictorState.from_response_json(deployment_json)
+        headers = {"If-None-Match": etag} if etag is not None else None
+        try:
+            response = _client._send_request(
+                "GET", path_params, headers=headers, stream=True
+            )
+        except RestAPIError as re:
+            if re.response.status_code == 304:
+                return None, etag  # not modified
+            raise re
+        deployment_json = serialization.loads(response.content)
+        return (
+            predictor_state.PredictorState.from_response_json(deployment_json),
+            response.headers.get("ETag"),
+        )
 
     def reset_changes(self, deployment_instance):
         """Reset a given deployment to the original values in the Hopsworks instance
@@ -190,7 +211,8 @@ class ServingApi:
         self,
         deployment_instance,
         data: dict,
-        through_hopsworks: bool = False,
+        through_hopsworks: bool = None,
+        timeout: float = None,
     ):
         """Send inference requests to a deployment with a certain id
 
@@ -198,12 +220,318 @@ class ServingApi:
         :type deployment_instance: Deployment
         :param data: payload of the inference requests
         :type data: dict
-        :param through_hopsworks: whether to send the inference request through the Hopsworks REST API
+        :param through_hopsworks: whether to send the inference request through the Hopsworks REST API,
+            by default only if the deployment is not served by KServe
+        :type through_hopsworks: bool
+        :param timeout: seconds to wait for the response
+        :type timeout: float
+        :return: inference response
+        :rtype: dict
+        """
+
+        payload = serialization.dumps(data)
+        route = self._get_inference_route(deployment_instance, through_hopsworks)
+        try:
+            return self._send_recorded(
+                route,
+                lambda: self._send_inference_route_request(
+                    deployment_instance, route, payload, timeout
+                ),
+            )
+        except requests.ConnectionError as e:
+            failover_route = self._get_failover_route(
+                deployment_instance, through_hopsworks, route, e
+            )
+            return self._send_recorded(
+                failover_route,
+                lambda: self._send_inference_route_request(
+                    deployment_instance, failover_route, payload, timeout
+                ),
+            )
+
+    async def send_inference_request_async(
+        self,
+        deployment_instance,
+        data: dict,
+        through_hopsworks: bool = None,
+        timeout: float = None,
+    ):
+        """Send inference requests to a deployment with a certain id, without blocking the event loop
+
+        :param deployment_instance: metadata object of the deployment to be used for the prediction
+        :type deployment_instance: Deployment
+        :param data: payload of the inference requests
+        :type data: dict
+        :param through_hopsworks: whether to send the inference request through the Hopsworks REST API,
+            by default only if the deployment is not served by KServe
         :type through_hopsworks: bool
+        :param timeout: seconds to wait for the response
+        :type timeout: float
         :return: inference response
         :rtype: dict
         """
 
+        payload = serialization.dumps(data)
+        route = self._get_inference_route(deployment_instance, through_hopsworks)
+        try:
+            return await self._send_recorded_async(
+                route,
+                lambda: self._send_inference_route_request_async(
+                    deployment_instance, route, payload, timeout
+                ),
+            )
+        except requests.ConnectionError as e:
+            failover_route = self._get_failover_route(
+                deployment_instance, through_hopsworks, route, e
+            )
+            return await self._send_recorded_async(
+                failover_route,
+                lambda: self._send_inference_route_request_async(
+                    deployment_instance, failover_route, payload, timeout
+                ),
+            )
+
+    def get_model_metadata(self, deployment_instance):
+        """Get the metadata of the model served by a deployment, following the v2 inference protocol
+
+        :param deployment_instance: metadata object of the deployment
+        :type deployment_instance: Deployment
+        :return: model metadata, including the name, shape and datatype of inputs and outputs
+        :rtype: dict
+        """
+
+        _client, headers = self._get_v2_client(deployment_instance)
+        path_params = ["v2", "models", deployment_instance.name]
+        return _client._send_request("GET", path_params, headers=headers)
+
+    def is_model_ready(self, deployment_instance):
+        """Check whether the model served by a deployment is ready, following the v2 inference protocol
+
+        :param deployment_instance: metadata object of the deployment
+        :type deployment_instance: Deployment
+        :return: whether the model is ready to receive inference requests
+        :rtype: bool
+        """
+
+        _client, headers = self._get_v2_client(deployment_instance)
+        path_params = ["v2", "models", deployment_instance.name, "ready"]
+        try:
+            _client._send_request("GET", path_params, headers=headers)
+            return True
+        except RestAPIError:
+            return False
+
+    def send_binary_inference_request(
+        self, deployment_instance, inputs, timeout: float = None
+    ):
+        """Send inference requests with binary tensor data to a deployment with a certain id
+
+        :param deployment_instance: metadata object of the deployment to be used for the prediction
+        :type deployment_instance: Deployment
+        :param inputs: input tensors, as a dictionary of names and arrays or a single array
+        :type inputs: Union[dict, np.ndarray]
+        :param timeout: seconds to wait for the response
+        :type timeout: float
+        :return: inference response, with the output tensors as NumPy arrays
+        :rtype: dict
+        """
+
+        route = self._get_inference_route(deployment_instance, None, binary=True)
+        payload = util.BinaryInferenceRequest(inputs)
+        response = self._send_recorded(
+            route,
+            lambda: route.client._send_route_request(
+                "POST",
+                route,
+                headers={
+                    util.INFERENCE_HEADER_CONTENT_LENGTH: str(payload.header_length)
+                },
+                data=payload,
+                stream=True,
+                timeout=timeout,
+            ),
+        )
+        return util.decode_inference_response(
+            response.content,
+            response.headers.get(util.INFERENCE_HEADER_CONTENT_LENGTH),
+        )
+
+    async def send_binary_inference_request_async(
+        self, deployment_instance, inputs, timeout: float = None
+    ):
+        """Send inference requests with binary tensor data to a deployment with a certain id,
+        without blocking the event loop
+
+        :param deployment_instance: metadata object of the deployment to be used for the prediction
+        :type deployment_instance: Deployment
+        :param inputs: input tensors, as a dictionary of names and arrays or a single array
+        :type inputs: Union[dict, np.ndarray]
+        :param timeout: seconds to wait for the response
+        :type timeout: float
+        :return: inference response, with the output tensors as NumPy arrays
+        :rtype: dict
+        """
+
+        route = self._get_inference_route(deployment_instance, None, binary=True)
+        payload = util.BinaryInferenceRequest(inputs)
+        response = await self._send_recorded_async(
+            route,
+            lambda: route.client._send_route_request_async(
+                "POST",
+                route,
+                headers={
+                    util.INFERENCE_HEADER_CONTENT_LENGTH: str(payload.header_length)
+                },
+                data=payload,
+                stream=True,
+                timeout=timeout,
+            ),
+        )
+        return util.decode_inference_response(
+            response.content,
+            response.headers.get(util.INFERENCE_HEADER_CONTENT_LENGTH),
+        )
+
+    def get_grpc_inference_client(self, deployment_instance, port=None, timeout=None):
+        """Get a client sending inference requests to a deployment using the KServe v2 gRPC protocol
+
+        :param deployment_instance: metadata object of the deployment to be used for the prediction
+        :type deployment_instance: Deployment
+        :param port: port of the gRPC inference endpoint, by default the port of the cluster
+            inference endpoint
+        :type port: int
+        :param timeout: seconds to wait for each response
+        :type timeout: float
+        :return: gRPC inference client
+        :rtype: GrpcInferenceClient
+        """
+
+        _client, headers = self._get_v2_client(deployment_instance)
+        return grpc_inference.GrpcInferenceClient(
+            "{}:{}".format(_client._host, port if port is not None else _client._port),
+            headers["host"],
+            _client._auth._token,
+            timeout,
+        )
+
+    def _send_inference_route_request(
+        self, deployment_instance, route, payload, timeout
+    ):
+        if not self._is_v2_inference(deployment_instance):
+            return route.client._send_route_request(
+                "POST", route, data=payload, timeout=timeout
+            )
+
+        response = route.client._send_route_request(
+            "POST", route, data=payload, stream=True, timeout=timeout
+        )
+        return util.decode_inference_response(response.content)
+
+    async def _send_inference_route_request_async(
+        self, deployment_instance, route, payload, timeout
+    ):
+        if not self._is_v2_inference(deployment_instance):
+            return await route.client._send_route_request_async(
+                "POST", route, data=payload, timeout=timeout
+            )
+
+        response = await route.client._send_route_request_async(
+            "POST", route, data=payload, stream=True, timeout=timeout
+        )
+        return util.decode_inference_response(response.content)
+
+    def _get_failover_route(self, deployment_instance, through_hopsworks, route, e):
+        """Get the route to resend an inference request that could not reach its path, or
+        raise the connection error if there is no other path to send it through."""
+        if (
+            through_hopsworks is not None  # path explicitly requested
+            or self._is_v2_inference(deployment_instance)  # only served by istio
+            or deployment_instance.predictor.serving_tool
+            != PREDICTOR.SERVING_TOOL_KSERVE
+        ):
+            raise e
+        # the other path, whether or not the health checks noticed the failure yet
+        failover_route = self._get_inference_route(
+            deployment_instance, route.client is client.get_istio_instance()
+        )
+        if failover_route.client is route.client:
+            raise e
+        return failover_route
+
+    def _send_recorded(self, route, send_fn):
+        """Send an inference request through a route, and report its latency or connection
+        error to the health checker of the inference paths."""
+        start = time.perf_counter()
+        try:
+            response = send_fn()
+        except requests.ConnectionError as e:
+            self._record_inference(route, e)
+            raise
+        self._record_inference(route, latency=time.perf_counter() - start)
+        return response
+
+    async def _send_recorded_async(self, route, send_coro_fn):
+        start = time.perf_counter()
+        try:
+            response = await send_coro_fn()
+        except requests.ConnectionError as e:
+            self._record_inference(route, e)
+            raise
+        self._record_inference(route, latency=time.perf_counter() - start)
+        return response
+
+    def _record_inference(self, route, error=None, latency=None):
+        """Report the outcome of an inference request to the health checker of the inference
+        paths. Only connection errors are attributed to the path, not to the deployment."""
+        health_checker = client.get_health_checker()
+        if health_checker is None:
+            return
+        path = (
+            health.HealthChecker.ISTIO
+            if route.client is client.get_istio_instance()
+            else health.HealthChecker.HOPSWORKS
+        )
+        health_checker.record(path, error, fatal=error is not None, latency=latency)
+
+    def _get_inference_route(
+        self, deployment_instance, through_hopsworks, binary=False
+    ):
+        """Get the prepared route of inference requests to a deployment.
+
+        Routes are built on the first request and kept by the deployment until it is updated,
+        its state changes or the client is closed. Unless requested, whether requests to
+        KServe deployments go through Hopsworks depends on the health of the inference paths.
+        """
+        if through_hopsworks is None and not binary:
+            # if not KServe, send request to Hopsworks
+            through_hopsworks = (
+                deployment_instance.predictor.serving_tool
+                != PREDICTOR.SERVING_TOOL_KSERVE
+                or client.get_inference_path() == health.HealthChecker.HOPSWORKS
+            )
+        key = (deployment_instance.inference_protocol, through_hopsworks, binary)
+        route = deployment_instance._inference_routes.get(key)
+        if route is None or not route.client._connected:
+            if binary:
+                _client, headers = self._get_v2_client(deployment_instance)
+                headers["content-type"] = "application/octet-stream"
+                path_params = self._get_istio_v2_inference_path(deployment_instance)
+            else:
+                _client, path_params, headers = self._get_inference_request(
+                    deployment_instance, through_hopsworks
+                )
+            route = _client._prepare_route(path_params, headers)
+            deployment_instance._inference_routes[key] = route
+        return route
+
+    def _get_inference_request(self, deployment_instance, through_hopsworks):
+        """Get the client, path params and headers of inference requests to a deployment."""
+        if self._is_v2_inference(deployment_instance):
+            _client, headers = self._get_v2_client(deployment_instance)
+            headers["content-type"] = "application/json"
+            path_params = self._get_istio_v2_inference_path(deployment_instance)
+            return _client, path_params, headers
+
         headers = {"content-type": "application/json"}
         if through_hopsworks:
             # use Hopsworks client
@@ -228,9 +556,28 @@ class ServingApi:
                 path_params = self._get_hopsworks_inference_path(
                     _client._project_id, deployment_instance
                 )
-        return _client._send_request(
-            "POST", path_params, headers=headers, data=json.dumps(data)
-        )
+        return _client, path_params, headers
+
+    def _get_v2_client(self, deployment_instance):
+        """Get the client and headers of v2 protocol requests to a deployment."""
+        # the v2 protocol is only exposed by KServe, not by the Hopsworks REST API
+        _client = client.get_istio_instance()
+        if _client is None:
+            raise ModelServingException(
+                "The v2 inference protocol is only supported for KServe deployments, "
+                "when the cluster inference endpoint is reachable"
+            )
+        headers = {
+            "host": self._get_inference_request_host_header(
+                _client._project_name,
+                deployment_instance.name,
+                client.get_knative_domain(),
+            )
+        }
+        return _client, headers
+
+    def _is_v2_inference(self, deployment_instance):
+        return deployment_instance.inference_protocol == INFERENCE_PROTOCOL.V2
 
     def is_kserve_installed(self):
         """Check if kserve is installed
@@ -340,3 +687,6 @@ class ServingApi:
 
     def _get_istio_inference_path(self, deployment_instance):
         return ["v1", "models", deployment_instance.name + ":predict"]
+
+    def _get_istio_v2_inference_path(self, deployment_instance):
+        return ["v2", "models", deployment_instance.name, "infer"]
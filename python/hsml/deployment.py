@@ -27,7 +27,12 @@ from hsml.inference_batcher import InferenceBatcher
 from hsml.transformer import Transformer
 
 from hsml.client.exceptions import ModelServingException
-from hsml.constants import DEPLOYABLE_COMPONENT, PREDICTOR_STATE
+from hsml.constants import (
+    DEPLOYABLE_COMPONENT,
+    DEPLOYMENT,
+    INFERENCE_PROTOCOL,
+    PREDICTOR_STATE,
+)
 
 
 class Deployment:
@@ -56,6 +61,21 @@ class Deployment:
 
         self._serving_api = serving_api.ServingApi()
         self._serving_engine = serving_engine.ServingEngine()
+        # kept when the deployment is updated from a response
+        self._batching_engine = getattr(self, "_batching_engine", None)
+        self._inference_protocol = getattr(
+            self, "_inference_protocol", INFERENCE_PROTOCOL.V1
+        )
+        self._grpc_client = getattr(self, "_grpc_client", None)
+        self._hedging_engine = getattr(self, "_hedging_engine", None)
+        self._canary_engine = getattr(self, "_canary_engine", None)
+        self._state_ttl = getattr(self, "_state_ttl", DEPLOYMENT.STATE_TTL)
+        # cached state, fetched again after state_ttl seconds or when reset
+        self._state_fetched_at = None
+        self._state_etag = None
+        # prepared inference requests, reset when the deployment is updated
+        self._inference_routes = {}
+        self._model_schema = None  # read on the first v2 inference request
 
     def save(self, await_update: Optional[int] = 60):
         """Persist this deployment including the predictor and metadata to Model Serving.
@@ -101,56 +121,66 @@ class Deployment:
 
         self._serving_engine.delete(self, force)
 
-    def get_state(self) -> PredictorState:
+    def get_state(self, refresh: bool = False) -> PredictorState:
         """Get the current state of the deployment
 
+        The state is fetched at most once every `state_ttl` seconds, and reused in between.
+
+        # Arguments
+            refresh: Whether to fetch the state even if it was fetched recently (default is False)
+
         # Returns
             `PredictorState`. The state of the deployment.
         """
 
-        return self._serving_engine.get_state(self)
+        return self._serving_engine.get_state(self, refresh)
 
-    def is_created(self) -> bool:
+    def is_created(self, refresh: bool = False) -> bool:
         """Check whether the deployment is created.
 
+        # Arguments
+            refresh: Whether to fetch the state even if it was fetched recently (default is False)
+
         # Returns
             `bool`. Whether the deployment is created or not.
         """
 
         return (
-            self._serving_engine.get_state(self).status
+            self._serving_engine.get_state(self, refresh).status
             != PREDICTOR_STATE.STATUS_CREATING
         )
 
-    def is_running(self, or_idle=True, or_updating=True) -> bool:
+    def is_running(self, or_idle=True, or_updating=True, refresh=False) -> bool:
         """Check whether the deployment is ready to handle inference requests
 
         # Arguments
             or_idle: Whether the idle state is considered as running (default is True)
             or_updating: Whether the updating state is considered as running (default is True)
+            refresh: Whether to fetch the state even if it was fetched recently (default is False)
 
         # Returns
             `bool`. Whether the deployment is ready or not.
         """
 
-        status = self._serving_engine.get_state(self).status
+        status = self._serving_engine.get_state(self, refresh).status
         return (
             status == PREDICTOR_STATE.STATUS_RUNNING
             or (or_idle and status == PREDICTOR_STATE.STATUS_IDLE)
             or (or_updating and status == PREDICTOR_STATE.STATUS_UPDATING)
         )
 
-    def is_stopped(self, or_created=True) -> bool:
+    def is_stopped(self, or_created=True, refresh=False) -> bool:
         """Check whether the deployment is stopped
 
         # Arguments
             or_created: Whether the creating and created state is considered as stopped (default is True)
+            refresh: Whether to fetch the state even if it was fetched recently (default is False)
 
         # Returns
             `bool`. Whether the deployment is stopped or not.
         """
 
-        status = self._serving_engine.get_state(self).status
+        status = self._serving_engine.get_state(self, refresh).status
         return status == PREDICTOR_STATE.STATUS_STOPPED or (
             or_created
             and (
@@ -159,10 +189,23 @@ class Deployment:
             )
         )
 
-    def predict(self, data: dict = None, inputs: list = None):
+    def predict(
+        self,
+        data: dict = None,
+        inputs: list = None,
+        binary: bool = False,
+        timeout: Optional[float] = None,
+    ):
         """Send inference requests to the deployment.
            One of data or inputs parameters must be set. If both are set, inputs will be ignored.
 
+        With `binary=True`, inputs are NumPy arrays sent as raw tensor buffers following the
+        KServe v2 binary data extension, instead of JSON lists, and output tensors are decoded
+        into NumPy arrays. Binary requests are only supported by KServe deployments.
+
+        Requests failing with a 502, 503 or 504 error are retried with jittered exponential
+        backoff, up to three times or, if a `timeout` is set, as long as the deadline allows.
+
         !!! example
             ```python
             # login into Hopsworks using hopsworks.login()
@@ -187,16 +230,365 @@ class Deployment:
 
         # Arguments
             data: Payload dictionary for the inference request including the model input(s)
-            inputs: Model inputs used in the inference requests
+            inputs: Model inputs used in the inference requests. With `binary=True`, a NumPy array or a
+                dictionary of input names and NumPy arrays.
+            binary: Whether to send the inputs as binary tensors using the KServe v2 protocol.
+            timeout: Maximum time (seconds) to wait for the prediction, including retries.
+                Defaults to no deadline.
+
+        # Returns
+            `dict`. Inference response. With `binary=True`, the `data` of each output is a NumPy array.
+
+        # Raises
+            `ModelServingException`: If the prediction did not complete within the timeout.
+        """
+
+        return self._serving_engine.predict(self, data, inputs, binary, timeout)
+
+    async def predict_async(
+        self,
+        data: dict = None,
+        inputs: list = None,
+        binary: bool = False,
+        timeout: Optional[float] = None,
+    ):
+        """Send inference requests to the deployment without blocking the event loop.
+           One of data or inputs parameters must be set. If both are set, inputs will be ignored.
+
+        Requests share the connections and authentication of `predict`, and are sent by a
+        dedicated pool of threads, so that many concurrent predictions do not need a thread each.
+        At most 128 predictions are in flight at once, the others wait for their turn without
+        blocking the event loop. The limit can be raised with the `HSML_ASYNC_MAX_WORKERS`
+        environment variable, set before the first prediction, without raising the number of
+        connections kept per host (`HSML_HTTP_POOL_MAXSIZE`).
+
+        !!! example
+            ```python
+            import asyncio
+
+            # retrieve deployment by name
+            my_deployment = ms.get_deployment("my_deployment")
+
+            # make many predictions concurrently
+            async def predict_all(inputs_list):
+                return await asyncio.gather(
+                    *[my_deployment.predict_async(inputs=inputs) for inputs in inputs_list]
+                )
+
+            predictions = asyncio.run(predict_all(inputs_list))
+            ```
+
+        # Arguments
+            data: Payload dictionary for the inference request including the model input(s)
+            inputs: Model inputs used in the inference requests. With `binary=True`, a NumPy array or a
+                dictionary of input names and NumPy arrays.
+            binary: Whether to send the inputs as binary tensors using the KServe v2 protocol.
+            timeout: Maximum time (seconds) to wait for the prediction, including retries.
+                Defaults to no deadline.
+
+        # Returns
+            `dict`. Inference response. With `binary=True`, the `data` of each output is a NumPy array.
+
+        # Raises
+            `ModelServingException`: If the prediction did not complete within the timeout.
+        """
+
+        return await self._serving_engine.predict_async(
+            self, data, inputs, binary, timeout
+        )
+
+    def predict_batch(
+        self,
+        data,
+        batch_size: Optional[int] = 100,
+        concurrency: Optional[int] = 4,
+        max_retries: Optional[int] = 3,
+        as_numpy: Optional[bool] = False,
+    ):
+        """Score a large number of rows through the deployment.
+
+        Rows are read from the data as needed and sent in inference requests of `batch_size`
+        instances, with up to `concurrency` requests in flight. Requests failing with a server
+        or connection error are retried. Predictions are returned in the order of the rows.
+
+        !!! example
+            ```python
+            # stream the predictions of a large DataFrame
+            for prediction in my_deployment.predict_batch(df, batch_size=500, concurrency=8):
+                ...
+
+            # or collect them into a NumPy array
+            predictions = my_deployment.predict_batch(df, as_numpy=True)
+            ```
+
+        # Arguments
+            data: Rows to score, as a pandas DataFrame, a NumPy array or an iterable of instances.
+            batch_size: Number of instances per inference request.
+            concurrency: Number of inference requests sent concurrently.
+            max_retries: Number of retries of a failed inference request.
+            as_numpy: Whether to return the predictions as a NumPy array instead of a generator.
+
+        # Returns
+            `Generator` or `np.ndarray`. Predictions of each row, in order.
+        """
+
+        if batch_size < 1 or concurrency < 1:
+            raise ValueError("batch_size and concurrency must be positive")
+        return self._serving_engine.predict_batch(
+            self, data, batch_size, concurrency, max_retries, as_numpy
+        )
+
+    def enable_client_batching(
+        self, max_batch_size: Optional[int] = 32, max_latency: Optional[int] = 5
+    ):
+        """Combine concurrent predictions into batched inference requests.
+
+        Once enabled, concurrent calls to `predict(inputs=...)` and `predict_async(inputs=...)`
+        are collected into a single inference request of up to `max_batch_size` instances,
+        and each call receives the predictions of its own inputs. Calls using the `data`
+        parameter are sent individually.
+
+        !!! example
+            ```python
+            # batch up to 64 instances, waiting at most 10 milliseconds for a batch to fill
+            my_deployment.enable_client_batching(max_batch_size=64, max_latency=10)
+
+            # concurrent calls share inference requests
+            predictions = my_deployment.predict(inputs=[1, 2, 3])
+            ```
+
+        # Arguments
+            max_batch_size: Maximum number of instances per inference request.
+            max_latency: Maximum time (milliseconds) a prediction waits for the batch to fill.
+        """
+
+        self._serving_engine.enable_client_batching(self, max_batch_size, max_latency)
+
+    def disable_client_batching(self):
+        """Send each prediction in its own inference request. Predictions already waiting for a
+        batch are still sent."""
+
+        self._serving_engine.disable_client_batching(self)
+
+    def enable_request_hedging(
+        self, delay: Optional[float] = None, max_hedges: Optional[int] = 1
+    ):
+        """Send duplicate inference requests when a prediction is slower than usual.
+
+        Once enabled, if no response to a prediction arrived after the hedging delay, the same
+        request is sent again and the first response is returned, cutting tail latency at the
+        cost of extra load on the deployment. By default, the delay is the 95th percentile of the
+        latencies of recent predictions, so that around one in twenty predictions is duplicated.
+        Predictions combined by client-side batching are not hedged.
+
+        !!! example
+            ```python
+            # send a duplicate request for predictions slower than the 95th percentile
+            my_deployment.enable_request_hedging()
+
+            # or after a fixed delay of 50 milliseconds
+            my_deployment.enable_request_hedging(delay=0.05)
+            ```
+
+        # Arguments
+            delay: Time (seconds) to wait before sending a duplicate request. Defaults to the 95th
+                percentile of recent latencies.
+            max_hedges: Maximum number of duplicate requests per prediction.
+        """
+
+        self._serving_engine.enable_request_hedging(self, delay, max_hedges)
+
+    def disable_request_hedging(self):
+        """Send a single inference request per prediction."""
+
+        self._serving_engine.disable_request_hedging(self)
+
+    def start_canary(
+        self,
+        predictor,
+        traffic_percentage: Optional[float] = 10,
+        await_running: Optional[int] = 60,
+    ):
+        """Deploy a new configuration alongside the current one, and send it part of the
+        predictions.
+
+        A canary deployment named after this deployment with a `canary` suffix is created with
+        the given predictor and started. Once it is running, `traffic_percentage` percent of the
+        predictions made with `predict()` and `predict_async()` on this deployment are sent to
+        the canary instead, and the latency and errors of both are recorded. The traffic is
+        split by this client, so only its predictions reach the canary. Use `promote_canary()`
+        or `rollback_canary()` to end the canary, or `run_canary()` to decide automatically.
+
+        !!! example
+            ```python
+            # deploy version 2 of the model next to the current deployment
+            new_predictor = ms.create_predictor(mr.get_model("my_model", version=2))
+            my_deployment.start_canary(new_predictor, traffic_percentage=5)
+
+            # ... serve predictions ...
+            print(my_deployment.get_canary_stats())
+            my_deployment.promote_canary()
+            ```
+
+        # Arguments
+            predictor: Predictor with the new configuration.
+            traffic_percentage: Percentage of the predictions sent to the canary deployment.
+            await_running: Awaiting time (seconds) for the canary deployment to start.
+        # Returns
+            `Deployment`. The canary deployment.
+        # Raises
+            `ModelServingException`: If the canary deployment does not start.
+        """
+
+        canary_deployment = Deployment(predictor=predictor, name=self.name + "canary")
+        return self._serving_engine.start_canary(
+            self, canary_deployment, traffic_percentage, await_running
+        )
+
+    def promote_canary(self, await_update: Optional[int] = 60):
+        """Apply the configuration of the canary deployment to this deployment, and delete the
+        canary deployment.
+
+        # Arguments
+            await_update: Awaiting time (seconds) for the running instances to be updated.
+        """
+
+        self._serving_engine.promote_canary(self, await_update)
+
+    def rollback_canary(self):
+        """Send all predictions to this deployment again, and delete the canary deployment."""
+
+        self._serving_engine.rollback_canary(self)
+
+    def get_canary_stats(self):
+        """Get the statistics of the predictions sent to this deployment and to the canary.
+
+        # Returns
+            `dict`. Number of predictions, number of errors, error rate, and median and 95th
+            percentile latencies (seconds) of recent predictions, for the `baseline` and the
+            `canary` deployments.
+        """
+
+        return self._serving_engine._get_canary(self).get_stats()
+
+    def run_canary(
+        self,
+        predictor,
+        traffic_percentage: Optional[float] = 10,
+        min_predictions: Optional[int] = 100,
+        max_latency_increase: Optional[float] = 0.2,
+        max_error_rate_increase: Optional[float] = 0.01,
+        timeout: Optional[int] = 600,
+        await_running: Optional[int] = 60,
+        await_update: Optional[int] = 60,
+    ):
+        """Roll out a new configuration through a canary deployment, promoting it or rolling it
+        back depending on its latency and errors.
+
+        The canary deployment is started as with `start_canary()`. Once both this deployment
+        and the canary served `min_predictions` predictions, the canary is promoted if its 95th
+        percentile latency is at most `max_latency_increase` times higher and its error rate at
+        most `max_error_rate_increase` higher, and rolled back otherwise. It is also rolled back
+        if not enough predictions are served within the timeout. Predictions must be made
+        concurrently, e.g., by other threads of the serving application, while this method
+        blocks.
+
+        !!! example
+            ```python
+            new_predictor = ms.create_predictor(mr.get_model("my_model", version=2))
+
+            # allow the canary to be up to 10% slower at the 95th percentile
+            report = my_deployment.run_canary(new_predictor, max_latency_increase=0.1)
+            ```
+
+        # Arguments
+            predictor: Predictor with the new configuration.
+            traffic_percentage: Percentage of the predictions sent to the canary deployment.
+            min_predictions: Number of predictions each deployment must serve before deciding.
+            max_latency_increase: Maximum relative increase of the 95th percentile latency.
+            max_error_rate_increase: Maximum increase of the error rate.
+            timeout: Time (seconds) to wait for enough predictions to be served.
+            await_running: Awaiting time (seconds) for the canary deployment to start.
+            await_update: Awaiting time (seconds) for the running instances to be updated
+                on promotion.
+        # Returns
+            `dict`. Whether the canary was promoted and why, and the statistics of the
+            `baseline` and the `canary` deployments.
+        # Raises
+            `ModelServingException`: If the canary deployment does not start.
+        """
+
+        canary_deployment = Deployment(predictor=predictor, name=self.name + "canary")
+        return self._serving_engine.run_canary(
+            self,
+            canary_deployment,
+            traffic_percentage,
+            min_predictions,
+            max_latency_increase,
+            max_error_rate_increase,
+            timeout,
+            await_running,
+            await_update,
+        )
+
+    def enable_grpc(self, port: Optional[int] = None, timeout: Optional[float] = None):
+        """Send predictions using the KServe v2 gRPC protocol.
+
+        Once enabled, calls to `predict(inputs=...)` and `predict_async(inputs=...)` send the
+        inputs as raw tensors over a persistent gRPC channel, multiplexing concurrent requests
+        over a single HTTP/2 connection, and output tensors are returned as NumPy arrays. If the
+        gRPC endpoint is not reachable, predictions fall back to binary tensors over HTTP, as
+        with `binary=True`. Calls using the `data` parameter are always sent over HTTP.
+        Requires the `grpcio` package.
+
+        !!! example
+            ```python
+            my_deployment.enable_grpc()
+
+            predictions = my_deployment.predict(inputs=np.random.rand(8, 4).astype(np.float32))
+            ```
+
+        # Arguments
+            port: Port of the gRPC inference endpoint. Defaults to the port of the cluster inference endpoint.
+            timeout: Maximum time (seconds) to wait for each response. Defaults to no timeout.
+        """
+
+        self._serving_engine.enable_grpc(self, port, timeout)
+
+    def disable_grpc(self):
+        """Send predictions over HTTP."""
+
+        self._serving_engine.disable_grpc(self)
+
+    def get_model_metadata(self):
+        """Get the metadata of the deployed model using the KServe v2 protocol, including the
+        names, datatypes and shapes of its input and output tensors.
 
         # Returns
-            `dict`. Inference response.
+            `dict`. Model metadata.
         """
 
-        return self._serving_engine.predict(self, data, inputs)
+        return self._serving_engine.get_model_metadata(self)
+
+    def is_model_ready(self) -> bool:
+        """Check whether the deployed model is ready to serve inference requests, using the
+        KServe v2 protocol.
+
+        # Returns
+            `bool`. Whether the model is ready.
+        """
+
+        return self._serving_engine.is_model_ready(self)
 
     def download_artifact(self):
-        """Download the model artifact served by the deployment"""
+        """Download the model artifact served by the deployment
+
+        If the local cache is enabled, downloaded artifacts are kept in the same local cache
+        as the model files downloaded with `model.download()`, and should not be modified.
+
+        # Returns
+            `str`: Absolute path to the local folder containing the model artifact.
+        """
 
         return self._serving_engine.download_artifact(self)
 
@@ -288,6 +680,7 @@ class Deployment:
     @name.setter
     def name(self, name: str):
         self._predictor.name = name
+        self._inference_routes.clear()
 
     @property
     def description(self):
@@ -372,6 +765,7 @@ class Deployment:
     @serving_tool.setter
     def serving_tool(self, serving_tool: str):
         self._predictor.serving_tool = serving_tool
+        self._inference_routes.clear()
 
     @property
     def script_file(self):
@@ -418,6 +812,39 @@ class Deployment:
     def transformer(self, transformer: Transformer):
         self._predictor.transformer = transformer
 
+    @property
+    def inference_protocol(self):
+        """Inference protocol used to send inference requests, `V1` (default) or `V2`.
+
+        With the KServe v2 protocol, inputs are sent as typed tensors named after the input
+        tensor schema of the model, and outputs are returned as tensors. It only applies to
+        KServe deployments and is a client-side setting not saved with the deployment.
+        """
+        return self._inference_protocol
+
+    @inference_protocol.setter
+    def inference_protocol(self, inference_protocol: str):
+        if inference_protocol not in (INFERENCE_PROTOCOL.V1, INFERENCE_PROTOCOL.V2):
+            raise ValueError(
+                "Inference protocol '{}' is not valid. Possible values are '{}' and '{}'".format(
+                    inference_protocol, INFERENCE_PROTOCOL.V1, INFERENCE_PROTOCOL.V2
+                )
+            )
+        self._inference_protocol = inference_protocol
+
+    @property
+    def state_ttl(self):
+        """Time (seconds) a fetched state of the deployment is reused by `get_state()`,
+        `is_running()` and similar methods before fetching it again. 0 disables the cache.
+        It is a client-side setting not saved with the deployment."""
+        return self._state_ttl
+
+    @state_ttl.setter
+    def state_ttl(self, state_ttl: float):
+        if state_ttl < 0:
+            raise ValueError("State TTL cannot be negative")
+        self._state_ttl = state_ttl
+
     @property
     def created_at(self):
         """Created at date of the predictor."""
@@ -0,0 +1,124 @@
+#
+#   Copyright 2022 Logical Clocks AB
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+from typing import List, Optional
+
+from hsml.constants import DEPLOYMENT_STATE_CHANGE
+from hsml.predictor_state import PredictorState
+
+
+class DeploymentStateChange:
+    """Change in the state of a deployment, observed by `ModelServing.watch()`."""
+
+    def __init__(
+        self,
+        type: str,
+        deployment,
+        state: Optional[PredictorState],
+        previous_state: Optional[PredictorState],
+        changes: List[str],
+    ):
+        self._type = type
+        self._deployment = deployment
+        self._state = state
+        self._previous_state = previous_state
+        self._changes = changes
+
+    @classmethod
+    def from_states(cls, deployment, state, previous_state):
+        """Get the change between two states of a deployment.
+
+        :param deployment: deployment, as last seen
+        :type deployment: Deployment
+        :param state: current state, None if the deployment was deleted
+        :type state: PredictorState
+        :param previous_state: previous state, None if the deployment was added
+        :type previous_state: PredictorState
+        :return: change, or None if the states do not differ
+        :rtype: DeploymentStateChange
+        """
+        if previous_state is None:
+            return DeploymentStateChange(
+                DEPLOYMENT_STATE_CHANGE.TYPE_ADDED, deployment, state, None, []
+            )
+        if state is None:
+            return DeploymentStateChange(
+                DEPLOYMENT_STATE_CHANGE.TYPE_DELETED,
+                deployment,
+                None,
+                previous_state,
+                [],
+            )
+
+        changes = []
+        if state.status != previous_state.status:
+            changes.append(DEPLOYMENT_STATE_CHANGE.FIELD_STATUS)
+        if _get_condition_type(state) != _get_condition_type(previous_state):
+            changes.append(DEPLOYMENT_STATE_CHANGE.FIELD_CONDITION)
+        if (
+            state.available_predictor_instances
+            != previous_state.available_predictor_instances
+            or state.available_transformer_instances
+            != previous_state.available_transformer_instances
+        ):
+            changes.append(DEPLOYMENT_STATE_CHANGE.FIELD_AVAILABLE_INSTANCES)
+        if len(changes) == 0:
+            return None
+        return DeploymentStateChange(
+            DEPLOYMENT_STATE_CHANGE.TYPE_MODIFIED,
+            deployment,
+            state,
+            previous_state,
+            changes,
+        )
+
+    @property
+    def type(self):
+        """Type of change, `ADDED`, `MODIFIED` or `DELETED`."""
+        return self._type
+
+    @property
+    def deployment(self):
+        """Deployment whose state changed, as last seen."""
+        return self._deployment
+
+    @property
+    def deployment_name(self):
+        """Name of the deployment whose state changed."""
+        return self._deployment.name
+
+    @property
+    def state(self):
+        """Current state of the deployment, None if it was deleted."""
+        return self._state
+
+    @property
+    def previous_state(self):
+        """Previous state of the deployment, None if it was added."""
+        return self._previous_state
+
+    @property
+    def changes(self):
+        """Fields of the state that changed, among `status`, `condition` and
+        `available_instances`. Empty unless the type of change is `MODIFIED`."""
+        return self._changes
+
+    def __repr__(self):
+        state = self._state if self._state is not None else self._previous_state
+        return f"DeploymentStateChange(type: {self._type.capitalize()!r}, deployment: {self.deployment_name!r}, status: {state.status!r})"
+
+
+def _get_condition_type(state):
+    return state.condition.type if state.condition is not None else None
@@ -0,0 +1,439 @@
+#
+#   Copyright 2022 Logical Clocks AB
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+import bisect
+import collections
+import os
+import struct
+import tarfile
+import threading
+import zlib
+
+from concurrent.futures import ThreadPoolExecutor
+
+from hsml import util
+from hsml.constants import ARCHIVE_CODEC
+
+
+class ArchiveStream:
+    """Readable stream of an archive generated on the fly by a background thread.
+
+    The archive is written into a pipe while it is being read, so that no intermediate file
+    is written to disk and the archive creation overlaps with the consumer (e.g., an upload).
+    """
+
+    def __init__(self, name, size, write_fn):
+        self._name = name
+        self._size = size
+        self._write_fn = write_fn
+        self._error = None
+        self._bytes_read = 0
+
+        read_fd, write_fd = os.pipe()
+        self._reader = os.fdopen(read_fd, "rb")
+        self._writer = os.fdopen(write_fd, "wb")
+        self._thread = threading.Thread(target=self._write, daemon=True)
+        self._thread.start()
+
+    def _write(self):
+        try:
+            self._write_fn(self._writer)
+        except BaseException as e:
+            self._error = e
+        finally:
+            try:
+                self._writer.close()
+            except OSError:
+                pass  # reader closed before the archive was complete
+
+    def read(self, size=-1):
+        data = self._reader.read(size)
+        self._bytes_read += len(data)
+        if size < 0 or len(data) < size:  # end of stream
+            self._thread.join()
+            if self._error is not None:
+                raise self._error
+            if self._bytes_read != self._size:
+                raise IOError(
+                    "Archive {} has {} bytes, but {} bytes were expected. Were the files modified while archiving?".format(
+                        self._name, self._bytes_read, self._size
+                    )
+                )
+        return data
+
+    def close(self):
+        self._reader.close()  # unblocks the writer if the stream is not fully read
+        self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def name(self):
+        """File name of the archive."""
+        return self._name
+
+    @property
+    def size(self):
+        """Size of the archive in bytes."""
+        return self._size
+
+
+class _StoreCodec:
+    """Plain tar archive, without compression."""
+
+    extension = ".tar"
+
+    def writer(self, fileobj, members):
+        return fileobj
+
+
+class _GzipCodec:
+    """Gzip-compressed tar archive, compressed in parallel by blocks.
+
+    The tar stream is split into fixed-size blocks that are deflated concurrently, priming each
+    block with the tail of the previous one as dictionary, and concatenated into a single gzip
+    member (as done by pigz). Blocks mostly made of incompressible files are stored without
+    compression.
+    """
+
+    extension = ".tar.gz"
+
+    BLOCK_SIZE = 1048576
+    COMPRESSION_LEVEL = 6
+
+    def writer(self, fileobj, members):
+        return _ParallelGzipWriter(
+            fileobj,
+            self.BLOCK_SIZE,
+            self.COMPRESSION_LEVEL,
+            _get_incompressible_ranges(members),
+        )
+
+
+class ArchiveEngine:
+    TAR_FORMAT = tarfile.PAX_FORMAT
+
+    CODECS = {
+        ARCHIVE_CODEC.NONE: _StoreCodec(),
+        ARCHIVE_CODEC.GZIP: _GzipCodec(),
+    }
+
+    # archives mostly made of incompressible files are not compressed in auto mode
+    AUTO_MIN_COMPRESSIBLE_RATIO = 0.2
+
+    # archives with more data than this are not compressed in auto mode, since their size is
+    # only known by compressing them once before streaming
+    AUTO_MAX_COMPRESSED_SIZE = 268435456
+
+    def stream(
+        self, path_to_archive, archive_name, codec=ARCHIVE_CODEC.AUTO, exclude=None
+    ):
+        """Stream a tar archive of a file or directory without writing it to disk.
+
+        The archive size is computed before streaming, so the consumer knows it beforehand. For
+        uncompressed archives, it is fully determined by the headers and sizes of the members.
+        Compressed archives are compressed twice, once into a null sink to compute the size and
+        once while streaming, in exchange for not writing the archive to local disk. The auto
+        codec therefore only compresses archives of up to `AUTO_MAX_COMPRESSED_SIZE` bytes.
+
+        :param path_to_archive: local path of the file or directory to archive
+        :type path_to_archive: str
+        :param archive_name: name of the archive without extension
+        :type archive_name: str
+        :param codec: compression codec, one of `AUTO`, `NONE` or `GZIP`
+        :type codec: str
+        :param exclude: paths of files to leave out, relative to the archived directory
+        :type exclude: Set[str]
+        :return: readable stream of the archive
+        :rtype: ArchiveStream
+        """
+        members = self._get_members(path_to_archive, exclude or set())
+        codec = self._get_codec(codec, members)
+
+        def write_archive(fileobj):
+            writer = codec.writer(fileobj, members)
+            with tarfile.open(fileobj=writer, mode="w|", format=self.TAR_FORMAT) as tar:
+                for member in members:
+                    if member.tarinfo.isreg():
+                        with open(member.path, "rb") as f:
+                            tar.addfile(member.tarinfo, f)
+                    else:
+                        tar.addfile(member.tarinfo)
+            if writer is not fileobj:
+                writer.close()
+
+        if isinstance(codec, _StoreCodec):
+            size = self._get_archive_size(members)
+        else:
+            # compression is deterministic, so the streamed archive has the same size
+            sink = _NullWriter()
+            write_archive(sink)
+            size = sink.size
+
+        return ArchiveStream(archive_name + codec.extension, size, write_archive)
+
+    def _get_codec(self, codec, members):
+        codec = codec.upper() if codec is not None else ARCHIVE_CODEC.AUTO
+        if codec == ARCHIVE_CODEC.AUTO:
+            total_size = sum(m.tarinfo.size for m in members if m.tarinfo.isreg())
+            compressible_size = sum(
+                m.tarinfo.size for m in members if m.tarinfo.isreg() and m.compressible
+            )
+            codec = (
+                ARCHIVE_CODEC.GZIP
+                if total_size == 0
+                or (
+                    total_size <= self.AUTO_MAX_COMPRESSED_SIZE
+                    and compressible_size / total_size
+                    >= self.AUTO_MIN_COMPRESSIBLE_RATIO
+                )
+                else ARCHIVE_CODEC.NONE
+            )
+        if codec not in self.CODECS:
+            raise ValueError(
+                "Archive codec '{}' is not valid. Possible values are '{}'".format(
+                    codec, ", ".join(util.get_members(ARCHIVE_CODEC))
+                )
+            )
+        return self.CODECS[codec]
+
+    def _get_members(self, path_to_archive, exclude):
+        """Get the tar headers of the archive members, in the same order used by `tarfile.add`."""
+        members = []
+        offset = 0
+        # tar headers are built by a tar file opened on a dummy stream, which also keeps track
+        # of hard links between members
+        with tarfile.open(
+            fileobj=_NullWriter(), mode="w|", format=self.TAR_FORMAT
+        ) as tar:
+
+            def add(path, arcname):
+                nonlocal offset
+                if not os.path.isdir(path) and _get_relative_path(arcname) in exclude:
+                    # skipped before the tar file sees it, so that hard links to the same
+                    # file are archived as regular files instead of dangling links
+                    return
+                tarinfo = tar.gettarinfo(path, arcname)
+                if tarinfo is None:
+                    return  # unsupported file type (e.g., sockets)
+                offset += len(tarinfo.tobuf(tar.format, tar.encoding, tar.errors))
+                member = _Member(tarinfo, path, offset)
+                members.append(member)
+                if tarinfo.isreg():
+                    offset += _pad_to_block(tarinfo.size)
+                if tarinfo.isdir():
+                    for f in sorted(os.listdir(path)):
+                        add(os.path.join(path, f), os.path.join(arcname, f))
+
+            if os.path.isdir(path_to_archive):
+                add(path_to_archive, os.curdir)
+            else:
+                add(path_to_archive, os.path.basename(path_to_archive))
+        return members
+
+    def _get_archive_size(self, members):
+        size = 0
+        if len(members) > 0:
+            last = members[-1]
+            size = last.offset
+            if last.tarinfo.isreg():
+                size += _pad_to_block(last.tarinfo.size)
+        size += tarfile.BLOCKSIZE * 2  # end-of-archive marker
+        _, remainder = divmod(size, tarfile.RECORDSIZE)
+        if remainder > 0:
+            size += tarfile.RECORDSIZE - remainder
+        return size
+
+
+class _Member:
+    # file extensions of formats that are already compressed or barely compressible
+    INCOMPRESSIBLE_EXTENSIONS = {
+        ".safetensors",
+        ".pt",
+        ".pth",
+        ".bin",
+        ".ckpt",
+        ".h5",
+        ".hdf5",
+        ".keras",
+        ".onnx",
+        ".npz",
+        ".zip",
+        ".gz",
+        ".tgz",
+        ".bz2",
+        ".xz",
+        ".zst",
+        ".lz4",
+        ".7z",
+        ".jpg",
+        ".jpeg",
+        ".png",
+        ".gif",
+        ".mp3",
+        ".mp4",
+    }
+
+    SAMPLE_SIZE = 65536
+    MIN_SAMPLED_SIZE = 4 * SAMPLE_SIZE
+    MAX_COMPRESSED_RATIO = 0.9
+
+    def __init__(self, tarinfo, path, offset):
+        self.tarinfo = tarinfo
+        self.path = path
+        self.offset = offset  # offset of the member data in the tar stream
+        self.compressible = tarinfo.isreg() and self._is_compressible()
+
+    def _is_compressible(self):
+        _, extension = os.path.splitext(self.path)
+        if extension.lower() in self.INCOMPRESSIBLE_EXTENSIONS:
+            return False
+        if self.tarinfo.size < self.MIN_SAMPLED_SIZE:
+            return True  # not worth sampling
+
+        # compress samples from the beginning, the middle and the end of the file
+        raw_size = compressed_size = 0
+        with open(self.path, "rb") as f:
+            for position in (0, 0.5, 1):
+                f.seek(int((self.tarinfo.size - self.SAMPLE_SIZE) * position))
+                sample = f.read(self.SAMPLE_SIZE)
+                raw_size += len(sample)
+                compressed_size += len(zlib.compress(sample, 1))
+        return compressed_size / raw_size < self.MAX_COMPRESSED_RATIO
+
+
+class _ParallelGzipWriter:
+    DICTIONARY_SIZE = 32768
+    GZIP_HEADER = (
+        b"\x1f\x8b"  # magic number
+        b"\x08"  # deflate
+        b"\x00"  # no flags
+        b"\x00\x00\x00\x00"  # no timestamp, so that archives are reproducible
+        b"\x00"  # no extra flags
+        b"\xff"  # unknown OS
+    )
+
+    def __init__(self, fileobj, block_size, level, incompressible_ranges):
+        self._fileobj = fileobj
+        self._block_size = block_size
+        self._level = level
+        self._incompressible_ranges = incompressible_ranges
+        self._buffer = bytearray()
+        self._offset = 0  # offset of the buffered data in the uncompressed stream
+        self._dictionary = b""
+        self._crc = 0
+        self._size = 0
+
+        self._executor = ThreadPoolExecutor(max_workers=os.cpu_count() or 1)
+        self._pending = collections.deque()
+        self._max_pending = 2 * (os.cpu_count() or 1)
+
+        self._fileobj.write(self.GZIP_HEADER)
+
+    def write(self, data):
+        self._buffer += data
+        while len(self._buffer) >= self._block_size:
+            block = bytes(self._buffer[: self._block_size])
+            del self._buffer[: self._block_size]
+            self._submit(block, last=False)
+        return len(data)
+
+    def close(self):
+        self._submit(bytes(self._buffer), last=True)
+        self._buffer = bytearray()
+        while len(self._pending) > 0:
+            self._fileobj.write(self._pending.popleft().result())
+        self._executor.shutdown()
+        self._fileobj.write(
+            struct.pack("<II", self._crc & 0xFFFFFFFF, self._size & 0xFFFFFFFF)
+        )
+
+    def _submit(self, block, last):
+        level = self._get_block_level(self._offset, len(block))
+        self._pending.append(
+            self._executor.submit(self._compress, block, self._dictionary, level, last)
+        )
+        self._crc = zlib.crc32(block, self._crc)
+        self._size += len(block)
+        self._offset += len(block)
+        self._dictionary = block[-self.DICTIONARY_SIZE :]
+
+        # write compressed blocks in order, bounding the blocks held in memory
+        while len(self._pending) > 0 and (
+            self._pending[0].done() or len(self._pending) >= self._max_pending
+        ):
+            self._fileobj.write(self._pending.popleft().result())
+
+    def _get_block_level(self, offset, length):
+        if length == 0:
+            return self._level
+        incompressible = 0
+        end = offset + length
+        i = max(bisect.bisect_right(self._incompressible_ranges, (offset,)) - 1, 0)
+        while i < len(self._incompressible_ranges):
+            start, stop = self._incompressible_ranges[i]
+            if start >= end:
+                break
+            incompressible += max(0, min(stop, end) - max(start, offset))
+            i += 1
+        return 0 if incompressible * 2 > length else self._level
+
+    @staticmethod
+    def _compress(block, dictionary, level, last):
+        if len(dictionary) > 0:
+            compressor = zlib.compressobj(
+                level, zlib.DEFLATED, -zlib.MAX_WBITS, zdict=dictionary
+            )
+        else:
+            compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+        # sync-flushed blocks end on a byte boundary and can be concatenated
+        return compressor.compress(block) + compressor.flush(
+            zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH
+        )
+
+
+def _get_incompressible_ranges(members):
+    return [
+        (m.offset, m.offset + m.tarinfo.size)
+        for m in members
+        if m.tarinfo.isreg() and not m.compressible
+    ]
+
+
+def _get_relative_path(arcname):
+    """Get the path of an archive member relative to the archived directory, using `/` as separator."""
+    return os.path.normpath(arcname).replace(os.sep, "/")
+
+
+def _pad_to_block(size):
+    blocks, remainder = divmod(size, tarfile.BLOCKSIZE)
+    return (blocks + (1 if remainder > 0 else 0)) * tarfile.BLOCKSIZE
+
+
+class _NullWriter:
+    def __init__(self):
+        self.size = 0
+
+    def write(self, data):
+        self.size += len(data)
+        return len(data)
+
+    def close(self):
+        pass
@@ -0,0 +1,159 @@
+#
+#   Copyright 2022 Logical Clocks AB
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+import queue
+import threading
+import time
+
+from concurrent.futures import Future
+
+from hsml.client import transport
+from hsml.client.exceptions import ModelServingException
+
+
+class BatchingEngine:
+    """Client-side batcher combining concurrent inference requests into a single request.
+
+    Instances submitted by concurrent callers are collected by a background thread until the
+    batch reaches `max_batch_size` instances or the first instance waited for `max_latency`
+    milliseconds. Each batch is sent as a single `{"instances": [...]}` payload, and the
+    predictions in the response are split back to the callers, in order.
+
+    :param send_fn: function sending an inference payload and returning the response
+    :type send_fn: Callable[[dict], dict]
+    :param max_batch_size: maximum number of instances per batch
+    :type max_batch_size: int
+    :param max_latency: maximum milliseconds an instance waits for the batch to fill
+    :type max_latency: int
+    """
+
+    DEFAULT_MAX_BATCH_SIZE = 32
+    DEFAULT_MAX_LATENCY = 5  # milliseconds
+
+    def __init__(self, send_fn, max_batch_size=None, max_latency=None):
+        self._send_fn = send_fn
+        self._max_batch_size = (
+            max_batch_size
+            if max_batch_size is not None
+            else self.DEFAULT_MAX_BATCH_SIZE
+        )
+        self._max_latency = (
+            max_latency if max_latency is not None else self.DEFAULT_MAX_LATENCY
+        )
+        if self._max_batch_size < 1 or self._max_latency < 0:
+            raise ValueError(
+                "Client batching requires a positive max_batch_size and a non-negative max_latency"
+            )
+
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._closed = False
+
+    def submit(self, instances):
+        """Add instances to the next batch.
+
+        :param instances: list of instances of an inference request
+        :type instances: list
+        :return: future of the inference response containing the predictions of the instances
+        :rtype: concurrent.futures.Future
+        """
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise ModelServingException("Client batching has been disabled")
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="hsml-batching", daemon=True
+                )
+                self._thread.start()
+            self._queue.put((instances, future))
+        return future
+
+    def close(self):
+        """Stop batching. Instances already submitted are still sent."""
+        with self._lock:
+            self._closed = True
+            if self._thread is not None:
+                self._queue.put(None)
+
+    def _run(self):
+        carry = None
+        while True:
+            item = carry if carry is not None else self._queue.get()
+            carry = None
+            if item is None:
+                return
+
+            batch = [item]
+            batch_size = len(item[0])
+            deadline = time.monotonic() + self._max_latency / 1000
+            while batch_size < self._max_batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is None or batch_size + len(item[0]) > self._max_batch_size:
+                    carry = item  # starts the next batch, or stops the batcher
+                    break
+                batch.append(item)
+                batch_size += len(item[0])
+
+            # batches are sent concurrently, sharing the connections of the clients
+            transport.get_executor().submit(self._send_batch, batch)
+
+    def _send_batch(self, batch):
+        batch = [
+            (instances, future)
+            for instances, future in batch
+            if future.set_running_or_notify_cancel()
+        ]
+        if len(batch) == 0:
+            return
+
+        try:
+            response = self._send_fn(
+                {"instances": [i for instances, _ in batch for i in instances]}
+            )
+            results = self._split_response(response, [len(i) for i, _ in batch])
+        except BaseException as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+    def _split_response(self, response, sizes):
+        predictions = (
+            response.get("predictions") if isinstance(response, dict) else None
+        )
+        if not isinstance(predictions, list) or len(predictions) != sum(sizes):
+            raise ModelServingException(
+                "The response of a batched inference request does not contain one prediction per instance"
+            )
+
+        results = []
+        offset = 0
+        for size in sizes:
+            result = dict(response)
+            result["predictions"] = predictions[offset : offset + size]
+            results.append(result)
+            offset += size
+        return results
@@ -0,0 +1,356 @@
+#
+#   Copyright 2022 Logical Clocks AB
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+import warnings
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+
+
+class CacheEngine:
+    """Persistent local cache of downloaded model files and artifacts.
+
+    Cache entries are identified by a key (e.g., model registry, name and version) and a digest
+    of the remote content, so that entries are not reused if the remote files change. The
+    cache size is bounded, evicting the least recently used entries first, and entries can be
+    safely created and read by multiple processes concurrently. Entries returned to a process
+    are not evicted by other processes while it is running, but the process evicts its own
+    least recently used entries when the cache exceeds its maximum size, so that long-running
+    processes do not grow the cache without bound.
+
+    The cache is disabled unless its location is set with the `HSML_CACHE_DIR` environment
+    variable. Its maximum size (in bytes) can be set with the `HSML_CACHE_MAX_SIZE` environment
+    variable, where a maximum size of 0 disables the cache.
+    """
+
+    CACHE_DIR = "HSML_CACHE_DIR"
+    CACHE_MAX_SIZE = "HSML_CACHE_MAX_SIZE"
+
+    DEFAULT_CACHE_MAX_SIZE = 10737418240  # 10 GiB
+
+    ENTRY_METADATA_FILE = "entry.json"
+    ENTRY_DATA_DIR = "data"
+    ENTRY_LOCK_SUFFIX = (
+        ".lock"  # held while an entry is validated, populated or evicted
+    )
+    ENTRY_IN_USE_SUFFIX = ".use"  # held shared by the processes using an entry
+    TMP_PREFIX = ".tmp-"
+
+    def __init__(self):
+        self._cache_dir = os.environ.get(self.CACHE_DIR)
+        self._max_size = int(
+            os.environ.get(self.CACHE_MAX_SIZE, self.DEFAULT_CACHE_MAX_SIZE)
+        )
+
+    @property
+    def enabled(self):
+        """Whether the cache is enabled."""
+        return bool(self._cache_dir) and self._max_size > 0
+
+    def get_digest(self, entries):
+        """Compute the digest of remote content from its dataset entries.
+
+        :param entries: dataset entry attributes of the remote files
+        :type entries: List[dict]
+        :return: hex digest of the path, size and modification time of the entries
+        :rtype: str
+        """
+        digest = hashlib.sha256()
+        for entry in sorted(entries, key=lambda e: e["path"]):
+            digest.update(
+                "{}\0{}\0{}\n".format(
+                    entry["path"], entry.get("size"), entry.get("modificationTime")
+                ).encode("utf-8")
+            )
+        return digest.hexdigest()
+
+    def get(self, key, digest, relative_path, populate_fn):
+        """Get the local path of a cache entry, populating the entry if it is missing.
+
+        The entry is validated against the size of its content recorded when it was populated,
+        and populated again if it does not match. It is then marked as in use until the
+        process exits or evicts it, so that other processes do not evict it.
+
+        :param key: parts identifying the cached content, e.g., `["model", registry_id, name, version]`
+        :type key: list
+        :param digest: digest of the remote content
+        :type digest: str
+        :param relative_path: path of the content relative to the entry data directory
+        :type relative_path: str
+        :param populate_fn: function writing the content into a given directory, as
+            `populate_fn(data_dir)`
+        :type populate_fn: Callable[[str], None]
+        :return: local path of the cached content
+        :rtype: str
+        """
+        entry_id = hashlib.sha256(
+            json.dumps([str(part) for part in key] + [digest]).encode("utf-8")
+        ).hexdigest()
+        entry_dir = os.path.join(self._cache_dir, entry_id)
+        metadata_path = os.path.join(entry_dir, self.ENTRY_METADATA_FILE)
+        data_dir = os.path.join(entry_dir, self.ENTRY_DATA_DIR)
+
+        os.makedirs(self._cache_dir, exist_ok=True)
+        populated = False
+        with _FileLock(entry_dir + self.ENTRY_LOCK_SUFFIX):
+            if self._is_valid(entry_dir):
+                os.utime(metadata_path)  # mark as recently used
+            else:
+                self._populate(entry_id, key, digest, populate_fn)
+                populated = True
+            _mark_in_use(entry_dir + self.ENTRY_IN_USE_SUFFIX)
+
+        if populated:
+            self._evict(keep=entry_id)
+        return os.path.join(data_dir, relative_path)
+
+    def _is_valid(self, entry_dir):
+        try:
+            with open(os.path.join(entry_dir, self.ENTRY_METADATA_FILE), "r") as f:
+                size = json.load(f)["size"]
+        except (OSError, ValueError, KeyError):
+            return False
+        data_dir = os.path.join(entry_dir, self.ENTRY_DATA_DIR)
+        return os.path.isdir(data_dir) and self._get_dir_size(data_dir) == size
+
+    def _populate(self, entry_id, key, digest, populate_fn):
+        entry_dir = os.path.join(self._cache_dir, entry_id)
+        data_dir = os.path.join(entry_dir, self.ENTRY_DATA_DIR)
+
+        # populate a temporary directory, so that failed attempts leave no partial entries
+        tmp_data_dir = os.path.join(
+            self._cache_dir, self.TMP_PREFIX + entry_id + "-" + uuid.uuid4().hex
+        )
+        try:
+            os.makedirs(tmp_data_dir)
+            populate_fn(tmp_data_dir)
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            os.makedirs(entry_dir)
+            os.rename(tmp_data_dir, data_dir)
+        finally:
+            shutil.rmtree(tmp_data_dir, ignore_errors=True)
+
+        with open(os.path.join(entry_dir, self.ENTRY_METADATA_FILE), "w") as f:
+            json.dump(
+                {
+                    "key": [str(part) for part in key],
+                    "digest": digest,
+                    "size": self._get_dir_size(data_dir),
+                    "created": time.time(),
+                },
+                f,
+            )
+
+    def _evict(self, keep=None):
+        """Remove least recently used entries until the cache fits in its maximum size, and the
+        files left behind by interrupted processes."""
+        with _FileLock(os.path.join(self._cache_dir, self.ENTRY_LOCK_SUFFIX)):
+            self._remove_stale_tmp_dirs()
+
+            entries = []
+            for name in os.listdir(self._cache_dir):
+                if name.startswith("."):
+                    continue
+                if name.endswith((self.ENTRY_LOCK_SUFFIX, self.ENTRY_IN_USE_SUFFIX)):
+                    entry_id, _ = os.path.splitext(name)
+                    if not os.path.exists(os.path.join(self._cache_dir, entry_id)):
+                        self._remove_lock_file(os.path.join(self._cache_dir, name))
+                    continue
+                metadata_path = os.path.join(
+                    self._cache_dir, name, self.ENTRY_METADATA_FILE
+                )
+                try:
+                    with open(metadata_path, "r") as f:
+                        size = json.load(f)["size"]
+                    last_access = os.path.getmtime(metadata_path)
+                except (OSError, ValueError, KeyError):
+                    continue  # being populated, or not an entry
+                entries.append((last_access, name, size))
+
+            total_size = sum(size for _, _, size in entries)
+            for _, entry_id, size in sorted(entries):
+                if total_size <= self._max_size:
+                    break
+                if entry_id != keep and self._remove_entry(entry_id):
+                    total_size -= size
+
+        if total_size > self._max_size:
+            warnings.warn(
+                "Local cache size of {} bytes exceeds its maximum size of {} bytes, since its "
+                "entries are in use by other processes".format(
+                    total_size, self._max_size
+                ),
+                stacklevel=2,
+            )
+
+    def _remove_entry(self, entry_id):
+        entry_dir = os.path.join(self._cache_dir, entry_id)
+        lock = _FileLock(entry_dir + self.ENTRY_LOCK_SUFFIX, blocking=False)
+        if not lock.acquire():
+            return False  # being validated or populated by another process
+        try:
+            # the entries used by this process can be evicted by itself
+            used_by_this_process = _release_in_use(entry_dir + self.ENTRY_IN_USE_SUFFIX)
+            in_use = _FileLock(entry_dir + self.ENTRY_IN_USE_SUFFIX, blocking=False)
+            if not in_use.acquire():
+                if used_by_this_process:
+                    _mark_in_use(entry_dir + self.ENTRY_IN_USE_SUFFIX)
+                return False  # in use by another running process
+            try:
+                os.remove(os.path.join(entry_dir, self.ENTRY_METADATA_FILE))
+                shutil.rmtree(entry_dir, ignore_errors=True)
+                in_use.remove()
+            finally:
+                in_use.release()
+            lock.remove()
+            return True
+        finally:
+            lock.release()
+
+    def _remove_stale_tmp_dirs(self):
+        for name in os.listdir(self._cache_dir):
+            if not name.startswith(self.TMP_PREFIX):
+                continue
+            entry_id = name[len(self.TMP_PREFIX) :].split("-")[0]
+            lock = _FileLock(
+                os.path.join(self._cache_dir, entry_id + self.ENTRY_LOCK_SUFFIX),
+                blocking=False,
+            )
+            if not lock.acquire():
+                continue  # being populated
+            try:
+                shutil.rmtree(os.path.join(self._cache_dir, name), ignore_errors=True)
+            finally:
+                lock.release()
+
+    def _remove_lock_file(self, path):
+        lock = _FileLock(path, blocking=False)
+        if lock.acquire():
+            try:
+                lock.remove()
+            finally:
+                lock.release()
+
+    def _get_dir_size(self, path):
+        return sum(
+            os.path.getsize(os.path.join(root, f))
+            for root, _, files in os.walk(path)
+            for f in files
+        )
+
+
+# shared locks on the entries used by this process, held until it exits or evicts them
+_entries_in_use = {}
+_entries_in_use_lock = threading.Lock()
+
+
+def _mark_in_use(path):
+    with _entries_in_use_lock:
+        if path not in _entries_in_use:
+            lock = _FileLock(path, shared=True)
+            lock.acquire()
+            _entries_in_use[path] = lock
+
+
+def _release_in_use(path):
+    with _entries_in_use_lock:
+        lock = _entries_in_use.pop(path, None)
+    if lock is None:
+        return False
+    lock.release()
+    return True
+
+
+class _FileLock:
+    """Exclusive or shared lock on a file, across processes.
+
+    Lock files can be removed while locked. A lock acquired on a file that was removed in the
+    meantime is acquired again on the new file. Shared locks are not supported on Windows,
+    where they are not acquired.
+    """
+
+    def __init__(self, path, blocking=True, shared=False):
+        self._path = path
+        self._blocking = blocking
+        self._shared = shared
+        self._file = None
+
+    def acquire(self):
+        while True:
+            self._file = open(self._path, "a+")
+            try:
+                if fcntl is not None:
+                    flags = fcntl.LOCK_SH if self._shared else fcntl.LOCK_EX
+                    if not self._blocking:
+                        flags |= fcntl.LOCK_NB
+                    fcntl.flock(self._file.fileno(), flags)
+                elif msvcrt is not None and not self._shared:
+                    mode = msvcrt.LK_LOCK if self._blocking else msvcrt.LK_NBLCK
+                    self._file.seek(0)
+                    msvcrt.locking(self._file.fileno(), mode, 1)
+            except OSError:
+                self._file.close()
+                self._file = None
+                if self._blocking:
+                    raise
+                return False
+            if self._is_current():
+                return True
+            self.release()  # removed while waiting for the lock
+
+    def _is_current(self):
+        try:
+            return os.stat(self._path).st_ino == os.fstat(self._file.fileno()).st_ino
+        except OSError:
+            return False
+
+    def remove(self):
+        """Remove the lock file, while holding the lock."""
+        try:
+            os.remove(self._path)
+        except OSError:
+            pass  # e.g., open by other processes on Windows
+
+    def release(self):
+        if self._file is not None:
+            if fcntl is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            elif msvcrt is not None and not self._shared:
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
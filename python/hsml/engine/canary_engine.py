@@ -0,0 +1,209 @@
+#
+#   Copyright 2022 Logical Clocks AB
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+import collections
+import random
+import threading
+import time
+
+import numpy as np
+
+
+class CanaryEngine:
+    """Splitter of predictions between a deployment and its canary deployment.
+
+    A share of the predictions of the deployment is sent to the canary deployment instead,
+    and the latency and errors of the predictions sent to each of them are recorded, so that
+    the canary can be promoted if it performs as well as the deployment, or rolled back.
+
+    :param canary_deployment: deployment serving the new configuration
+    :type canary_deployment: Deployment
+    :param traffic_percentage: percentage of predictions sent to the canary deployment
+    :type traffic_percentage: float
+    """
+
+    BASELINE = "baseline"
+    CANARY = "canary"
+
+    LATENCY_QUANTILE = 95
+    LATENCY_WINDOW = 1000  # number of recent latencies kept
+
+    def __init__(self, canary_deployment, traffic_percentage):
+        if not 0 < traffic_percentage < 100:
+            raise ValueError(
+                "Canary traffic percentage must be greater than 0 and lower than 100"
+            )
+        self._canary_deployment = canary_deployment
+        self._traffic_percentage = traffic_percentage
+        self._lock = threading.Lock()
+        self._predictions = {self.BASELINE: 0, self.CANARY: 0}
+        self._errors = {self.BASELINE: 0, self.CANARY: 0}
+        self._latencies = {
+            self.BASELINE: collections.deque(maxlen=self.LATENCY_WINDOW),
+            self.CANARY: collections.deque(maxlen=self.LATENCY_WINDOW),
+        }
+
+    @property
+    def canary_deployment(self):
+        """Deployment serving the new configuration."""
+        return self._canary_deployment
+
+    @property
+    def traffic_percentage(self):
+        """Percentage of predictions sent to the canary deployment."""
+        return self._traffic_percentage
+
+    def send(self, deployment_instance, predict_fn):
+        """Send a prediction to the deployment or to the canary deployment.
+
+        :param deployment_instance: deployment the prediction was made on
+        :type deployment_instance: Deployment
+        :param predict_fn: function sending the prediction to the given deployment
+        :type predict_fn: Callable[[Deployment], dict]
+        :return: inference response
+        :rtype: dict
+        """
+        target = self._select()
+        start = time.monotonic()
+        try:
+            response = predict_fn(
+                self._canary_deployment
+                if target == self.CANARY
+                else deployment_instance
+            )
+        except Exception:
+            self._record(target, None)
+            raise
+        self._record(target, time.monotonic() - start)
+        return response
+
+    async def send_async(self, deployment_instance, predict_coro_fn):
+        """Send a prediction to the deployment or to the canary deployment without blocking the
+        event loop.
+
+        :param deployment_instance: deployment the prediction was made on
+        :type deployment_instance: Deployment
+        :param predict_coro_fn: function returning a coroutine that sends the prediction to the
+            given deployment
+        :type predict_coro_fn: Callable[[Deployment], Coroutine]
+        :return: inference response
+        :rtype: dict
+        """
+        target = self._select()
+        start = time.monotonic()
+        try:
+            response = await predict_coro_fn(
+                self._canary_deployment
+                if target == self.CANARY
+                else deployment_instance
+            )
+        except Exception:
+            self._record(target, None)
+            raise
+        self._record(target, time.monotonic() - start)
+        return response
+
+    def get_stats(self):
+        """Get the statistics of the predictions sent to the deployment and to the canary.
+
+        :return: number of predictions, number of errors, error rate, and median and 95th
+            percentile latencies in seconds of recent predictions, for the `baseline` and the
+            `canary` deployments
+        :rtype: dict
+        """
+        with self._lock:
+            return {
+                target: {
+                    "predictions": self._predictions[target],
+                    "errors": self._errors[target],
+                    "error_rate": (
+                        self._errors[target] / self._predictions[target]
+                        if self._predictions[target] > 0
+                        else None
+                    ),
+                    "latency_p50": _get_percentile(self._latencies[target], 50),
+                    "latency_p95": _get_percentile(
+                        self._latencies[target], self.LATENCY_QUANTILE
+                    ),
+                }
+                for target in (self.BASELINE, self.CANARY)
+            }
+
+    def evaluate(self, min_predictions, max_latency_increase, max_error_rate_increase):
+        """Decide whether to promote the canary, once both deployments served enough predictions.
+
+        :param min_predictions: number of predictions each deployment must serve
+        :type min_predictions: int
+        :param max_latency_increase: maximum relative increase of the 95th percentile latency
+            of the canary over the deployment, e.g., 0.2 for 20%
+        :type max_latency_increase: float
+        :param max_error_rate_increase: maximum increase of the error rate of the canary over
+            the deployment, e.g., 0.01 for one percentage point
+        :type max_error_rate_increase: float
+        :return: whether to promote the canary and why, or None if not enough predictions were
+            served yet
+        :rtype: Tuple[bool, str]
+        """
+        stats = self.get_stats()
+        baseline, canary = stats[self.BASELINE], stats[self.CANARY]
+        min_predictions = max(min_predictions, 1)  # no error rate without predictions
+        if (
+            baseline["predictions"] < min_predictions
+            or canary["predictions"] < min_predictions
+        ):
+            return None
+
+        if canary["error_rate"] > baseline["error_rate"] + max_error_rate_increase:
+            return (
+                False,
+                "Canary error rate {:.2%} exceeds the deployment error rate {:.2%}".format(
+                    canary["error_rate"], baseline["error_rate"]
+                ),
+            )
+        if (
+            canary["latency_p95"] is not None
+            and baseline["latency_p95"] is not None
+            and canary["latency_p95"]
+            > baseline["latency_p95"] * (1 + max_latency_increase)
+        ):
+            return (
+                False,
+                "Canary p95 latency {:.1f} ms exceeds the deployment p95 latency {:.1f} ms".format(
+                    canary["latency_p95"] * 1000, baseline["latency_p95"] * 1000
+                ),
+            )
+        return (True, "Canary latency and error rate are within the limits")
+
+    def _select(self):
+        return (
+            self.CANARY
+            if random.uniform(0, 100) < self._traffic_percentage
+            else self.BASELINE
+        )
+
+    def _record(self, target, latency):
+        with self._lock:
+            self._predictions[target] += 1
+            if latency is None:
+                self._errors[target] += 1
+            else:
+                self._latencies[target].append(latency)
+
+
+def _get_percentile(latencies, quantile):
+    if len(latencies) == 0:
+        return None
+    return float(np.percentile(list(latencies), quantile))
@@ -0,0 +1,178 @@
+#
+#   Copyright 2022 Logical Clocks AB
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+import asyncio
+import collections
+import threading
+import time
+
+from concurrent import futures
+
+import numpy as np
+
+from hsml.client import transport
+
+
+class HedgingEngine:
+    """Sender of hedged inference requests, trading extra load for lower tail latency.
+
+    A request is sent, and if no response arrived after the hedging delay, a duplicate request
+    is sent. The first successful response is returned and the other requests are discarded.
+    Unless fixed, the delay is the 95th percentile of the latencies of recent requests, and no
+    duplicates are sent until enough latencies have been observed.
+
+    :param delay: seconds to wait before sending a duplicate request, or None to use the
+        95th percentile of recent latencies
+    :type delay: float
+    :param max_hedges: maximum number of duplicate requests per request
+    :type max_hedges: int
+    """
+
+    LATENCY_QUANTILE = 95
+    LATENCY_WINDOW = 1000  # number of recent latencies kept
+    MIN_LATENCIES = 20  # number of latencies required to compute the delay
+
+    def __init__(self, delay=None, max_hedges=1):
+        if (delay is not None and delay < 0) or max_hedges < 1:
+            raise ValueError(
+                "Request hedging requires a non-negative delay and a positive max_hedges"
+            )
+        self._delay = delay
+        self._max_hedges = max_hedges
+        self._latencies = collections.deque(maxlen=self.LATENCY_WINDOW)
+        self._lock = threading.Lock()
+
+    def get_delay(self):
+        """Get the seconds to wait before sending a duplicate request.
+
+        :return: hedging delay, or None if not enough latencies were observed yet
+        :rtype: float
+        """
+        if self._delay is not None:
+            return self._delay
+        with self._lock:
+            if len(self._latencies) < self.MIN_LATENCIES:
+                return None
+            latencies = list(self._latencies)
+        return float(np.percentile(latencies, self.LATENCY_QUANTILE))
+
+    def send(self, send_fn, timeout=None):
+        """Send a request, and duplicates of it if it is slower than the hedging delay.
+
+        :param send_fn: function sending the request and returning the response
+        :type send_fn: Callable[[], dict]
+        :param timeout: seconds to wait for a response, or None to wait indefinitely
+        :type timeout: float
+        :raises concurrent.futures.TimeoutError: if no request succeeded within the timeout
+        :return: first successful response
+        :rtype: dict
+        """
+        executor = transport.get_executor()
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        delay = self.get_delay()
+        pending = {executor.submit(self._timed, send_fn)}
+        hedges = 0
+        error = None
+        try:
+            while len(pending) > 0:
+                can_hedge = delay is not None and hedges < self._max_hedges
+                wait = self._get_wait(delay if can_hedge else None, deadline)
+                done, pending = futures.wait(
+                    pending, timeout=wait, return_when=futures.FIRST_COMPLETED
+                )
+                for future in done:
+                    if future.exception() is None:
+                        return self._record(future.result())
+                    error = future.exception()
+                if len(done) > 0 and len(pending) > 0:
+                    continue  # a request failed, wait for the others
+                if len(done) == 0:
+                    if deadline is not None and time.monotonic() >= deadline:
+                        raise futures.TimeoutError()
+                    if can_hedge:
+                        pending.add(executor.submit(self._timed, send_fn))
+                        hedges += 1
+            raise error
+        finally:
+            for future in pending:
+                future.cancel()  # requests already sent are discarded
+
+    async def send_async(self, send_coro_fn, timeout=None):
+        """Send a request without blocking the event loop, and duplicates of it if it is slower
+        than the hedging delay.
+
+        :param send_coro_fn: function returning a coroutine that sends the request
+        :type send_coro_fn: Callable[[], Coroutine]
+        :param timeout: seconds to wait for a response, or None to wait indefinitely
+        :type timeout: float
+        :raises asyncio.TimeoutError: if no request succeeded within the timeout
+        :return: first successful response
+        :rtype: dict
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        delay = self.get_delay()
+        pending = {asyncio.ensure_future(self._timed_async(send_coro_fn))}
+        hedges = 0
+        error = None
+        try:
+            while len(pending) > 0:
+                can_hedge = delay is not None and hedges < self._max_hedges
+                wait = self._get_wait(delay if can_hedge else None, deadline)
+                done, pending = await asyncio.wait(
+                    pending, timeout=wait, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None:
+                        return self._record(task.result())
+                    error = task.exception()
+                if len(done) > 0 and len(pending) > 0:
+                    continue  # a request failed, wait for the others
+                if len(done) == 0:
+                    if deadline is not None and time.monotonic() >= deadline:
+                        raise asyncio.TimeoutError()
+                    if can_hedge:
+                        pending.add(
+                            asyncio.ensure_future(self._timed_async(send_coro_fn))
+                        )
+                        hedges += 1
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def _get_wait(self, delay, deadline):
+        remaining = deadline - time.monotonic() if deadline is not None else None
+        if delay is None:
+            return remaining
+        if remaining is None:
+            return delay
+        return max(min(delay, remaining), 0)
+
+    def _timed(self, send_fn):
+        start = time.monotonic()
+        response = send_fn()
+        return response, time.monotonic() - start
+
+    async def _timed_async(self, send_coro_fn):
+        start = time.monotonic()
+        response = await send_coro_fn()
+        return response, time.monotonic() - start
+
+    def _record(self, result):
+        response, latency = result
+        with self._lock:
+            self._latencies.append(latency)
+        return response
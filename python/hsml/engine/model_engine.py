@@ -14,13 +14,19 @@
 #   limitations under the License.
 #
 
+import hashlib
 import json
 import tempfile
 import uuid
 import time
 import importlib
 import os
+import shutil
+import warnings
 
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from requests.exceptions import RequestException
 from tqdm.auto import tqdm
 
 from hsml.client.exceptions import RestAPIError, ModelRegistryException
@@ -29,13 +35,30 @@ from hsml import client, util, constants
 
 from hsml.core import model_api, dataset_api
 
-from hsml.engine import local_engine, hopsworks_engine
+from hsml.engine import (
+    local_engine,
+    hopsworks_engine,
+    archive_engine,
+    cache_engine,
+)
 
 
 class ModelEngine:
+    SIMULTANEOUS_DOWNLOADS = 8
+    SIMULTANEOUS_COPIES = 8
+    COPY_MAX_RETRIES = 3
+    COPY_RETRY_INTERVAL = 1
+
+    # digests of the model files, stored in each model version saved with deduplication
+    MANIFEST_FILE = ".hsml-manifest.json"
+    MANIFEST_READ_SIZE = 1048576
+    DEDUPLICATION_MAX_VERSIONS = 3
+
     def __init__(self):
         self._model_api = model_api.ModelApi()
         self._dataset_api = dataset_api.DatasetApi()
+        self._archive_engine = archive_engine.ArchiveEngine()
+        self._cache_engine = cache_engine.CacheEngine()
 
         pydoop_spec = importlib.util.find_spec("pydoop")
         if pydoop_spec is None:
@@ -46,21 +69,23 @@ class ModelEngine:
     def _poll_model_available(self, model_instance, await_registration):
         if await_registration > 0:
             model_registry_id = model_instance.model_registry_id
-            sleep_seconds = 5
-            for i in range(int(await_registration / sleep_seconds)):
+
+            def get_model():
                 try:
-                    time.sleep(sleep_seconds)
-                    model_meta = self._model_api.get(
+                    return self._model_api.get(
                         model_instance.name,
                         model_instance.version,
                         model_registry_id,
                         model_instance.shared_registry_project_name,
                     )
-                    if model_meta is not None:
-                        return model_meta
                 except RestAPIError as e:
                     if e.response.status_code != 404:
                         raise e
+                    return None
+
+            model_meta = util.poll(get_model, await_registration)
+            if model_meta is not None:
+                return model_meta
             print(
                 "Model not available during polling, set a higher value for await_registration to wait longer."
             )
@@ -93,38 +118,234 @@ class ModelEngine:
         if existing_model_path.startswith("hdfs:/"):
             projects_index = existing_model_path.find("/Projects", 0)
             existing_model_path = existing_model_path[projects_index:]
-
-        for entry in self._dataset_api.list(existing_model_path, sort_by="NAME:desc")[
-            "items"
-        ]:
-            path = entry["attributes"]["path"]
-            _, file_name = os.path.split(path)
-            self._dataset_api.copy(path, model_version_path + "/" + file_name)
+        existing_model_path = existing_model_path.rstrip("/")
+
+        copies = []
+        for entry in self._dataset_api.walk(existing_model_path):
+            destination_path = (
+                model_version_path
+                + "/"
+                + self._get_relative_path(entry["path"], existing_model_path)
+            )
+            if entry.get("dir", False):
+                # directories are walked before their content
+                self._dataset_api.mkdir(destination_path)
+            else:
+                copies.append((entry["path"], destination_path))
+        self._copy_files(copies)
 
     def _upload_local_model(
-        self, local_model_path, model_version, dataset_model_name_path
+        self,
+        local_model_path,
+        model_version,
+        dataset_model_name_path,
+        upload_configuration=None,
     ):
-        archive_out_dir = None
+        upload_configuration = dict(upload_configuration or {})
+        codec = upload_configuration.pop("codec", constants.ARCHIVE_CODEC.AUTO)
+        deduplicate = upload_configuration.pop("deduplicate", False)
+        model_version_path = dataset_model_name_path + "/" + str(model_version)
+
+        manifest = None
+        reused_files = {}
+        if deduplicate:
+            manifest = self._get_local_manifest(local_model_path)
+            reused_files = self._get_reusable_files(
+                manifest, model_version, dataset_model_name_path
+            )
+
         uploaded_archive_path = None
         try:
-            archive_out_dir = tempfile.TemporaryDirectory(dir=os.getcwd())
-            archive_path = util.compress(
-                archive_out_dir.name, str(model_version), local_model_path
-            )
-            uploaded_archive_path = (
-                dataset_model_name_path + "/" + os.path.basename(archive_path)
-            )
-            self._dataset_api.upload(archive_path, dataset_model_name_path)
+            # the archive is generated while it is uploaded, without writing it to local disk
+            with self._archive_engine.stream(
+                local_model_path,
+                str(model_version),
+                codec,
+                exclude=set(reused_files) | {self.MANIFEST_FILE},
+            ) as archive:
+                self._dataset_api.upload_stream(
+                    archive,
+                    archive.name,
+                    archive.size,
+                    dataset_model_name_path,
+                    **upload_configuration
+                )
+                # the archive only exists once the server assembled all its chunks, the chunks
+                # of an interrupted upload are kept to resume it
+                uploaded_archive_path = dataset_model_name_path + "/" + archive.name
             self._dataset_api.unzip(uploaded_archive_path, block=True, timeout=600)
-        except RestAPIError:
-            raise
         finally:
-            if archive_out_dir is not None:
-                archive_out_dir.cleanup()
+            if uploaded_archive_path is not None:
+                self._remove_uploaded_archive(uploaded_archive_path)
+
+        # unchanged files are copied from previous versions, the archive already created
+        # their parent directories
+        self._copy_files(
+            [
+                (source_path, model_version_path + "/" + relative_path)
+                for relative_path, source_path in reused_files.items()
+            ]
+        )
+        if manifest is not None:
+            self._upload_manifest(manifest, model_version_path)
+
+    def _remove_uploaded_archive(self, uploaded_archive_path):
+        # failing to clean up the archive must not hide the outcome of the upload
+        try:
             self._dataset_api.rm(uploaded_archive_path)
+        except (RestAPIError, RequestException) as e:
+            warnings.warn(
+                "Could not remove the uploaded model archive {}: {}".format(
+                    uploaded_archive_path, e
+                ),
+                stacklevel=2,
+            )
+
+    def _get_local_manifest(self, local_model_path):
+        """Compute the size and sha256 digest of the local model files.
+
+        :param local_model_path: local path of the model file or directory
+        :type local_model_path: str
+        :return: manifest mapping file paths, relative to the model directory, to their
+            size and digest
+        :rtype: dict
+        """
+        if os.path.isdir(local_model_path):
+            local_files = {}
+            for root, _, files in os.walk(local_model_path):
+                for f in files:
+                    path = os.path.join(root, f)
+                    relative_path = os.path.relpath(path, local_model_path)
+                    local_files[relative_path.replace(os.sep, "/")] = path
+        else:
+            local_files = {os.path.basename(local_model_path): local_model_path}
+        local_files.pop(self.MANIFEST_FILE, None)
+
+        def get_digest(path):
+            digest = hashlib.sha256()
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(self.MANIFEST_READ_SIZE), b""):
+                    digest.update(block)
+            return digest.hexdigest()
+
+        # hashlib releases the GIL on large buffers, files are hashed concurrently
+        with ThreadPoolExecutor() as executor:
+            digests = {
+                relative_path: executor.submit(get_digest, path)
+                for relative_path, path in local_files.items()
+                # symbolic links are archived as links, not deduplicated
+                if not os.path.islink(path) and os.path.isfile(path)
+            }
+            return {
+                "files": {
+                    relative_path: {
+                        "size": os.path.getsize(local_files[relative_path]),
+                        "sha256": digest.result(),
+                    }
+                    for relative_path, digest in digests.items()
+                }
+            }
+
+    def _get_reusable_files(self, manifest, model_version, dataset_model_name_path):
+        """Find the model files already present in the latest previous versions of the model.
+
+        :param manifest: manifest of the local model files
+        :type manifest: dict
+        :param model_version: version of the model being saved
+        :type model_version: int
+        :param dataset_model_name_path: path of the model folder in datasets
+        :type dataset_model_name_path: str
+        :return: mapping of relative paths of local files to paths of identical remote files
+        :rtype: dict
+        """
+        previous_versions = []
+        for item in self._dataset_api.list(
+            dataset_model_name_path, sort_by="NAME:desc"
+        )["items"]:
+            _, file_name = os.path.split(item["attributes"]["path"])
+            try:
+                version = int(file_name)
+            except ValueError:
+                continue
+            if version < model_version:
+                previous_versions.append(version)
+
+        remote_files = {}
+        for version in sorted(previous_versions, reverse=True)[
+            : self.DEDUPLICATION_MAX_VERSIONS
+        ]:
+            version_path = dataset_model_name_path + "/" + str(version)
+            remote_manifest = self._download_manifest(version_path)
+            if remote_manifest is None:
+                continue  # saved without deduplication
+            for relative_path, f in remote_manifest["files"].items():
+                remote_files.setdefault(
+                    (f["sha256"], f["size"]), version_path + "/" + relative_path
+                )
+
+        return {
+            relative_path: remote_files[(f["sha256"], f["size"])]
+            for relative_path, f in manifest["files"].items()
+            if (f["sha256"], f["size"]) in remote_files
+        }
+
+    def _download_manifest(self, model_version_path):
+        manifest_path = model_version_path + "/" + self.MANIFEST_FILE
+        if not self._dataset_api.path_exists(manifest_path):
+            return None
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            local_manifest_path = os.path.join(tmp_dir, self.MANIFEST_FILE)
+            self._dataset_api.download(manifest_path, local_manifest_path)
+            with open(local_manifest_path, "r") as f:
+                return json.load(f)
+
+    def _upload_manifest(self, manifest, model_version_path):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            local_manifest_path = os.path.join(tmp_dir, self.MANIFEST_FILE)
+            with open(local_manifest_path, "w") as f:
+                json.dump(manifest, f)
+            self._dataset_api.upload(local_manifest_path, model_version_path)
+
+    def _copy_files(self, copies):
+        """Copy files in datasets concurrently.
+
+        :param copies: pairs of source and destination paths
+        :type copies: List[Tuple[str, str]]
+        """
+        pending = []
+        with ThreadPoolExecutor(max_workers=self.SIMULTANEOUS_COPIES) as executor:
+            try:
+                for source_path, destination_path in copies:
+                    pending.append(
+                        executor.submit(self._copy_file, source_path, destination_path)
+                    )
+                for future in as_completed(pending):
+                    future.result()
+            except BaseException:
+                for future in pending:
+                    future.cancel()
+                raise
+
+    def _copy_file(self, source_path, destination_path):
+        attempt = 0
+        while True:
+            try:
+                self._dataset_api.copy(source_path, destination_path)
+                return
+            except (RestAPIError, RequestException) as e:
+                if (
+                    attempt >= self.COPY_MAX_RETRIES
+                    or not self._dataset_api._is_retryable(e)
+                ):
+                    raise e
+                attempt += 1
+                time.sleep(self.COPY_RETRY_INTERVAL)
+                # the failed request may have completed the copy before failing
+                if self._dataset_api.path_exists(destination_path):
+                    self._dataset_api.rm(destination_path)
 
     def _set_model_version(
-        self, model_instance, dataset_models_root_path, dataset_model_path
+        self, model_instance, dataset_models_root_path, dataset_model_path, resume=None
     ):
         # Set model version if not defined
         if model_instance._version is None:
@@ -142,7 +363,24 @@ class ModelEngine:
                         current_highest_version = current_version
                 except RestAPIError:
                     pass
-            model_instance._version = current_highest_version + 1
+            if (
+                current_highest_version > 0
+                and resume is not False
+                and (
+                    resume
+                    or self._has_interrupted_upload(
+                        dataset_model_path, current_highest_version
+                    )
+                )
+                and not self._is_model_registered(
+                    model_instance, current_highest_version
+                )
+            ):
+                # this client interrupted the save of the latest version, resume it. Versions
+                # not registered yet may otherwise be saved by another client at the moment
+                model_instance._version = current_highest_version
+            else:
+                model_instance._version = current_highest_version + 1
 
         elif self._dataset_api.path_exists(
             dataset_models_root_path
@@ -150,7 +388,7 @@ class ModelEngine:
             + model_instance._name
             + "/"
             + str(model_instance._version)
-        ):
+        ) and self._is_model_registered(model_instance, model_instance._version):
             raise ModelRegistryException(
                 "Model with name {} and version {} already exists".format(
                     model_instance._name, model_instance._version
@@ -158,11 +396,40 @@ class ModelEngine:
             )
         return model_instance
 
+    def _has_interrupted_upload(self, dataset_model_path, version):
+        return dataset_api.UploadManifest.exists(
+            dataset_model_path,
+            {
+                str(version) + codec.extension
+                for codec in archive_engine.ArchiveEngine.CODECS.values()
+            },
+        )
+
+    def _is_model_registered(self, model_instance, version):
+        try:
+            self._model_api.get(
+                model_instance._name,
+                version,
+                model_instance.model_registry_id,
+                model_instance.shared_registry_project_name,
+            )
+            return True
+        except RestAPIError as e:
+            if e.response.status_code != 404:
+                raise e
+            return False
+
     def _build_resource_path(self, model_instance, artifact):
         artifact_path = "{}/{}".format(model_instance.version_path, artifact)
         return artifact_path
 
-    def save(self, model_instance, model_path, await_registration=480):
+    def save(
+        self,
+        model_instance,
+        model_path,
+        await_registration=480,
+        upload_configuration=None,
+    ):
         _client = client.get_instance()
 
         is_shared_registry = model_instance.shared_registry_project_name is not None
@@ -192,9 +459,21 @@ class ModelEngine:
             self._dataset_api.mkdir(dataset_model_name_path)
 
         model_instance = self._set_model_version(
-            model_instance, dataset_models_root_path, dataset_model_name_path
+            model_instance,
+            dataset_models_root_path,
+            dataset_model_name_path,
+            (upload_configuration or {}).get("resume"),
         )
 
+        # the files of a version whose save was interrupted are kept, and their upload resumed
+        resume_upload = self._dataset_api.path_exists(model_instance.version_path)
+        if resume_upload:
+            print(
+                "Resuming the interrupted save of model version {}".format(
+                    model_instance.version
+                )
+            )
+
         # Attach model summary xattr to /Models/{model_instance._name}/{model_instance._version}
         model_query_params = {}
 
@@ -222,7 +501,7 @@ class ModelEngine:
         for step in pbar:
             try:
                 pbar.set_description("%s" % step["desc"])
-                if step["id"] == 0:
+                if step["id"] == 0 and not resume_upload:
                     # Create folders
                     self._engine.mkdir(model_instance)
                 if step["id"] == 1:
@@ -233,6 +512,7 @@ class ModelEngine:
                             model_path,
                             model_instance.version,
                             dataset_model_name_path,
+                            upload_configuration,
                         )
                     # check local relative
                     elif os.path.exists(
@@ -242,6 +522,7 @@ class ModelEngine:
                             os.path.join(os.getcwd(), model_path),
                             model_instance.version,
                             dataset_model_name_path,
+                            upload_configuration,
                         )
                     # check project relative
                     elif self._dataset_api.path_exists(
@@ -267,7 +548,15 @@ class ModelEngine:
                 if step["id"] == 5:
                     pass
             except BaseException as be:
-                self._dataset_api.rm(model_instance.version_path)
+                if step["id"] == 1 and isinstance(
+                    be, (RestAPIError, RequestException, KeyboardInterrupt)
+                ):
+                    # keep the files uploaded so far, saving the model again resumes the upload
+                    print(
+                        "Upload of the model files interrupted, save the model again to resume it"
+                    )
+                else:
+                    self._dataset_api.rm(model_instance.version_path)
                 raise be
 
         print("Model created, explore it at " + model_instance.get_url())
@@ -275,38 +564,76 @@ class ModelEngine:
         return model_instance
 
     def download(self, model_instance):
-        model_name_path = os.path.join(
-            tempfile.gettempdir(), str(uuid.uuid4()), model_instance._name
+        entries = list(self._dataset_api.walk(model_instance.version_path))
+        relative_version_path = os.path.join(
+            model_instance._name, str(model_instance._version)
         )
-        model_version_path = model_name_path + "/" + str(model_instance._version)
-        zip_path = model_version_path + ".zip"
-        os.makedirs(model_name_path)
 
-        temp_download_dir = "/Resources" + "/" + str(uuid.uuid4())
-        try:
-            self._dataset_api.mkdir(temp_download_dir)
-            self._dataset_api.zip(
-                model_instance.version_path,
-                destination_path=temp_download_dir,
-                block=True,
-                timeout=600,
+        if self._cache_engine.enabled:
+            return self._cache_engine.get(
+                [
+                    "model",
+                    model_instance.model_registry_id,
+                    model_instance._name,
+                    model_instance._version,
+                ],
+                self._cache_engine.get_digest(entries),
+                relative_version_path,
+                lambda data_dir: self._download_files(
+                    model_instance.version_path,
+                    os.path.join(data_dir, relative_version_path),
+                    entries,
+                ),
             )
-            self._dataset_api.download(
-                temp_download_dir + "/" + str(model_instance._version) + ".zip",
-                zip_path,
+
+        download_dir = os.path.join(tempfile.gettempdir(), str(uuid.uuid4()))
+        model_version_path = os.path.join(download_dir, relative_version_path)
+        try:
+            self._download_files(
+                model_instance.version_path, model_version_path, entries
             )
-            self._dataset_api.rm(temp_download_dir)
-            util.decompress(zip_path, extract_dir=model_name_path)
-            os.remove(zip_path)
         except BaseException as be:
+            shutil.rmtree(download_dir, ignore_errors=True)
             raise be
-        finally:
-            if os.path.exists(zip_path):
-                os.remove(zip_path)
-            self._dataset_api.rm(temp_download_dir)
 
         return model_version_path
 
+    def _download_files(self, remote_dir_path, local_dir_path, entries):
+        """Download the files in a directory concurrently, directly into their local paths."""
+
+        os.makedirs(local_dir_path, exist_ok=True)
+        pending = []
+        with ThreadPoolExecutor(max_workers=self.SIMULTANEOUS_DOWNLOADS) as executor:
+            try:
+                for entry in entries:
+                    local_path = os.path.join(
+                        local_dir_path,
+                        self._get_relative_path(entry["path"], remote_dir_path),
+                    )
+                    if entry.get("dir", False):
+                        os.makedirs(local_path, exist_ok=True)
+                    else:
+                        pending.append(
+                            executor.submit(
+                                self._dataset_api.download, entry["path"], local_path
+                            )
+                        )
+                for future in as_completed(pending):
+                    future.result()
+            except BaseException:
+                for future in pending:
+                    future.cancel()
+                raise
+
+    def _get_relative_path(self, remote_path, remote_dir_path):
+        # listings return absolute paths, possibly with an hdfs prefix
+        index = remote_path.find(remote_dir_path)
+        if index < 0:
+            raise ModelRegistryException(
+                "Unexpected path {} found in {}".format(remote_path, remote_dir_path)
+            )
+        return remote_path[index + len(remote_dir_path) :].lstrip("/")
+
     def read_file(self, model_instance, resource):
         hdfs_resource_path = self._build_resource_path(
             model_instance, os.path.basename(resource)
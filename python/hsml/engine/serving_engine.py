@@ -14,18 +14,39 @@
 #   limitations under the License.
 #
 
+import asyncio
+import collections
+import itertools
+import json
 import os
+import random
+import tempfile
 import time
 import uuid
+import warnings
+
+from concurrent import futures
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from requests.exceptions import RequestException, Timeout
 
 from tqdm.auto import tqdm
 
 from hsml import util
 
-from hsml.constants import DEPLOYMENT, PREDICTOR, PREDICTOR_STATE
+from hsml.constants import DEPLOYMENT, INFERENCE_PROTOCOL, PREDICTOR, PREDICTOR_STATE
 from hsml.core import serving_api, dataset_api
+from hsml.deployment_state_change import DeploymentStateChange
+from hsml.engine import batching_engine, cache_engine, canary_engine, hedging_engine
 
-from hsml.client.exceptions import ModelServingException, RestAPIError
+from hsml.client import grpc_inference, transport
+from hsml.client.exceptions import (
+    GrpcUnavailableError,
+    ModelServingException,
+    RestAPIError,
+)
 
 
 class ServingEngine:
@@ -40,18 +61,24 @@ class ServingEngine:
         PREDICTOR_STATE.CONDITION_TYPE_SCHEDULED,
         PREDICTOR_STATE.CONDITION_TYPE_STOPPED,
     ]
+    BATCH_RETRY_INTERVAL = 1
+    INFERENCE_RETRY_STATUS_CODES = [502, 503, 504]
+    INFERENCE_MAX_RETRIES = 3
+    INFERENCE_RETRY_BACKOFF = 0.1  # seconds, doubled on every retry
+    INFERENCE_MAX_RETRY_BACKOFF = 2
+    BULK_MAX_WORKERS = 8  # concurrent lifecycle requests of bulk operations
 
     def __init__(self):
         self._serving_api = serving_api.ServingApi()
         self._dataset_api = dataset_api.DatasetApi()
+        self._cache_engine = cache_engine.CacheEngine()
 
     def _poll_deployment_status(
         self, deployment_instance, status: str, await_status: int, update_progress=None
     ):
         if await_status > 0:
-            sleep_seconds = 5
-            for _ in range(int(await_status / sleep_seconds)):
-                time.sleep(sleep_seconds)
+
+            def get_state():
                 state = deployment_instance.get_state()
                 num_instances = self._get_available_instances(state)
                 if update_progress is not None:
@@ -62,30 +89,36 @@ class ServingEngine:
                     status == PREDICTOR_STATE.STATUS_RUNNING
                     and state.status == PREDICTOR_STATE.STATUS_FAILED
                 ):
-                    error_msg = state.condition.reason
-                    if (
-                        state.condition.type
-                        == PREDICTOR_STATE.CONDITION_TYPE_INITIALIZED
-                        or state.condition.type
-                        == PREDICTOR_STATE.CONDITION_TYPE_STARTED
-                    ):
-                        component = (
-                            "transformer"
-                            if "transformer" in state.condition.reason
-                            else "predictor"
-                        )
-                        error_msg += (
-                            ". Please, check the server logs using `.get_logs(component='"
-                            + component
-                            + "')`"
-                        )
-                    raise ModelServingException(error_msg)
+                    raise ModelServingException(self._get_failed_state_error(state))
+                return None
+
+            state = util.poll(get_state, await_status)
+            if state is not None:
+                return state
             raise ModelServingException(
                 "Deployment has not reached the desired status within the expected awaiting time. Check the current status by using `.get_state()`, "
                 + "explore the server logs using `.get_logs()` or set a higher value for await_"
                 + status.lower()
             )
 
+    def _get_failed_state_error(self, state):
+        error_msg = state.condition.reason
+        if (
+            state.condition.type == PREDICTOR_STATE.CONDITION_TYPE_INITIALIZED
+            or state.condition.type == PREDICTOR_STATE.CONDITION_TYPE_STARTED
+        ):
+            component = (
+                "transformer"
+                if "transformer" in state.condition.reason
+                else "predictor"
+            )
+            error_msg += (
+                ". Please, check the server logs using `.get_logs(component='"
+                + component
+                + "')`"
+            )
+        return error_msg
+
     def start(self, deployment_instance, await_status: int) -> bool:
         (done, state) = self._check_status(
             deployment_instance, PREDICTOR_STATE.STATUS_RUNNING
@@ -122,6 +155,7 @@ class ServingEngine:
                 self._serving_api.post(
                     deployment_instance, DEPLOYMENT.ACTION_START
                 )  # start deployment
+                self._invalidate_state(deployment_instance)
 
                 state = self._poll_deployment_status(  # wait for status
                     deployment_instance,
@@ -166,6 +200,7 @@ class ServingEngine:
             self._serving_api.post(
                 deployment_instance, DEPLOYMENT.ACTION_STOP
             )  # stop deployment
+            self._invalidate_state(deployment_instance)
 
             _ = self._poll_deployment_status(  # wait for status
                 deployment_instance,
@@ -174,31 +209,770 @@ class ServingEngine:
                 update_progress,
             )
 
-    def predict(self, deployment_instance, data, inputs):
-        payload = self._build_inference_payload(data, inputs)
+    # Bulk operations
 
-        serving_tool = deployment_instance.predictor.serving_tool
-        through_hopsworks = (
-            serving_tool != PREDICTOR.SERVING_TOOL_KSERVE
-        )  # if not KServe, send request to Hopsworks
-        try:
-            return self._serving_api.send_inference_request(
-                deployment_instance, payload, through_hopsworks
+    def start_all(self, deployments, await_status: int):
+        return self._run_bulk(
+            deployments,
+            self._request_start,
+            PREDICTOR_STATE.STATUS_RUNNING,
+            "Starting deployments",
+            await_status,
+        )
+
+    def stop_all(self, deployments, await_status: int):
+        return self._run_bulk(
+            deployments,
+            self._request_stop,
+            PREDICTOR_STATE.STATUS_STOPPED,
+            "Stopping deployments",
+            await_status,
+        )
+
+    def update_all(self, deployments, await_status: int):
+        return self._run_bulk(
+            deployments,
+            self._request_update,
+            PREDICTOR_STATE.STATUS_RUNNING,
+            "Updating deployments",
+            await_status,
+        )
+
+    def _run_bulk(self, deployments, request_fn, status, desc, await_status):
+        """Request an action on many deployments concurrently, and wait until all of them reach
+        the desired status, fetching the states of all deployments at once on every poll.
+
+        Requests are sent by a dedicated pool of at most `BULK_MAX_WORKERS` threads, which is
+        shut down once all requests are sent.
+
+        :param deployments: deployments, or names of deployments
+        :type deployments: List[Union[Deployment, str]]
+        :param request_fn: function requesting the action on a deployment given its state,
+            returning whether to wait for the deployment to reach the desired status
+        :type request_fn: Callable[[Deployment, PredictorState, int], bool]
+        :param status: desired status of the deployments
+        :type status: str
+        :param desc: description of the progress bar
+        :type desc: str
+        :param await_status: seconds to wait for the deployments to reach the desired status
+        :type await_status: int
+        :return: status and error, if any, of each deployment by name
+        :rtype: Dict[str, dict]
+        """
+        existing = {
+            deployment_instance.name: deployment_instance
+            for deployment_instance in self._serving_api.get_all()
+        }
+        report = collections.OrderedDict()
+        selected = {}
+        for deployment_instance in deployments:
+            name = (
+                deployment_instance
+                if isinstance(deployment_instance, str)
+                else deployment_instance.name
             )
-        except RestAPIError as re:
-            if (
-                re.response.status_code == RestAPIError.STATUS_CODE_NOT_FOUND
-                or re.error_code
-                == ModelServingException.ERROR_CODE_DEPLOYMENT_NOT_RUNNING
-            ):
+            if isinstance(deployment_instance, str):
+                deployment_instance = existing.get(name)
+            report[name] = {"status": None, "error": None}
+            if deployment_instance is None:
+                report[name]["error"] = "Deployment not found"
+            elif deployment_instance.id is not None and name not in existing:
+                report[name]["error"] = "Deployment not found"
+            else:
+                if name in existing:
+                    self._set_state(
+                        deployment_instance, existing[name]._predictor._state
+                    )
+                selected[name] = deployment_instance
+
+        pbar = tqdm(total=len(report))
+        pbar.set_description(desc)
+        pending = {}
+        # lifecycle requests can block for a long time (e.g., waiting for a deployment to be
+        # created), so they run on their own pool instead of the one sending inference requests
+        with ThreadPoolExecutor(
+            max_workers=max(1, min(self.BULK_MAX_WORKERS, len(selected))),
+            thread_name_prefix="hsml-bulk",
+        ) as executor:
+            submitted = {
+                executor.submit(
+                    request_fn,
+                    deployment_instance,
+                    deployment_instance._predictor._state,
+                    await_status,
+                ): name
+                for name, deployment_instance in selected.items()
+            }
+            for future in futures.as_completed(submitted):
+                name = submitted[future]
+                try:
+                    if future.result() and await_status > 0:
+                        pending[name] = selected[name]
+                        continue
+                except (RestAPIError, ModelServingException) as e:
+                    report[name]["error"] = str(e)
+                state = selected[name]._predictor._state
+                report[name]["status"] = state.status if state is not None else None
+                pbar.update(1)
+        for name in report:
+            if name not in selected:
+                pbar.update(1)
+
+        def poll_states():
+            states = {
+                deployment_instance.name: deployment_instance._predictor._state
+                for deployment_instance in self._serving_api.get_all()
+            }
+            for name, deployment_instance in list(pending.items()):
+                state = states.get(name)
+                if state is None:
+                    report[name]["error"] = "Deployment not found"
+                else:
+                    self._set_state(deployment_instance, state)
+                    report[name]["status"] = state.status
+                    if (
+                        status == PREDICTOR_STATE.STATUS_RUNNING
+                        and state.status == PREDICTOR_STATE.STATUS_FAILED
+                    ):
+                        report[name]["error"] = self._get_failed_state_error(state)
+                    elif state.status != status:
+                        continue
+                del pending[name]
+                pbar.update(1)
+            return True if len(pending) == 0 else None
+
+        if len(pending) > 0:
+            util.poll(poll_states, await_status)
+        for name in pending:
+            report[name][
+                "error"
+            ] = "Deployment has not reached the desired status within the expected awaiting time"
+        pbar.close()
+
+        failed = sum(1 for result in report.values() if result["error"] is not None)
+        print(
+            "{} of {} deployments {}".format(
+                len(report) - failed, len(report), status.lower()
+            )
+            + (", {} failed".format(failed) if failed > 0 else "")
+        )
+        return report
+
+    # Canary
+
+    def start_canary(
+        self, deployment_instance, canary_deployment, traffic_percentage, await_status
+    ):
+        if deployment_instance._canary_engine is not None:
+            raise ModelServingException(
+                "Deployment already has a canary, promote it or roll it back first"
+            )
+        engine = canary_engine.CanaryEngine(canary_deployment, traffic_percentage)
+
+        canary_deployment.save()
+        try:
+            canary_deployment.start(await_status)
+            state = canary_deployment.get_state(refresh=True)
+            if state.status != PREDICTOR_STATE.STATUS_RUNNING:
                 raise ModelServingException(
-                    "Deployment not created or running. If it is already created, start it by using `.start()` or check its status with .get_state()"
+                    "Canary deployment is not running, current status is "
+                    + state.status
                 )
+        except BaseException as be:
+            self.delete(canary_deployment, force=True)
+            raise be
 
-            re.args = (
-                re.args[0] + "\n\n Check the model server logs by using `.get_logs()`",
+        deployment_instance._canary_engine = engine
+        print(
+            "Sending {}% of the predictions to the canary deployment".format(
+                traffic_percentage
             )
-            raise re
+        )
+        return canary_deployment
+
+    def promote_canary(self, deployment_instance, await_update):
+        canary_deployment = self._get_canary(deployment_instance).canary_deployment
+        # the deployment takes the configuration of the canary, keeping its identity
+        predictor_json = canary_deployment.predictor.to_dict()
+        predictor_json.update(
+            {
+                "id": deployment_instance.id,
+                "name": deployment_instance.name,
+                "description": deployment_instance.description,
+                "created": deployment_instance.created_at,
+                "creator": deployment_instance.creator,
+            }
+        )
+        deployment_instance._canary_engine = None
+        deployment_instance.predictor = type(
+            deployment_instance.predictor
+        ).from_response_json(predictor_json)
+        deployment_instance._inference_routes.clear()
+        self.update(deployment_instance, await_update)
+        self.delete(canary_deployment, force=True)
+
+    def rollback_canary(self, deployment_instance):
+        canary_deployment = self._get_canary(deployment_instance).canary_deployment
+        deployment_instance._canary_engine = None
+        self.delete(canary_deployment, force=True)
+
+    def run_canary(
+        self,
+        deployment_instance,
+        canary_deployment,
+        traffic_percentage,
+        min_predictions,
+        max_latency_increase,
+        max_error_rate_increase,
+        timeout,
+        await_running,
+        await_update,
+    ):
+        self.start_canary(
+            deployment_instance, canary_deployment, traffic_percentage, await_running
+        )
+        engine = deployment_instance._canary_engine
+        decision = util.poll(
+            lambda: engine.evaluate(
+                min_predictions, max_latency_increase, max_error_rate_increase
+            ),
+            timeout,
+        )
+        if decision is None:
+            decision = (
+                False,
+                "Not enough predictions were made within the timeout to evaluate the canary",
+            )
+        promoted, reason = decision
+        stats = engine.get_stats()
+
+        print(reason)
+        if promoted:
+            print("Promoting canary deployment...")
+            self.promote_canary(deployment_instance, await_update)
+        else:
+            print("Rolling back canary deployment...")
+            self.rollback_canary(deployment_instance)
+        return {"promoted": promoted, "reason": reason, **stats}
+
+    def _get_canary(self, deployment_instance):
+        if deployment_instance._canary_engine is None:
+            raise ModelServingException("Deployment has no canary")
+        return deployment_instance._canary_engine
+
+    # Watch
+
+    def watch(self, model_name, interval, timeout):
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        snapshot = {}
+        while True:
+            yield from self._get_state_changes(
+                snapshot, self._serving_api.get_all(model_name)
+            )
+            if deadline is not None and time.monotonic() + interval > deadline:
+                return
+            time.sleep(interval)
+
+    async def watch_async(self, model_name, interval, timeout):
+        loop = asyncio.get_running_loop()
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        snapshot = {}
+        while True:
+            deployments = await loop.run_in_executor(
+                transport.get_executor(), self._serving_api.get_all, model_name
+            )
+            for change in self._get_state_changes(snapshot, deployments):
+                yield change
+            if deadline is not None and time.monotonic() + interval > deadline:
+                return
+            await asyncio.sleep(interval)
+
+    def _get_state_changes(self, snapshot, deployments):
+        """Diff the states of all deployments against the previous snapshot, updating it.
+
+        :param snapshot: deployments last seen, by id
+        :type snapshot: Dict[int, Deployment]
+        :param deployments: deployments currently found
+        :type deployments: List[Deployment]
+        :return: state changes
+        :rtype: List[DeploymentStateChange]
+        """
+        changes = []
+        current = {
+            deployment_instance.id: deployment_instance
+            for deployment_instance in deployments
+        }
+        for id, deployment_instance in current.items():
+            previous = snapshot.get(id)
+            change = DeploymentStateChange.from_states(
+                deployment_instance,
+                deployment_instance._predictor._state,
+                previous._predictor._state if previous is not None else None,
+            )
+            if change is not None:
+                changes.append(change)
+        for id, deployment_instance in snapshot.items():
+            if id not in current:
+                changes.append(
+                    DeploymentStateChange.from_states(
+                        deployment_instance, None, deployment_instance._predictor._state
+                    )
+                )
+        snapshot.clear()
+        snapshot.update(current)
+        return changes
+
+    def _request_start(self, deployment_instance, state, await_status):
+        if state is None:
+            raise ModelServingException(
+                "Deployment not found, please save it first by using `.save()`"
+            )
+        if (
+            state.status == PREDICTOR_STATE.STATUS_RUNNING
+            or state.status == PREDICTOR_STATE.STATUS_IDLE
+            or state.status == PREDICTOR_STATE.STATUS_UPDATING
+        ):
+            return False
+        if (
+            state.status == PREDICTOR_STATE.STATUS_STARTING
+            or state.status == PREDICTOR_STATE.STATUS_FAILED
+        ):
+            return True
+        if state.status == PREDICTOR_STATE.STATUS_STOPPING:
+            raise ModelServingException(
+                "Deployment is stopping, please wait until it completely stops"
+            )
+        if state.status == PREDICTOR_STATE.STATUS_CREATING:
+            # only right after being created, before the artifact is ready
+            self._poll_deployment_status(
+                deployment_instance, PREDICTOR_STATE.STATUS_CREATED, await_status
+            )
+        self._serving_api.post(deployment_instance, DEPLOYMENT.ACTION_START)
+        self._invalidate_state(deployment_instance)
+        return True
+
+    def _request_stop(self, deployment_instance, state, await_status):
+        if state is None:
+            raise ModelServingException(
+                "Deployment not found, please save it first by using `.save()`"
+            )
+        if (
+            state.status == PREDICTOR_STATE.STATUS_CREATING
+            or state.status == PREDICTOR_STATE.STATUS_CREATED
+            or state.status == PREDICTOR_STATE.STATUS_STOPPED
+        ):
+            return False
+        if state.status == PREDICTOR_STATE.STATUS_STOPPING:
+            return True
+        if (
+            state.status == PREDICTOR_STATE.STATUS_STARTING
+            and state.condition is not None
+        ):
+            raise ModelServingException(
+                "Deployment is starting, please wait until it completely starts"
+            )
+        if (
+            state.status == PREDICTOR_STATE.STATUS_UPDATING
+            and state.condition is not None
+        ):
+            raise ModelServingException(
+                "Deployment is updating, please wait until the update completes"
+            )
+        self._serving_api.post(deployment_instance, DEPLOYMENT.ACTION_STOP)
+        self._invalidate_state(deployment_instance)
+        return True
+
+    def _request_update(self, deployment_instance, state, await_status):
+        if deployment_instance.id is None:
+            self._serving_api.put(deployment_instance)
+            return False
+        if state.status == PREDICTOR_STATE.STATUS_STARTING:
+            raise ModelServingException(
+                "Deployment is starting, please wait until it is running before applying changes"
+            )
+        if state.status == PREDICTOR_STATE.STATUS_UPDATING:
+            raise ModelServingException(
+                "Deployment is updating, please wait until it is running before applying changes"
+            )
+        if state.status == PREDICTOR_STATE.STATUS_STOPPING:
+            raise ModelServingException(
+                "Deployment is stopping, please wait until it is stopped before applying changes"
+            )
+        self._serving_api.put(deployment_instance)
+        # running instances are updated, stopped deployments are only saved
+        return (
+            state.status == PREDICTOR_STATE.STATUS_RUNNING
+            or state.status == PREDICTOR_STATE.STATUS_IDLE
+            or state.status == PREDICTOR_STATE.STATUS_FAILED
+        )
+
+    def predict(self, deployment_instance, data, inputs, binary=False, timeout=None):
+        if deployment_instance._canary_engine is not None:
+            return deployment_instance._canary_engine.send(
+                deployment_instance,
+                lambda target: self._predict(target, data, inputs, binary, timeout),
+            )
+        return self._predict(deployment_instance, data, inputs, binary, timeout)
+
+    def _predict(self, deployment_instance, data, inputs, binary, timeout):
+        deadline = _get_deadline(timeout)
+        grpc_client = deployment_instance._grpc_client
+        if grpc_client is not None and data is None:
+            if grpc_client.available:
+                try:
+                    return grpc_client.infer(
+                        deployment_instance.name, inputs, _get_remaining(deadline)
+                    )
+                except GrpcUnavailableError:
+                    pass
+            binary = True  # fall back to binary tensors over HTTP
+
+        if binary:
+            self._check_binary_inference(deployment_instance, inputs)
+            return self._send_with_retries(
+                deployment_instance,
+                lambda timeout: self._serving_api.send_binary_inference_request(
+                    deployment_instance, inputs, timeout
+                ),
+                deadline,
+            )
+
+        if deployment_instance.inference_protocol == INFERENCE_PROTOCOL.V2:
+            payload = self._build_v2_inference_payload(
+                deployment_instance, data, inputs
+            )
+        else:
+            payload = self._build_inference_payload(data, inputs)
+            if data is None and deployment_instance._batching_engine is not None:
+                future = deployment_instance._batching_engine.submit(
+                    payload["instances"]
+                )
+                try:
+                    return future.result(_get_remaining(deadline))
+                except futures.TimeoutError:
+                    raise _get_deadline_error()
+
+        return self._send_inference_request(deployment_instance, payload, deadline)
+
+    async def predict_async(
+        self, deployment_instance, data, inputs, binary=False, timeout=None
+    ):
+        if deployment_instance._canary_engine is not None:
+            return await deployment_instance._canary_engine.send_async(
+                deployment_instance,
+                lambda target: self._predict_async(
+                    target, data, inputs, binary, timeout
+                ),
+            )
+        return await self._predict_async(
+            deployment_instance, data, inputs, binary, timeout
+        )
+
+    async def _predict_async(self, deployment_instance, data, inputs, binary, timeout):
+        deadline = _get_deadline(timeout)
+        grpc_client = deployment_instance._grpc_client
+        if grpc_client is not None and data is None:
+            if grpc_client.available:
+                try:
+                    return await grpc_client.infer_async(
+                        deployment_instance.name, inputs, _get_remaining(deadline)
+                    )
+                except GrpcUnavailableError:
+                    pass
+            binary = True  # fall back to binary tensors over HTTP
+
+        if binary:
+            self._check_binary_inference(deployment_instance, inputs)
+            return await self._send_with_retries_async(
+                deployment_instance,
+                lambda timeout: self._serving_api.send_binary_inference_request_async(
+                    deployment_instance, inputs, timeout
+                ),
+                deadline,
+            )
+
+        if deployment_instance.inference_protocol == INFERENCE_PROTOCOL.V2:
+            payload = self._build_v2_inference_payload(
+                deployment_instance, data, inputs
+            )
+        else:
+            payload = self._build_inference_payload(data, inputs)
+            if data is None and deployment_instance._batching_engine is not None:
+                future = deployment_instance._batching_engine.submit(
+                    payload["instances"]
+                )
+                try:
+                    return await asyncio.wait_for(
+                        asyncio.wrap_future(future), _get_remaining(deadline)
+                    )
+                except asyncio.TimeoutError:
+                    raise _get_deadline_error()
+
+        return await self._send_with_retries_async(
+            deployment_instance,
+            lambda timeout: self._serving_api.send_inference_request_async(
+                deployment_instance, payload, timeout=timeout
+            ),
+            deadline,
+        )
+
+    def _check_binary_inference(self, deployment_instance, inputs):
+        if deployment_instance.predictor.serving_tool != PREDICTOR.SERVING_TOOL_KSERVE:
+            raise ModelServingException(
+                "Binary inference requests are only supported for KServe deployments"
+            )
+        if inputs is None:
+            raise ModelServingException(
+                "Binary inference requests require the inputs parameter"
+            )
+
+    def _send_inference_request(
+        self, deployment_instance, payload, deadline=None, max_retries=None, hedge=True
+    ):
+        return self._send_with_retries(
+            deployment_instance,
+            lambda timeout: self._serving_api.send_inference_request(
+                deployment_instance, payload, timeout=timeout
+            ),
+            deadline,
+            max_retries,
+            hedge,
+        )
+
+    def _send_with_retries(
+        self, deployment_instance, send_fn, deadline, max_retries=None, hedge=True
+    ):
+        """Send an inference request, hedged if enabled in the deployment, retrying it with
+        jittered exponential backoff on 502, 503 and 504 errors. Without a deadline, requests are
+        retried up to `max_retries` times, otherwise as long as the deadline allows."""
+        hedger = deployment_instance._hedging_engine if hedge else None
+        attempt = 0
+        while True:
+            try:
+                if hedger is not None:
+                    return hedger.send(
+                        lambda: send_fn(_get_remaining(deadline)),
+                        _get_remaining(deadline),
+                    )
+                return send_fn(_get_remaining(deadline))
+            except RestAPIError as re:
+                delay = self._get_retry_delay(re, attempt, deadline, max_retries)
+                if delay is None:
+                    raise self._get_inference_error(re)
+            except (Timeout, futures.TimeoutError):
+                raise _get_deadline_error()
+            time.sleep(delay)
+            attempt += 1
+
+    async def _send_with_retries_async(
+        self, deployment_instance, send_coro_fn, deadline, max_retries=None, hedge=True
+    ):
+        hedger = deployment_instance._hedging_engine if hedge else None
+        attempt = 0
+        while True:
+            try:
+                if hedger is not None:
+                    return await hedger.send_async(
+                        lambda: send_coro_fn(_get_remaining(deadline)),
+                        _get_remaining(deadline),
+                    )
+                return await send_coro_fn(_get_remaining(deadline))
+            except RestAPIError as re:
+                delay = self._get_retry_delay(re, attempt, deadline, max_retries)
+                if delay is None:
+                    raise self._get_inference_error(re)
+            except (Timeout, asyncio.TimeoutError):
+                raise _get_deadline_error()
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def _get_retry_delay(self, re, attempt, deadline, max_retries):
+        """Get the seconds to wait before retrying a failed inference request, or None if it
+        should not be retried."""
+        if re.response.status_code not in self.INFERENCE_RETRY_STATUS_CODES:
+            return None
+        max_retries = (
+            max_retries if max_retries is not None else self.INFERENCE_MAX_RETRIES
+        )
+        if deadline is None and attempt >= max_retries:
+            return None
+        # full jitter, so that clients retrying at the same time are spread out
+        delay = random.uniform(
+            0,
+            min(
+                self.INFERENCE_RETRY_BACKOFF * 2**attempt,
+                self.INFERENCE_MAX_RETRY_BACKOFF,
+            ),
+        )
+        if deadline is not None and time.monotonic() + delay >= deadline:
+            return None
+        return delay
+
+    def predict_batch(
+        self,
+        deployment_instance,
+        data,
+        batch_size,
+        concurrency,
+        max_retries,
+        as_numpy,
+    ):
+        predictions = self._predict_batches(
+            deployment_instance, data, batch_size, concurrency, max_retries
+        )
+        if not as_numpy:
+            return predictions
+
+        if not isinstance(data, (pd.DataFrame, np.ndarray)):
+            # the number of rows of iterators is unknown beforehand
+            return np.asarray(list(predictions))
+
+        result = None
+        for i, prediction in enumerate(predictions):
+            if result is None:
+                # preallocated once the shape and type of the predictions is known
+                first = np.asarray(prediction)
+                result = np.empty((len(data),) + first.shape, dtype=first.dtype)
+            result[i] = prediction
+        return result if result is not None else np.empty((0,))
+
+    def _predict_batches(
+        self, deployment_instance, data, batch_size, concurrency, max_retries
+    ):
+        """Send the rows of the data in batches of instances concurrently, and yield the
+        predictions of each row in order."""
+        pending = collections.deque()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            try:
+                for instances in self._get_batches(data, batch_size):
+                    pending.append(
+                        executor.submit(
+                            self._predict_batch,
+                            deployment_instance,
+                            instances,
+                            max_retries,
+                        )
+                    )
+                    # bounded number of batches in memory, results are yielded in order
+                    while len(pending) > concurrency:
+                        yield from pending.popleft().result()
+                while len(pending) > 0:
+                    yield from pending.popleft().result()
+            finally:
+                for future in pending:
+                    future.cancel()
+
+    def _predict_batch(self, deployment_instance, instances, max_retries):
+        is_v2 = deployment_instance.inference_protocol == INFERENCE_PROTOCOL.V2
+        payload = (
+            # rows are sent as a single input tensor
+            self._build_v2_inference_payload(
+                deployment_instance, None, np.asarray(instances)
+            )
+            if is_v2
+            else {"instances": instances}
+        )
+        attempt = 0
+        while True:
+            try:
+                response = self._send_inference_request(
+                    deployment_instance, payload, max_retries=0, hedge=False
+                )
+                break
+            except (RestAPIError, RequestException) as e:
+                if attempt >= max_retries or (
+                    isinstance(e, RestAPIError)
+                    and e.response.status_code
+                    < RestAPIError.STATUS_CODE_INTERNAL_SERVER_ERROR
+                ):
+                    raise e
+                time.sleep(self.BATCH_RETRY_INTERVAL * 2**attempt)
+                attempt += 1
+
+        if is_v2:
+            # predictions of each row are given by the first output tensor
+            predictions = list(response["outputs"][0]["data"])
+        else:
+            predictions = response.get("predictions") if response is not None else None
+        if not isinstance(predictions, list) or len(predictions) != len(instances):
+            raise ModelServingException(
+                "The inference response does not contain one prediction per instance"
+            )
+        return predictions
+
+    def _get_batches(self, data, batch_size):
+        if isinstance(data, pd.DataFrame):
+            for start in range(0, len(data), batch_size):
+                yield data.iloc[start : start + batch_size].values.tolist()
+        elif isinstance(data, np.ndarray):
+            for start in range(0, len(data), batch_size):
+                yield data[start : start + batch_size].tolist()
+        else:
+            rows = iter(data)
+            while True:
+                instances = [
+                    row.tolist() if isinstance(row, np.ndarray) else row
+                    for row in itertools.islice(rows, batch_size)
+                ]
+                if len(instances) == 0:
+                    return
+                yield instances
+
+    def enable_client_batching(self, deployment_instance, max_batch_size, max_latency):
+        self.disable_client_batching(deployment_instance)
+        deployment_instance._batching_engine = batching_engine.BatchingEngine(
+            lambda payload: self._send_inference_request(
+                deployment_instance, payload, hedge=False
+            ),
+            max_batch_size,
+            max_latency,
+        )
+
+    def enable_request_hedging(self, deployment_instance, delay, max_hedges):
+        deployment_instance._hedging_engine = hedging_engine.HedgingEngine(
+            delay, max_hedges
+        )
+
+    def disable_request_hedging(self, deployment_instance):
+        deployment_instance._hedging_engine = None
+
+    def disable_client_batching(self, deployment_instance):
+        if deployment_instance._batching_engine is not None:
+            deployment_instance._batching_engine.close()
+            deployment_instance._batching_engine = None
+
+    def enable_grpc(self, deployment_instance, port, timeout):
+        if deployment_instance.predictor.serving_tool != PREDICTOR.SERVING_TOOL_KSERVE:
+            raise ModelServingException(
+                "gRPC inference requests are only supported for KServe deployments"
+            )
+        if not grpc_inference.is_available():
+            warnings.warn(
+                "gRPC inference requests require the grpcio package, install it with `pip install hsml[grpc]`."
+                " Inference requests are sent over HTTP.",
+                stacklevel=3,
+            )
+            return
+        deployment_instance._grpc_client = self._serving_api.get_grpc_inference_client(
+            deployment_instance, port, timeout
+        )
+
+    def disable_grpc(self, deployment_instance):
+        deployment_instance._grpc_client = None
+
+    def _get_inference_error(self, re):
+        if (
+            re.response.status_code == RestAPIError.STATUS_CODE_NOT_FOUND
+            or re.error_code == ModelServingException.ERROR_CODE_DEPLOYMENT_NOT_RUNNING
+        ):
+            return ModelServingException(
+                "Deployment not created or running. If it is already created, start it by using `.start()` or check its status with .get_state()"
+            )
+
+        re.args = (
+            re.args[0] + "\n\n Check the model server logs by using `.get_logs()`",
+        )
+        return re
 
     def _build_inference_payload(self, data, inputs):
         """Build or check the payload for an inference request. If the 'data' parameter is provided, this method ensures
@@ -227,8 +1001,100 @@ class ServingEngine:
                         break
         return data
 
+    def _build_v2_inference_payload(self, deployment_instance, data, inputs):
+        """Build or check the payload for an inference request using the v2 inference protocol. If the 'data'
+        parameter is provided, this method ensures it contains the 'inputs' key. Otherwise, the 'inputs' parameter
+        is converted into typed input tensors, named and typed after the input tensor schema of the model if available.
+        """
+        if deployment_instance.predictor.serving_tool != PREDICTOR.SERVING_TOOL_KSERVE:
+            raise ModelServingException(
+                "The v2 inference protocol is only supported for KServe deployments"
+            )
+
+        if data is not None:  # check data
+            if not isinstance(data, dict) or "inputs" not in data:
+                raise ModelServingException(
+                    "Inference data is missing 'inputs' key of the v2 inference protocol"
+                )
+            return data
+
+        input_tensors = []
+        for name, tensor in self._get_v2_input_tensors(deployment_instance, inputs):
+            datatype = util.get_tensor_datatype(tensor)
+            input_tensors.append(
+                {
+                    "name": name,
+                    "shape": list(tensor.shape),
+                    "datatype": datatype,
+                    "data": tensor.flatten().tolist()
+                    if datatype == "BYTES"
+                    else tensor.flatten(),
+                }
+            )
+        return {"inputs": input_tensors}
+
+    def _get_v2_input_tensors(self, deployment_instance, inputs):
+        tensor_schemas = self._get_input_tensor_schemas(deployment_instance)
+        names = [
+            tensor_schema.get("name", "input-" + str(i))
+            for i, tensor_schema in enumerate(tensor_schemas)
+        ]
+        types = dict(zip(names, [t.get("type") for t in tensor_schemas]))
+
+        if isinstance(inputs, dict):
+            named_inputs = list(inputs.items())
+        elif (
+            isinstance(inputs, (list, tuple))
+            and len(names) > 1
+            and len(inputs) == len(names)
+        ):
+            # one input per tensor in the schema
+            named_inputs = list(zip(names, inputs))
+        else:
+            named_inputs = [(names[0] if len(names) > 0 else "input-0", inputs)]
+
+        tensors = []
+        for name, value in named_inputs:
+            if isinstance(value, (pd.DataFrame, pd.Series)):
+                value = value.values
+            tensors.append((name, np.asarray(value, dtype=_get_dtype(types.get(name)))))
+        return tensors
+
+    def _get_input_tensor_schemas(self, deployment_instance):
+        """Get the input tensors in the model schema of the deployed model, read once per deployment."""
+        if deployment_instance._model_schema is None:
+            deployment_instance._model_schema = (
+                self._read_model_schema(deployment_instance) or {}
+            )
+        tensor_schemas = deployment_instance._model_schema.get("input_schema", {}).get(
+            "tensor_schema", []
+        )
+        # tensor schemas built from a single array are not wrapped in a list
+        return tensor_schemas if isinstance(tensor_schemas, list) else [tensor_schemas]
+
+    def _read_model_schema(self, deployment_instance):
+        model_schema_path = "{}/{}/model_schema.json".format(
+            deployment_instance.model_path, deployment_instance.model_version
+        )
+        if not self._dataset_api.path_exists(model_schema_path):
+            return None
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            local_model_schema_path = os.path.join(tmp_dir, "model_schema.json")
+            self._dataset_api.download(model_schema_path, local_model_schema_path)
+            with open(local_model_schema_path, "r") as f:
+                return json.load(f)
+
+    def get_model_metadata(self, deployment_instance):
+        try:
+            return self._serving_api.get_model_metadata(deployment_instance)
+        except RestAPIError as re:
+            raise self._get_inference_error(re)
+
+    def is_model_ready(self, deployment_instance):
+        return self._serving_api.is_model_ready(deployment_instance)
+
     def _check_status(self, deployment_instance, desired_status):
-        state = deployment_instance.get_state()
+        state = self.get_state(deployment_instance, refresh=True)
         if state is None:
             return (True, None)
 
@@ -371,31 +1237,43 @@ class ServingEngine:
             )
 
         from_artifact_zip_path = deployment_instance.artifact_path
-        to_artifacts_path = os.path.join(
-            os.getcwd(),
-            str(uuid.uuid4()),
+        relative_artifacts_path = os.path.join(
             deployment_instance.model_name,
             str(deployment_instance.model_version),
             "Artifacts",
         )
-        to_artifact_version_path = (
-            to_artifacts_path + "/" + str(deployment_instance.artifact_version)
+        relative_artifact_version_path = os.path.join(
+            relative_artifacts_path, str(deployment_instance.artifact_version)
         )
-        to_artifact_zip_path = to_artifact_version_path + ".zip"
 
-        os.makedirs(to_artifacts_path)
+        def download_to(download_dir):
+            to_artifacts_path = os.path.join(download_dir, relative_artifacts_path)
+            to_artifact_zip_path = (
+                os.path.join(download_dir, relative_artifact_version_path) + ".zip"
+            )
+
+            os.makedirs(to_artifacts_path)
 
-        try:
-            self._dataset_api.download(from_artifact_zip_path, to_artifact_zip_path)
-            util.decompress(to_artifact_zip_path, extract_dir=to_artifacts_path)
-            os.remove(to_artifact_zip_path)
-        except BaseException as be:
-            raise be
-        finally:
-            if os.path.exists(to_artifact_zip_path):
-                os.remove(to_artifact_zip_path)
+            try:
+                self._dataset_api.download(from_artifact_zip_path, to_artifact_zip_path)
+                util.decompress(to_artifact_zip_path, extract_dir=to_artifacts_path)
+            finally:
+                if os.path.exists(to_artifact_zip_path):
+                    os.remove(to_artifact_zip_path)
+
+        if self._cache_engine.enabled:
+            # the artifact zip is immutable once created, its metadata identifies the content
+            artifact_zip = self._dataset_api.get(from_artifact_zip_path)["attributes"]
+            return self._cache_engine.get(
+                ["artifact", from_artifact_zip_path],
+                self._cache_engine.get_digest([artifact_zip]),
+                relative_artifact_version_path,
+                download_to,
+            )
 
-        return to_artifact_version_path
+        download_dir = os.path.join(os.getcwd(), str(uuid.uuid4()))
+        download_to(download_dir)
+        return os.path.join(download_dir, relative_artifact_version_path)
 
     def create(self, deployment_instance):
         try:
@@ -424,7 +1302,7 @@ class ServingEngine:
             print("Before making predictions, start the deployment by using `.start()`")
 
     def update(self, deployment_instance, await_update):
-        state = deployment_instance.get_state()
+        state = self.get_state(deployment_instance, refresh=True)
         if state is None:
             return
 
@@ -482,7 +1360,7 @@ class ServingEngine:
         self.update(deployment_instance, await_update)
 
     def delete(self, deployment_instance, force=False):
-        state = deployment_instance.get_state()
+        state = self.get_state(deployment_instance, refresh=True)
         if state is None:
             return
 
@@ -494,15 +1372,45 @@ class ServingEngine:
         self._serving_api.delete(deployment_instance)
         print("Deployment deleted successfully")
 
-    def get_state(self, deployment_instance):
+    def get_state(self, deployment_instance, refresh=False):
+        """Get the state of a deployment, fetched at most once per `state_ttl` seconds unless
+        refreshed. States fetched before are only downloaded again if they changed, when the
+        backend supports conditional requests."""
+        state = getattr(deployment_instance._predictor, "_state", None)
+        fetched_at = deployment_instance._state_fetched_at
+        if (
+            not refresh
+            and state is not None
+            and fetched_at is not None
+            and time.monotonic() - fetched_at < deployment_instance.state_ttl
+        ):
+            return state
+
+        etag = deployment_instance._state_etag if state is not None else None
         try:
-            state = self._serving_api.get_state(deployment_instance)
+            new_state, etag = self._serving_api.get_state(deployment_instance, etag)
         except RestAPIError as re:
             if re.error_code == ModelServingException.ERROR_CODE_SERVING_NOT_FOUND:
                 raise ModelServingException("Deployment not found")
             raise re
+        if new_state is None:  # not modified
+            deployment_instance._state_fetched_at = time.monotonic()
+            return state
+        self._set_state(deployment_instance, new_state)
+        deployment_instance._state_etag = etag
+        return new_state
+
+    def _set_state(self, deployment_instance, state):
+        previous_state = getattr(deployment_instance._predictor, "_state", None)
         deployment_instance._predictor._set_state(state)
-        return state
+        deployment_instance._state_fetched_at = time.monotonic()
+        deployment_instance._state_etag = None
+        if previous_state is None or previous_state.status != state.status:
+            deployment_instance._inference_routes.clear()
+
+    def _invalidate_state(self, deployment_instance):
+        # the state changes after an action, so it is fetched again on the next poll
+        deployment_instance._state_fetched_at = None
 
     def get_logs(self, deployment_instance, component, tail):
         state = self.get_state(deployment_instance)
@@ -531,3 +1439,33 @@ class ServingEngine:
         )
 
         return self._serving_api.get_logs(deployment_instance, component, tail)
+
+
+def _get_dtype(tensor_type):
+    """Get the NumPy dtype of a tensor type in a tensor schema, if it is a NumPy type."""
+    if tensor_type is None:
+        return None
+    try:
+        return np.dtype(tensor_type)
+    except TypeError:
+        return None
+
+
+def _get_deadline(timeout):
+    return time.monotonic() + timeout if timeout is not None else None
+
+
+def _get_remaining(deadline):
+    """Get the seconds left until the deadline, raising an error if it has passed."""
+    if deadline is None:
+        return None
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise _get_deadline_error()
+    return remaining
+
+
+def _get_deadline_error():
+    return ModelServingException(
+        "The inference request did not complete within the given timeout"
+    )
@@ -82,22 +82,72 @@ class Model:
 
         self._model_engine = model_engine.ModelEngine()
 
-    def save(self, model_path, await_registration=480):
+    def save(
+        self,
+        model_path,
+        await_registration=480,
+        upload_configuration: Optional[dict] = None,
+    ):
         """Persist this model including model files and metadata to the model registry.
 
+        If the upload of the model files is interrupted, the files uploaded so far are kept,
+        and saving the model again from the same client resumes the upload into the same model
+        version.
+
+        !!! example "Tuning the upload of large models"
+            ```python
+            my_model.save(
+                "/path/to/model_dir",
+                upload_configuration={
+                    "chunk_size": 8 * 1024 * 1024,  # bytes per chunk
+                    "simultaneous_uploads": 8,  # chunks uploaded concurrently
+                    "codec": "NONE",  # do not compress already compressed weights
+                    "deduplicate": True,  # reuse unchanged files of previous versions
+                },
+            )
+            ```
+
         # Arguments
             model_path: Local or remote (Hopsworks file system) path to the folder where the model files are located, or path to a specific model file.
             await_registration: Awaiting time for the model to be registered in Hopsworks.
+            upload_configuration: Configuration of the upload of local model files, with keys `chunk_size`
+                (size in bytes of each uploaded chunk), `simultaneous_uploads` (number of chunks uploaded concurrently),
+                `max_chunk_retries` (number of retries of a failed chunk), `chunk_retry_interval` (seconds between retries)
+                `resume` (whether to resume a previous, interrupted call, reusing the latest model version if not
+                registered yet and skipping the chunks already uploaded, by default only if the interrupted call
+                was made from this client) and `codec`
+                (compression of the uploaded archive: `NONE`, `GZIP` or `AUTO`, which only compresses the archive
+                if a relevant share of the model files is compressible, defaults to `AUTO`) and `deduplicate` (whether
+                to copy the files already present in the three latest versions of the model saved with deduplication,
+                instead of uploading them again, defaults to `False`).
 
         # Returns
             `Model`. The model metadata object.
         """
         return self._model_engine.save(
-            self, model_path, await_registration=await_registration
+            self,
+            model_path,
+            await_registration=await_registration,
+            upload_configuration=upload_configuration,
         )
 
     def download(self):
-        """Download the model files to a local folder."""
+        """Download the model files to a local folder.
+
+        The model files are downloaded into a new temporary folder, unless the local cache is
+        enabled by setting its location with the `HSML_CACHE_DIR` environment variable. Cached
+        files are reused by later downloads of the same model version, as long as its files
+        are unchanged. Since the returned folder may be shared with other processes, the files
+        in it should not be modified.
+
+        The cache evicts the least recently used models not in use by other running processes
+        when it exceeds 10 GiB, including the ones downloaded earlier by this process, whose
+        folders should therefore not be used after downloading many other models. The maximum
+        size (in bytes) can be set with the `HSML_CACHE_MAX_SIZE` environment variable.
+
+        # Returns
+            `str`: Absolute path to the local folder containing the model files.
+        """
         return self._model_engine.download(self)
 
     def delete(self):
@@ -14,12 +14,13 @@
 #   limitations under the License.
 #
 
-from typing import Union, Optional
+from typing import List, Union, Optional
 
 from hsml import util
 
 from hsml.constants import ARTIFACT_VERSION, PREDICTOR_STATE
 from hsml.core import serving_api
+from hsml.engine import serving_engine
 from hsml.model import Model
 from hsml.predictor import Predictor
 from hsml.deployment import Deployment
@@ -37,6 +38,7 @@ class ModelServing:
         self._project_id = project_id
 
         self._serving_api = serving_api.ServingApi()
+        self._serving_engine = serving_engine.ServingEngine()
 
     def get_deployment_by_id(self, id: int):
         """Get a deployment by id from Model Serving.
@@ -131,6 +133,157 @@ class ModelServing:
             )
         return status
 
+    def start_deployments(
+        self,
+        deployments: List[Union[Deployment, str]],
+        await_running: Optional[int] = 60,
+    ):
+        """Start many deployments at once.
+
+        Start requests are sent concurrently, and the states of all deployments are then fetched
+        together in a single request per poll, so that starting many deployments takes about as
+        long as starting the slowest of them.
+
+        !!! example
+            ```python
+            # login and get Hopsworks Model Serving handle using .login() and .get_model_serving()
+
+            report = ms.start_deployments(["fraud", "churn", "ranking"], await_running=300)
+
+            failed = [name for name, result in report.items() if result["error"] is not None]
+            ```
+
+        # Arguments
+            deployments: Deployments, or names of deployments, to start.
+            await_running: Awaiting time (seconds) for the deployments to start.
+                If the deployments are running before this time, the method returns earlier.
+        # Returns
+            `Dict[str, dict]`: Status and error, if any, of each deployment by name.
+        # Raises
+            `RestAPIError`: If unable to retrieve the deployments from model serving.
+        """
+
+        return self._serving_engine.start_all(deployments, await_running)
+
+    def stop_deployments(
+        self,
+        deployments: List[Union[Deployment, str]],
+        await_stopped: Optional[int] = 60,
+    ):
+        """Stop many deployments at once.
+
+        Stop requests are sent concurrently, and the states of all deployments are then fetched
+        together in a single request per poll.
+
+        # Arguments
+            deployments: Deployments, or names of deployments, to stop.
+            await_stopped: Awaiting time (seconds) for the deployments to stop.
+                If the deployments are stopped before this time, the method returns earlier.
+        # Returns
+            `Dict[str, dict]`: Status and error, if any, of each deployment by name.
+        # Raises
+            `RestAPIError`: If unable to retrieve the deployments from model serving.
+        """
+
+        return self._serving_engine.stop_all(deployments, await_stopped)
+
+    def update_deployments(
+        self, deployments: List[Deployment], await_update: Optional[int] = 60
+    ):
+        """Persist changes to many deployments at once, as `save()` does for a single deployment.
+
+        Updates are sent concurrently, and the states of all deployments are then fetched
+        together in a single request per poll until the running instances are updated.
+
+        !!! example
+            ```python
+            # login and get Hopsworks Model Serving handle using .login() and .get_model_serving()
+
+            deployments = ms.get_deployments(model=my_model)
+            for deployment in deployments:
+                deployment.model_version = 2
+
+            report = ms.update_deployments(deployments, await_update=300)
+            ```
+
+        # Arguments
+            deployments: Deployments to update.
+            await_update: Awaiting time (seconds) for the running instances to be updated.
+                If the running instances are updated before this time, the method returns earlier.
+        # Returns
+            `Dict[str, dict]`: Status and error, if any, of each deployment by name.
+        # Raises
+            `RestAPIError`: If unable to retrieve the deployments from model serving.
+        """
+
+        return self._serving_engine.update_all(deployments, await_update)
+
+    def watch(
+        self,
+        model: Model = None,
+        interval: Optional[float] = 1,
+        timeout: Optional[float] = None,
+    ):
+        """Watch the state of all deployments for changes.
+
+        The states of all deployments are fetched together in a single request every
+        `interval` seconds, and compared with the previous ones. The generator first yields an
+        `ADDED` change for each existing deployment, then a `MODIFIED` change whenever the
+        status, condition or available instances of a deployment change, an `ADDED` change for
+        each new deployment and a `DELETED` change for each deleted deployment.
+
+        !!! example
+            ```python
+            # login and get Hopsworks Model Serving handle using .login() and .get_model_serving()
+
+            for change in ms.watch(interval=5):
+                print(change.deployment_name, change.type, change.state)
+            ```
+
+        # Arguments
+            model: Filter by model served in the deployments
+            interval: Time (seconds) between fetches of the deployment states.
+            timeout: Time (seconds) to watch the deployments for. Defaults to watching until the
+                generator is closed.
+        # Returns
+            `Iterator[DeploymentStateChange]`: Changes in the state of the deployments.
+        # Raises
+            `RestAPIError`: If unable to retrieve deployments from model serving.
+        """
+
+        model_name = model.name if model is not None else None
+        return self._serving_engine.watch(model_name, interval, timeout)
+
+    def watch_async(
+        self,
+        model: Model = None,
+        interval: Optional[float] = 1,
+        timeout: Optional[float] = None,
+    ):
+        """Watch the state of all deployments for changes without blocking the event loop.
+
+        Same as `watch()`, as an asynchronous iterator.
+
+        !!! example
+            ```python
+            async for change in ms.watch_async(interval=5):
+                print(change.deployment_name, change.type, change.state)
+            ```
+
+        # Arguments
+            model: Filter by model served in the deployments
+            interval: Time (seconds) between fetches of the deployment states.
+            timeout: Time (seconds) to watch the deployments for. Defaults to watching until the
+                iterator is closed.
+        # Returns
+            `AsyncIterator[DeploymentStateChange]`: Changes in the state of the deployments.
+        # Raises
+            `RestAPIError`: If unable to retrieve deployments from model serving.
+        """
+
+        model_name = model.name if model is not None else None
+        return self._serving_engine.watch_async(model_name, interval, timeout)
+
     def get_inference_endpoints(self):
         """Get all inference endpoints available in the current project.
 
@@ -14,19 +14,21 @@
 #   limitations under the License.
 #
 
+import random
 import shutil
-import datetime
+import struct
 import inspect
 import humps
 
 import numpy as np
 import pandas as pd
-import os
+import time
 
 from urllib.parse import urljoin, urlparse
 from json import JSONEncoder, dumps
 
 from hsml import client
+from hsml.client import serialization
 from hsml.constants import DEFAULT, PREDICTOR, MODEL
 
 from hsml.tensorflow.model import Model as TFModel
@@ -64,30 +66,7 @@ class NumpyEncoder(JSONEncoder):
     """
 
     def convert(self, obj):
-        import pandas as pd
-        import numpy as np
-        import base64
-
-        def encode_binary(x):
-            return base64.encodebytes(x).decode("ascii")
-
-        if isinstance(obj, np.ndarray):
-            if obj.dtype == np.object:
-                return [self.convert(x)[0] for x in obj.tolist()]
-            elif obj.dtype == np.bytes_:
-                return np.vectorize(encode_binary)(obj), True
-            else:
-                return obj.tolist(), True
-
-        if isinstance(obj, (pd.Timestamp, datetime.date)):
-            return obj.isoformat(), True
-        if isinstance(obj, bytes) or isinstance(obj, bytearray):
-            return encode_binary(obj), True
-        if isinstance(obj, np.generic):
-            return obj.item(), True
-        if isinstance(obj, np.datetime64):
-            return np.datetime_as_string(obj), True
-        return obj, False
+        return serialization.convert(obj)
 
     def default(self, obj):  # pylint: disable=E0202
         res, converted = self.convert(obj)
@@ -177,20 +156,6 @@ def _handle_dict_input(input_ex):
 # - artifacts
 
 
-def compress(archive_out_path, archive_name, path_to_archive):
-    if os.path.isdir(path_to_archive):
-        return shutil.make_archive(
-            os.path.join(archive_out_path, archive_name), "gztar", path_to_archive
-        )
-    else:
-        return shutil.make_archive(
-            os.path.join(archive_out_path, archive_name),
-            "gztar",
-            os.path.dirname(path_to_archive),
-            os.path.basename(path_to_archive),
-        )
-
-
 def decompress(archive_file_path, extract_dir=None):
     return shutil.unpack_archive(archive_file_path, extract_dir=extract_dir)
 
@@ -265,6 +230,171 @@ def get_hostname_replaced_url(sub_path: str):
     return url_parsed.geturl()
 
 
+# - tensors (KServe v2 protocol and binary data extension)
+
+INFERENCE_HEADER_CONTENT_LENGTH = "Inference-Header-Content-Length"
+
+_TENSOR_DATATYPES = {
+    np.dtype(np.bool_): "BOOL",
+    np.dtype(np.uint8): "UINT8",
+    np.dtype(np.uint16): "UINT16",
+    np.dtype(np.uint32): "UINT32",
+    np.dtype(np.uint64): "UINT64",
+    np.dtype(np.int8): "INT8",
+    np.dtype(np.int16): "INT16",
+    np.dtype(np.int32): "INT32",
+    np.dtype(np.int64): "INT64",
+    np.dtype(np.float16): "FP16",
+    np.dtype(np.float32): "FP32",
+    np.dtype(np.float64): "FP64",
+}
+_TENSOR_DTYPES = {datatype: dtype for dtype, datatype in _TENSOR_DATATYPES.items()}
+
+
+class BinaryInferenceRequest:
+    """Body of an inference request with binary tensor data.
+
+    The body is a JSON header describing the input tensors, followed by the raw buffers of
+    the tensors. Buffers are not copied, the body is sent in parts by iterating over it.
+
+    :param inputs: input tensors, as a dictionary of names and arrays, or a single array
+        named `input-0`
+    :type inputs: Union[dict, np.ndarray]
+    """
+
+    def __init__(self, inputs):
+        if isinstance(inputs, np.ndarray):
+            inputs = {"input-0": inputs}
+        if not isinstance(inputs, dict) or len(inputs) == 0:
+            raise ValueError(
+                "Binary inference inputs must be a NumPy array or a dictionary of NumPy arrays"
+            )
+
+        header_inputs = []
+        self._buffers = []
+        for name, tensor in inputs.items():
+            datatype, buffer = _encode_tensor(np.asarray(tensor))
+            header_inputs.append(
+                {
+                    "name": name,
+                    "shape": list(np.shape(tensor)),
+                    "datatype": datatype,
+                    "parameters": {"binary_data_size": len(buffer)},
+                }
+            )
+            self._buffers.append(buffer)
+
+        self._header = dumps(
+            {"inputs": header_inputs, "parameters": {"binary_data_output": True}}
+        ).encode("utf-8")
+
+    @property
+    def header_length(self):
+        """Length in bytes of the JSON header."""
+        return len(self._header)
+
+    def __iter__(self):
+        yield self._header
+        yield from self._buffers
+
+    def __len__(self):
+        return self.header_length + sum(len(buffer) for buffer in self._buffers)
+
+
+def decode_inference_response(content, header_length=None):
+    """Decode an inference response, with or without binary tensor data.
+
+    :param content: body of the response
+    :type content: bytes
+    :param header_length: length of the JSON header, from the `Inference-Header-Content-Length`
+        response header. If None, the whole body is JSON.
+    :type header_length: Union[int, str]
+    :return: inference response, where the `data` of each output is a NumPy array
+    :rtype: dict
+    """
+    header_length = int(header_length) if header_length is not None else len(content)
+    response = serialization.loads(bytes(content[:header_length]))
+
+    offset = header_length
+    buffer = memoryview(content)
+    for output in response.get("outputs", []):
+        datatype = output["datatype"]
+        shape = output.get("shape", [])
+        parameters = output.get("parameters") or {}
+        if "binary_data_size" in parameters:
+            size = parameters.pop("binary_data_size")
+            output["data"] = _decode_tensor(
+                buffer[offset : offset + size], datatype, shape
+            )
+            offset += size
+        elif datatype == "BYTES":
+            output["data"] = np.array(output["data"], dtype=np.object_).reshape(shape)
+        else:
+            output["data"] = np.asarray(
+                output["data"], dtype=_TENSOR_DTYPES[datatype]
+            ).reshape(shape)
+    return response
+
+
+def get_tensor_datatype(tensor):
+    """Get the KServe v2 datatype of a NumPy array.
+
+    :param tensor: array
+    :type tensor: np.ndarray
+    :return: datatype, e.g., `FP32` or `BYTES` for strings and objects
+    :rtype: str
+    """
+    if tensor.dtype == np.object_ or tensor.dtype.kind in ("U", "S"):
+        return "BYTES"
+    dtype = (
+        tensor.dtype.newbyteorder("=") if tensor.dtype.itemsize > 1 else tensor.dtype
+    )
+    if dtype not in _TENSOR_DATATYPES:
+        raise ValueError(
+            "Tensors of type {} are not supported by the v2 inference protocol".format(
+                tensor.dtype
+            )
+        )
+    return _TENSOR_DATATYPES[dtype]
+
+
+def _encode_tensor(tensor):
+    datatype = get_tensor_datatype(tensor)
+    if datatype == "BYTES":
+        # BYTES elements are prefixed with their length as a 4-byte little-endian integer
+        parts = []
+        for element in tensor.flatten():
+            if isinstance(element, str):
+                element = element.encode("utf-8")
+            elif not isinstance(element, (bytes, bytearray)):
+                element = str(element).encode("utf-8")
+            parts.append(struct.pack("<I", len(element)))
+            parts.append(element)
+        return datatype, b"".join(parts)
+
+    # only copied if the tensor is not contiguous or not little-endian
+    dtype = (
+        tensor.dtype.newbyteorder("<") if tensor.dtype.itemsize > 1 else tensor.dtype
+    )
+    tensor = np.ascontiguousarray(tensor, dtype=dtype)
+    return datatype, memoryview(tensor).cast("B")
+
+
+def _decode_tensor(buffer, datatype, shape):
+    if datatype == "BYTES":
+        elements = []
+        offset = 0
+        while offset < len(buffer):
+            (length,) = struct.unpack_from("<I", buffer, offset)
+            offset += 4
+            elements.append(bytes(buffer[offset : offset + length]))
+            offset += length
+        return np.array(elements, dtype=np.object_).reshape(shape)
+    dtype = _TENSOR_DTYPES[datatype].newbyteorder("<")
+    # arrays are views of the response body, not copies
+    return np.frombuffer(buffer, dtype=dtype).reshape(shape)
+
+
 # General
 
 
@@ -286,6 +416,62 @@ def get_members(cls, prefix=None):
             yield m[1]  # value
 
 
+def poll(
+    fn,
+    timeout,
+    initial_interval=0.5,
+    max_interval=5,
+    fast_polls=3,
+    backoff=2,
+    jitter=0.2,
+    wait_fn=None,
+):
+    """Call a function until it returns a result, waiting longer between calls the longer
+    the result takes.
+
+    The first `fast_polls` calls are `initial_interval` seconds apart, so that short waits end
+    promptly, then the interval grows `backoff` times per call up to `max_interval`, so that
+    long waits do not flood the server with requests. Intervals vary randomly by `jitter`, to
+    spread the requests of many clients waiting at once, and the function is called a last time
+    when the timeout expires.
+
+    :param fn: function returning the result, or None if not available yet
+    :type fn: Callable[[], object]
+    :param timeout: maximum seconds to wait for the result
+    :type timeout: float
+    :param initial_interval: seconds between the first calls
+    :type initial_interval: float
+    :param max_interval: maximum seconds between calls
+    :type max_interval: float
+    :param fast_polls: number of calls before the interval grows
+    :type fast_polls: int
+    :param backoff: factor by which the interval grows
+    :type backoff: float
+    :param jitter: maximum relative variation of the intervals
+    :type jitter: float
+    :param wait_fn: function waiting up to the given seconds between calls, which can return
+        earlier when the result may be available, e.g., when notified by a long-poll request or
+        a push subscription. Defaults to `time.sleep`
+    :type wait_fn: Callable[[float], None]
+    :return: result of the function, or None if not available within the timeout
+    """
+    wait_fn = wait_fn if wait_fn is not None else time.sleep
+    deadline = time.monotonic() + timeout
+    interval = initial_interval
+    polls = 0
+    while True:
+        result = fn()
+        if result is not None:
+            return result
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return None
+        polls += 1
+        if polls > fast_polls:
+            interval = min(interval * backoff, max_interval)
+        wait_fn(min(interval * random.uniform(1 - jitter, 1 + jitter), remaining))
+
+
 # - json
 
 
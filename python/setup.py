@@ -43,6 +43,8 @@ setup(
         "tqdm"
     ],
     extras_require={
+        "orjson": ["orjson"],
+        "grpc": ["grpcio"],
         "dev": [
             "pytest",
             "flake8",
@@ -0,0 +1,55 @@
+#
+#   Copyright 2022 Logical Clocks AB
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+import types
+
+import pytest
+
+from hsml import client
+from hsml.client.istio import external as ist_external
+from tests.fakes import FakeClient, StubServer
+
+
+@pytest.fixture
+def fake_client(monkeypatch):
+    fake = FakeClient()
+    monkeypatch.setattr(client, "_hopsworks_client", fake)
+    return fake
+
+
+@pytest.fixture
+def serving(monkeypatch):
+    """Hopsworks and Istio clients sending requests to local stub servers."""
+    hopsworks, istio = StubServer(), StubServer()
+    # both paths are plain HTTP endpoints for the purpose of these tests
+    hopsworks_client = ist_external.Client("127.0.0.1", hopsworks.port, "test", "key")
+    hopsworks_client._project_id = 119
+    istio_client = ist_external.Client("127.0.0.1", istio.port, "test", "key")
+
+    monkeypatch.setattr(client, "_client_type", "external")
+    monkeypatch.setattr(client, "_hopsworks_client", hopsworks_client)
+    monkeypatch.setattr(client, "_istio_client", istio_client)
+    monkeypatch.setattr(client, "_health_checker", None)
+    monkeypatch.setattr(client, "_knative_domain", "example.com")
+    monkeypatch.setattr(
+        client,
+        "get_serving_resource_limits",
+        lambda: {"cores": -1, "memory": -1, "gpus": -1},
+    )
+    monkeypatch.setattr(client, "get_serving_num_instances_limits", lambda: [0, -1])
+    yield types.SimpleNamespace(hopsworks=hopsworks, istio=istio)
+    hopsworks.close()
+    istio.close()
@@ -0,0 +1,234 @@
+#
+#   Copyright 2022 Logical Clocks AB
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+import json
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from requests.structures import CaseInsensitiveDict
+
+from hsml.client.exceptions import RestAPIError
+from hsml.deployment import Deployment
+from hsml.predictor import Predictor
+from hsml.resources import PredictorResources
+
+
+class FakeResponse:
+    """Minimal stand-in for `requests.Response`."""
+
+    def __init__(self, status_code=200, content=b"", headers=None):
+        self.status_code = status_code
+        self.reason = ""
+        self.content = content
+        self.headers = CaseInsensitiveDict(headers or {})
+        self.closed = False
+
+    def json(self):
+        return json.loads(self.content)
+
+    def iter_content(self, chunk_size=1):
+        for i in range(0, len(self.content), chunk_size):
+            yield self.content[i : i + chunk_size]
+
+    def close(self):
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class FakeClient:
+    """Hopsworks client answering requests with a handler set by the test.
+
+    The handler is called with the method, the path params and the keyword arguments of
+    `_send_request`, and returns a `FakeResponse` or raises. Responses with an error status
+    code are raised as `RestAPIError`, like the real client does.
+    """
+
+    def __init__(self):
+        self._project_id = 119
+        self._project_name = "test"
+        self.handler = None
+        self.requests = []
+        self._lock = threading.Lock()
+
+    def _send_request(self, method, path_params, **kwargs):
+        with self._lock:
+            self.requests.append((method, path_params, kwargs))
+        response = self.handler(method, path_params, **kwargs)
+        if isinstance(response, FakeResponse) and response.status_code // 100 != 2:
+            raise RestAPIError(
+                "https://hopsworks/" + "/".join(map(str, path_params)), response
+            )
+        return response
+
+    def _get_host_port_pair(self):
+        return "hopsworks", 443
+
+
+class StubRequest:
+    def __init__(self, method, path, headers, body):
+        self.method = method
+        self.path = path
+        self.headers = headers
+        self.body = body
+
+    def json(self):
+        return json.loads(self.body)
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # headers and body are written separately, which would otherwise be delayed by the client
+    disable_nagle_algorithm = True
+
+    def _handle(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = StubRequest(
+            self.command,
+            self.path,
+            CaseInsensitiveDict(self.headers.items()),
+            self.rfile.read(length),
+        )
+        self.server.stub.requests.append(request)
+        status, body, headers = self.server.stub.handler(request)
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST = do_PUT = do_DELETE = _handle
+
+    def log_message(self, *args):
+        pass
+
+
+class StubServer:
+    """Local HTTP server answering requests with a handler set by the test.
+
+    The handler is called with a `StubRequest` and returns the status code, the body, as
+    bytes or JSON serializable object, and the headers of the response.
+    """
+
+    def __init__(self):
+        self.requests = []
+        self.handler = lambda request: (200, {}, None)
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _StubHandler)
+        self._server.stub = self
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, args=(0.01,), daemon=True
+        )
+        self._thread.start()
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def unused_port():
+    """Get a local port no server is listening on."""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def echo_predictions(request):
+    """Inference handler returning the instances of a request as predictions."""
+    return 200, {"predictions": request.json()["instances"]}, None
+
+
+def echo_tensors(request):
+    """Inference handler returning the input tensors of a v2 request as output tensors,
+    with binary data if the request has binary data."""
+    header_length = request.headers.get("Inference-Header-Content-Length")
+    if header_length is None:
+        body = request.json()
+        return 200, {"model_name": "mnist", "outputs": body["inputs"]}, None
+
+    header = json.loads(request.body[: int(header_length)])
+    response_header = json.dumps(
+        {"model_name": "mnist", "outputs": header["inputs"]}
+    ).encode("utf-8")
+    return (
+        200,
+        response_header + request.body[int(header_length) :],
+        {
+            "Content-Type": "application/octet-stream",
+            "Inference-Header-Content-Length": str(len(response_header)),
+        },
+    )
+
+
+def state_json(status, available_instances=1, condition=None):
+    """Deployment state in the format of the serving REST API."""
+    return {
+        "availableInstances": available_instances,
+        "hopsworksInferencePath": "/project/119/inference/models/mnist",
+        "modelServerInferencePath": "/v1/models/mnist",
+        "status": status,
+        "condition": condition,
+    }
+
+
+class StateHandler:
+    """Serving REST API handler answering deployment state requests with the current status,
+    tagged with an entity tag if set, and with 304 if the state has the requested tag.
+    Actions on the deployment are answered with an empty response."""
+
+    def __init__(self, status="Running", etag=None):
+        self.status = status
+        self.etag = etag
+
+    def __call__(self, request):
+        if request.method != "GET":
+            return 200, {}, None
+        if self.etag is not None and request.headers.get("If-None-Match") == self.etag:
+            return 304, b"", None
+        headers = {"ETag": self.etag} if self.etag is not None else None
+        return 200, state_json(self.status), headers
+
+
+def make_deployment(name="mnist", serving_tool="KSERVE"):
+    predictor = Predictor(
+        name,
+        "mnist",
+        "/Projects/test/Models/mnist",
+        1,
+        "SKLEARN",
+        1,
+        "PYTHON",
+        serving_tool=serving_tool,
+        resources=PredictorResources(
+            0,
+            {"cores": 1, "memory": 1024, "gpus": 0},
+            {"cores": 1, "memory": 1024, "gpus": 0},
+        ),
+        id=1,
+    )
+    return Deployment(predictor)
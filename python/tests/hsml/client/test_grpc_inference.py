@@ -0,0 +1,324 @@
+#
+#   Copyright 2022 Logical Clocks AB
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+import asyncio
+import struct
+from concurrent import futures
+
+import numpy as np
+import pytest
+
+from hsml.client import grpc_inference
+from hsml.client.exceptions import GrpcUnavailableError, ModelServingException
+from tests.fakes import echo_tensors, make_deployment, unused_port
+
+grpc = pytest.importorskip("grpc")
+
+
+class StubGrpcServer:
+    """In-process KServe v2 gRPC inference server, returning the input tensors of each
+    request as output tensors unless a response or an error status is set by the test."""
+
+    def __init__(self):
+        self.requests = []
+        self.response = None
+        self.status = None
+        self.ready = True
+        self._server = grpc.server(futures.ThreadPoolExecutor(max_workers=4))
+        self._server.add_generic_rpc_handlers(
+            [
+                grpc.method_handlers_generic_handler(
+                    grpc_inference.SERVICE,
+                    {
+                        "ModelInfer": grpc.unary_unary_rpc_method_handler(
+                            self._model_infer
+                        ),
+                        "ModelReady": grpc.unary_unary_rpc_method_handler(
+                            self._model_ready
+                        ),
+                    },
+                )
+            ]
+        )
+        self.port = self._server.add_insecure_port("127.0.0.1:0")
+        self._server.start()
+
+    def _model_infer(self, request, context):
+        message = grpc_inference._decode_model_infer(
+            request, grpc_inference._RAW_INPUT_CONTENTS
+        )
+        self.requests.append((message, dict(context.invocation_metadata())))
+        if self.status is not None:
+            context.abort(self.status, "stub error")
+        if self.response is not None:
+            return self.response
+        return grpc_inference._encode_model_infer(
+            message["model_name"],
+            {tensor["name"]: tensor["data"] for tensor in message["inputs"]},
+            grpc_inference._RAW_OUTPUT_CONTENTS,
+        )
+
+    def _model_ready(self, request, context):
+        if self.status is not None:
+            context.abort(self.status, "stub error")
+        return b"\x08\x01" if self.ready else b""
+
+    def close(self):
+        self._server.stop(None)
+
+
+@pytest.fixture
+def grpc_server():
+    server = StubGrpcServer()
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def grpc_client(grpc_server):
+    return grpc_inference.GrpcInferenceClient(
+        "127.0.0.1:{}".format(grpc_server.port), "mnist.test.example.com", "key"
+    )
+
+
+def typed_output(name, datatype, shape, contents):
+    """Encode an output tensor with typed contents instead of raw contents."""
+    return grpc_inference._encode_length_delimited(
+        5,
+        grpc_inference._encode_string(1, name)
+        + grpc_inference._encode_string(2, datatype)
+        + grpc_inference._encode_length_delimited(
+            3, b"".join(grpc_inference._encode_varint(dim) for dim in shape)
+        )
+        + grpc_inference._encode_length_delimited(5, contents),
+    )
+
+
+def packed(number, values):
+    return grpc_inference._encode_length_delimited(
+        number, b"".join(grpc_inference._encode_varint(v) for v in values)
+    )
+
+
+@pytest.mark.parametrize(
+    "tensor",
+    [
+        np.array([[-1, 2, -3]], dtype=np.int64),
+        np.array([-128, 127], dtype=np.int8),
+        np.arange(6, dtype=np.float32).reshape(3, 2),
+        np.array([1.5, -2.5], dtype=">f8"),
+        np.array([True, False]),
+        np.array(7, dtype=np.uint32),
+    ],
+)
+def test_request_round_trip(tensor):
+    message = grpc_inference._decode_model_infer(
+        grpc_inference.encode_model_infer_request("mnist", {"x": tensor}),
+        grpc_inference._RAW_INPUT_CONTENTS,
+    )
+
+    (decoded,) = message["inputs"]
+    assert message["model_name"] == "mnist"
+    assert decoded["name"] == "x"
+    assert decoded["shape"] == list(tensor.shape)
+    np.testing.assert_array_equal(decoded["data"], tensor)
+
+
+def test_request_round_trip_bytes_tensor():
+    tensor = np.array(["a", "", "déf"], dtype=np.object_)
+
+    message = grpc_inference._decode_model_infer(
+        grpc_inference.encode_model_infer_request("mnist", tensor),
+        grpc_inference._RAW_INPUT_CONTENTS,
+    )
+
+    (decoded,) = message["inputs"]
+    assert decoded["name"] == "input-0"
+    assert decoded["datatype"] == "BYTES"
+    assert decoded["data"].tolist() == [b"a", b"", "déf".encode("utf-8")]
+
+
+def test_request_rejects_unsupported_inputs():
+    with pytest.raises(ValueError):
+        grpc_inference.encode_model_infer_request("mnist", [1, 2])
+
+
+def test_decode_negative_dims():
+    response = grpc_inference._encode_string(1, "mnist") + typed_output(
+        "y", "INT32", [-1, 2], packed(2, [-1, 2, -3, 4])
+    )
+
+    (output,) = grpc_inference.decode_model_infer_response(response)["outputs"]
+
+    assert output["shape"] == [-1, 2]
+    assert output["data"].dtype == np.int32
+    assert output["data"].tolist() == [[-1, 2], [-3, 4]]
+
+
+def test_decode_typed_contents():
+    response = (
+        grpc_inference._encode_string(1, "mnist")
+        + grpc_inference._encode_string(2, "1")
+        + typed_output(
+            "fp32",
+            "FP32",
+            [2],
+            grpc_inference._encode_length_delimited(6, struct.pack("<2f", 1.5, -2)),
+        )
+        + typed_output(
+            "fp64", "FP64", [1], grpc_inference._encode_length_delimited(7, b"\0" * 8)
+        )
+        + typed_output("int64", "INT64", [2], packed(3, [-5, 6]))
+        + typed_output("bool", "BOOL", [2], packed(1, [1, 0]))
+        + typed_output(
+            "bytes",
+            "BYTES",
+            [2],
+            grpc_inference._encode_string(8, "a")
+            + grpc_inference._encode_string(8, "bc"),
+        )
+    )
+
+    message = grpc_inference.decode_model_infer_response(response)
+
+    assert message["model_name"] == "mnist"
+    assert message["model_version"] == "1"
+    outputs = {output["name"]: output["data"] for output in message["outputs"]}
+    assert outputs["fp32"].tolist() == [1.5, -2]
+    assert outputs["fp64"].tolist() == [0]
+    assert outputs["int64"].tolist() == [-5, 6]
+    assert outputs["bool"].tolist() == [True, False]
+    assert outputs["bytes"].tolist() == [b"a", b"bc"]
+
+
+def test_infer(grpc_server, grpc_client):
+    tensor = np.arange(4, dtype=np.float32).reshape(2, 2)
+
+    response = grpc_client.infer("mnist", {"x": tensor, "y": np.array(["a"])})
+
+    x, y = response["outputs"]
+    np.testing.assert_array_equal(x["data"], tensor)
+    assert y["data"].tolist() == [b"a"]
+    _, metadata = grpc_server.requests[0]
+    assert metadata["authorization"] == "ApiKey key"
+
+
+def test_infer_async(grpc_server, grpc_client):
+    async def infer_all():
+        return await asyncio.gather(
+            *[grpc_client.infer_async("mnist", np.array([i])) for i in range(4)]
+        )
+
+    responses = asyncio.run(infer_all())
+
+    assert [r["outputs"][0]["data"].tolist() for r in responses] == [
+        [i] for i in range(4)
+    ]
+
+
+def test_infer_typed_contents_response(grpc_server, grpc_client):
+    grpc_server.response = typed_output("y", "INT8", [3], packed(2, [-1, 0, 1]))
+
+    (output,) = grpc_client.infer("mnist", np.zeros(1))["outputs"]
+
+    assert output["data"].tolist() == [-1, 0, 1]
+
+
+def test_infer_unavailable(grpc_server, grpc_client):
+    grpc_server.status = grpc.StatusCode.UNAVAILABLE
+
+    with pytest.raises(GrpcUnavailableError):
+        grpc_client.infer("mnist", np.zeros(1))
+
+    assert not grpc_client.available
+
+
+def test_infer_async_unavailable(grpc_server, grpc_client):
+    grpc_server.status = grpc.StatusCode.UNAVAILABLE
+
+    with pytest.raises(GrpcUnavailableError):
+        asyncio.run(grpc_client.infer_async("mnist", np.zeros(1)))
+
+    assert not grpc_client.available
+
+
+def test_infer_error(grpc_server, grpc_client):
+    grpc_server.status = grpc.StatusCode.INVALID_ARGUMENT
+
+    with pytest.raises(ModelServingException) as e:
+        grpc_client.infer("mnist", np.zeros(1))
+
+    assert not isinstance(e.value, GrpcUnavailableError)
+    assert grpc_client.available
+
+
+def test_is_ready(grpc_server, grpc_client):
+    assert grpc_client.is_ready("mnist")
+    grpc_server.ready = False
+    assert not grpc_client.is_ready("mnist")
+    grpc_server.status = grpc.StatusCode.UNAVAILABLE
+    assert not grpc_client.is_ready("mnist")
+
+
+def test_predict_over_grpc(serving, grpc_server):
+    deployment = make_deployment()
+    deployment.enable_grpc(port=grpc_server.port)
+
+    response = deployment.predict(inputs=np.array([1, 2], dtype=np.int32))
+
+    assert response["outputs"][0]["data"].tolist() == [1, 2]
+    assert len(grpc_server.requests) == 1
+    assert serving.istio.requests == []
+
+
+def test_predict_falls_back_to_http_if_grpc_unavailable(serving, grpc_server):
+    serving.istio.handler = echo_tensors
+    grpc_server.status = grpc.StatusCode.UNAVAILABLE
+    deployment = make_deployment()
+    deployment.enable_grpc(port=grpc_server.port)
+
+    for _ in range(2):
+        response = deployment.predict(inputs=np.array([1, 2], dtype=np.int32))
+        assert response["outputs"][0]["data"].tolist() == [1, 2]
+
+    # the endpoint is not tried again until the reconnect interval passed
+    assert len(grpc_server.requests) == 1
+    assert [r.path for r in serving.istio.requests] == ["/v2/models/mnist/infer"] * 2
+
+
+def test_predict_async_falls_back_to_http_if_grpc_unreachable(serving):
+    serving.istio.handler = echo_tensors
+    deployment = make_deployment()
+    deployment.enable_grpc(port=unused_port(), timeout=5)
+
+    response = asyncio.run(deployment.predict_async(inputs=np.array([1.5])))
+
+    assert response["outputs"][0]["data"].tolist() == [1.5]
+    assert len(serving.istio.requests) == 1
+
+
+def test_predict_with_data_is_sent_over_http(serving, grpc_server):
+    serving.istio.handler = lambda request: (200, {"predictions": [1]}, None)
+    deployment = make_deployment()
+    deployment.enable_grpc(port=grpc_server.port)
+
+    assert deployment.predict(data={"instances": [[1]]}) == {"predictions": [1]}
+    assert grpc_server.requests == []
+
+
+def test_enable_grpc_requires_kserve(serving):
+    with pytest.raises(ModelServingException):
+        make_deployment(serving_tool="DEFAULT").enable_grpc()
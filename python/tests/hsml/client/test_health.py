@@ -0,0 +1,360 @@
+#
+#   Copyright 2022 Logical Clocks AB
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+import socket
+
+import numpy as np
+import pytest
+import requests
+
+from hsml import client
+from hsml.client import health
+from hsml.client.istio import external as ist_external
+from hsml.core import model_serving_api, serving_api
+from hsml.inference_endpoint import InferenceEndpoint, InferenceEndpointPort
+from tests.fakes import echo_predictions, make_deployment, unused_port
+
+ISTIO = health.HealthChecker.ISTIO
+HOPSWORKS = health.HealthChecker.HOPSWORKS
+
+
+@pytest.fixture
+def listener():
+    """Local port accepting connections."""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        s.listen()
+        yield s.getsockname()[1]
+
+
+@pytest.fixture
+def health_checker(serving, monkeypatch):
+    """Health checker of the inference paths of the stub servers, without background probes."""
+    checker = health.HealthChecker(interval=0, timeout=1)
+    checker.add_path(ISTIO, "127.0.0.1", serving.istio.port)
+    checker.add_path(HOPSWORKS, "127.0.0.1", serving.hopsworks.port)
+    monkeypatch.setattr(client, "_health_checker", checker)
+    return checker
+
+
+@pytest.fixture
+def unreachable_istio(serving, monkeypatch):
+    port = unused_port()
+    monkeypatch.setattr(
+        client, "_istio_client", ist_external.Client("127.0.0.1", port, "test", "key")
+    )
+    return port
+
+
+def test_path_unhealthy_after_max_failures():
+    path = health.PathHealth(max_failures=3)
+
+    path.record_failure(IOError("timeout"))
+    path.record_failure(IOError("timeout"))
+    assert path.healthy
+    path.record_failure(IOError("timeout"))
+    assert not path.healthy
+    assert path.to_dict()["last_error"] == "timeout"
+
+    path.record_success()
+    assert path.healthy
+
+
+def test_path_unhealthy_after_fatal_failure():
+    path = health.PathHealth(max_failures=3)
+
+    path.record_failure(IOError("refused"), fatal=True)
+
+    assert not path.healthy
+
+
+def test_path_latencies_averaged_separately():
+    path = health.PathHealth(max_failures=3)
+
+    path.record_success(latency=0.01)
+    path.record_success(inference_latency=0.1)
+    path.record_success(inference_latency=0.2)
+
+    assert path.latency == 0.01
+    assert path.inference_latency == pytest.approx(0.13)
+    assert path.to_dict()["last_checked"] is not None
+
+
+def test_path_unhealthy_before_checked():
+    assert not health.PathHealth(max_failures=3, healthy=False).healthy
+
+
+def test_check_tolerates_failed_probes_up_to_max_failures(listener):
+    checker = health.HealthChecker(interval=0, timeout=1, max_failures=2)
+    checker.add_path(ISTIO, "127.0.0.1", unused_port())
+    checker.add_path(HOPSWORKS, "127.0.0.1", listener)
+
+    checker.check()
+    assert checker.is_healthy(ISTIO)
+    checker.check()
+    assert not checker.is_healthy(ISTIO)
+    assert checker.is_healthy(HOPSWORKS)
+    assert checker.to_dict()[HOPSWORKS]["latency"] is not None
+
+
+def test_check_recovers_path(listener):
+    checker = health.HealthChecker(interval=0, timeout=1)
+    checker.add_path(ISTIO, "127.0.0.1", listener, healthy=False)
+
+    checker.check()
+
+    assert checker.is_healthy(ISTIO)
+
+
+def test_get_path_prefers_first_healthy_path():
+    checker = health.HealthChecker(interval=0)
+    checker.add_path(ISTIO, "127.0.0.1", 1)
+    checker.add_path(HOPSWORKS, "127.0.0.1", 2)
+
+    assert checker.get_path([ISTIO, HOPSWORKS]) == ISTIO
+    checker.record(ISTIO, IOError("refused"), fatal=True)
+    assert checker.get_path([ISTIO, HOPSWORKS]) == HOPSWORKS
+    checker.record(HOPSWORKS, IOError("refused"), fatal=True)
+    assert checker.get_path([ISTIO, HOPSWORKS]) == ISTIO
+
+
+def test_get_path_switches_to_path_connecting_twice_as_fast():
+    checker = health.HealthChecker(interval=0)
+    checker.add_path(ISTIO, "127.0.0.1", 1)
+    checker.add_path(HOPSWORKS, "127.0.0.1", 2)
+    checker._paths[ISTIO].record_success(latency=0.01)
+    checker._paths[HOPSWORKS].record_success(latency=0.006)
+    assert checker.get_path([ISTIO, HOPSWORKS]) == ISTIO
+
+    checker._paths[HOPSWORKS].record_success(latency=0.001)
+    assert checker.get_path([ISTIO, HOPSWORKS]) == HOPSWORKS
+
+
+def connected_paths(connect_latency=0.01):
+    checker = health.HealthChecker(interval=0)
+    checker.add_path(ISTIO, "127.0.0.1", 1)
+    checker.add_path(HOPSWORKS, "127.0.0.1", 2)
+    checker._paths[ISTIO].record_success(latency=connect_latency)
+    checker._paths[HOPSWORKS].record_success(latency=connect_latency)
+    return checker
+
+
+def test_get_path_by_inference_latency():
+    checker = connected_paths()
+
+    checker.record(ISTIO, latency=0.1)
+    checker.record(HOPSWORKS, latency=0.06)
+    assert checker.get_path([ISTIO, HOPSWORKS]) == ISTIO
+
+    checker.record(ISTIO, latency=0.2)
+    checker.record(HOPSWORKS, latency=0.02)
+    assert checker.get_path([ISTIO, HOPSWORKS]) == HOPSWORKS
+
+
+def test_get_path_tries_other_path_if_inference_is_slow():
+    checker = connected_paths()
+
+    checker.record(ISTIO, latency=0.1)
+
+    # the other path is only scored by its connection latency until it is used
+    assert checker.get_path([ISTIO, HOPSWORKS]) == HOPSWORKS
+    checker.record(HOPSWORKS, latency=0.1)
+    assert checker.get_path([ISTIO, HOPSWORKS]) == ISTIO
+
+
+def test_get_path_by_error_rate():
+    checker = connected_paths()
+    for _ in range(5):
+        checker.record(ISTIO, latency=0.01)
+        checker.record(HOPSWORKS, latency=0.01)
+    assert checker.get_path([ISTIO, HOPSWORKS]) == ISTIO
+
+    for _ in range(10):
+        checker.record(ISTIO, IOError("bad gateway"))
+    checker.record(ISTIO, latency=0.01)
+
+    assert checker.is_healthy(ISTIO)
+    assert checker.to_dict()[ISTIO]["error_rate"] > 0.5
+    assert checker.to_dict()[HOPSWORKS]["error_rate"] == 0
+    assert checker.get_path([ISTIO, HOPSWORKS]) == HOPSWORKS
+
+
+def test_probe_failures_do_not_count_as_errors():
+    path = health.PathHealth(max_failures=3)
+
+    path.record_failure(IOError("timeout"))
+
+    assert path.error_rate == 0
+
+
+def test_check_interval_from_environment(monkeypatch):
+    monkeypatch.setenv(health.HealthChecker.CHECK_INTERVAL, "0")
+
+    checker = health.HealthChecker()
+    checker.start()
+
+    assert checker._thread is None
+    assert not client.is_health_check_enabled()
+
+
+def test_background_probes(listener):
+    checker = health.HealthChecker(interval=0.01, timeout=1)
+    checker.add_path(ISTIO, "127.0.0.1", listener, healthy=False)
+
+    checker.start()
+    try:
+        for _ in range(100):
+            if checker.is_healthy(ISTIO):
+                break
+            checker._stop_event.wait(0.01)
+    finally:
+        checker.stop()
+
+    assert checker.is_healthy(ISTIO)
+
+
+def test_predict_records_inference_latency(serving, health_checker):
+    serving.istio.handler = echo_predictions
+
+    make_deployment().predict(inputs=[[1]])
+
+    assert health_checker.to_dict()[ISTIO]["inference_latency"] > 0
+    assert health_checker.to_dict()[HOPSWORKS]["inference_latency"] is None
+
+
+def test_binary_predict_records_inference_latency(serving, health_checker):
+    serving.istio.handler = lambda request: (200, {"outputs": []}, None)
+
+    make_deployment().predict(inputs=np.zeros(1), binary=True)
+
+    assert health_checker.to_dict()[ISTIO]["inference_latency"] > 0
+
+
+def test_predict_fails_over_to_hopsworks(
+    serving, health_checker, unreachable_istio, monkeypatch
+):
+    serving.hopsworks.handler = echo_predictions
+    health_checker._addresses[ISTIO] = ("127.0.0.1", unreachable_istio)
+    deployment = make_deployment()
+
+    assert deployment.predict(inputs=[[1]]) == {"predictions": [[1]]}
+    assert not health_checker.is_healthy(ISTIO)
+    assert health_checker.to_dict()[HOPSWORKS]["inference_latency"] > 0
+
+    # unhealthy paths are not tried
+    monkeypatch.setattr(
+        serving_api.ServingApi,
+        "_get_failover_route",
+        lambda *args: pytest.fail("request sent to the unhealthy path"),
+    )
+    assert deployment.predict(inputs=[[2]]) == {"predictions": [[2]]}
+    assert len(serving.hopsworks.requests) == 2
+
+
+def test_predict_fails_over_to_hopsworks_without_health_checks(
+    serving, unreachable_istio
+):
+    serving.hopsworks.handler = echo_predictions
+
+    response = make_deployment().predict(inputs=[[1]])
+
+    assert response == {"predictions": [[1]]}
+    assert len(serving.hopsworks.requests) == 1
+
+
+def test_predict_does_not_fail_over_explicit_path(serving, unreachable_istio):
+    with pytest.raises(requests.ConnectionError):
+        serving_api.ServingApi().send_inference_request(
+            make_deployment(), {"instances": [[1]]}, through_hopsworks=False
+        )
+
+    assert serving.hopsworks.requests == []
+
+
+def test_binary_predict_records_connection_errors(
+    serving, health_checker, unreachable_istio
+):
+    with pytest.raises(requests.ConnectionError):
+        make_deployment().predict(inputs=np.zeros(1), binary=True)
+
+    assert not health_checker.is_healthy(ISTIO)
+    assert serving.hopsworks.requests == []
+
+
+def node_port_endpoints(port):
+    return [
+        InferenceEndpoint("NODE", ["127.0.0.1"], [InferenceEndpointPort("HTTP", port)])
+    ]
+
+
+@pytest.fixture
+def serving_configuration(serving, monkeypatch):
+    monkeypatch.setattr(client, "_istio_client", None)
+    monkeypatch.setattr(client, "_kserve_installed", True)
+    api = model_serving_api.ModelServingApi()
+    return api
+
+
+def test_unreachable_istio_client_set_if_health_checked(
+    serving_configuration, monkeypatch
+):
+    monkeypatch.delenv(health.HealthChecker.CHECK_INTERVAL, raising=False)
+    monkeypatch.setattr(
+        serving_configuration._serving_api,
+        "get_inference_endpoints",
+        lambda: node_port_endpoints(unused_port()),
+    )
+
+    assert not serving_configuration._set_istio_client_if_available()
+    assert client.get_istio_instance() is not None
+
+
+def test_unreachable_istio_client_not_set_without_health_checks(
+    serving_configuration, monkeypatch
+):
+    monkeypatch.setenv(health.HealthChecker.CHECK_INTERVAL, "0")
+    monkeypatch.setattr(
+        serving_configuration._serving_api,
+        "get_inference_endpoints",
+        lambda: node_port_endpoints(unused_port()),
+    )
+
+    assert not serving_configuration._set_istio_client_if_available()
+    assert client.get_istio_instance() is None
+    # v1 requests go through hopsworks, and v2 requests fail instead of not connecting
+    assert client.get_inference_path() == HOPSWORKS
+
+
+def test_reachable_istio_client_set_without_health_checks(
+    serving_configuration, listener, monkeypatch
+):
+    monkeypatch.setenv(health.HealthChecker.CHECK_INTERVAL, "0")
+    monkeypatch.setattr(
+        serving_configuration._serving_api,
+        "get_inference_endpoints",
+        lambda: node_port_endpoints(listener),
+    )
+
+    assert serving_configuration._set_istio_client_if_available()
+    assert client.get_istio_instance()._port == listener
+
+
+def test_health_checks_not_started_if_disabled(serving, monkeypatch):
+    monkeypatch.setenv(health.HealthChecker.CHECK_INTERVAL, "0")
+
+    client.start_health_checks()
+
+    assert client.get_health_checker() is None
@@ -0,0 +1,151 @@
+#
+#   Copyright 2022 Logical Clocks AB
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+import datetime
+import json
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from hsml.client import serialization
+
+
+@pytest.fixture(params=[serialization.CODEC_JSON, serialization.CODEC_ORJSON])
+def codec(request, monkeypatch):
+    if request.param == serialization.CODEC_ORJSON and serialization.orjson is None:
+        pytest.skip("orjson is not installed")
+    monkeypatch.setenv(serialization.JSON_CODEC, request.param)
+    assert serialization.get_codec() == request.param
+    return request.param
+
+
+def round_trip(obj):
+    return json.loads(serialization.dumps(obj))
+
+
+def test_dumps_numpy(codec):
+    obj = {
+        "instances": np.arange(6, dtype=np.float32).reshape(2, 3),
+        "id": np.int64(3),
+        "flag": np.bool_(True),
+    }
+
+    assert round_trip(obj) == {
+        "instances": [[0, 1, 2], [3, 4, 5]],
+        "id": 3,
+        "flag": True,
+    }
+
+
+@pytest.mark.parametrize(
+    "obj",
+    [
+        np.arange(3, dtype=">i4"),
+        [np.arange(3, dtype=">i4")],
+        [1, np.arange(3, dtype=">i4")],
+        {"x": [1, np.arange(3, dtype=">i4")]},
+        ("a", {"x": np.arange(3, dtype=">f8")}),
+    ],
+)
+def test_dumps_non_native_byte_order(codec, obj):
+    assert round_trip({"x": obj}) == json.loads(
+        json.dumps({"x": obj}, cls=serialization._JSONEncoder)
+    )
+
+
+def test_dumps_mixed_list_with_big_endian_array(codec):
+    assert round_trip({"x": [1, np.arange(3, dtype=">i4")]}) == {"x": [1, [0, 1, 2]]}
+
+
+def test_dumps_object_array(codec):
+    obj = np.array([1, "a", b"b", np.arange(2, dtype=">i2")], dtype=np.object_)
+
+    assert round_trip(obj) == [1, "a", "Yg==\n", [0, 1]]
+
+
+def test_dumps_dates_and_bytes(codec):
+    obj = {
+        "date": datetime.date(2022, 1, 2),
+        "timestamp": pd.Timestamp("2022-01-02T03:04:05"),
+        "bytes": b"abc",
+    }
+
+    assert round_trip(obj) == {
+        "date": "2022-01-02",
+        "timestamp": "2022-01-02T03:04:05",
+        "bytes": "YWJj\n",
+    }
+
+
+@pytest.mark.parametrize(
+    "obj",
+    [
+        float("nan"),
+        [1.0, float("inf")],
+        [1, [2.0, -math.inf]],
+        {"x": np.float32("nan")},
+        np.array([1.0, np.nan]),
+        [np.array([np.inf], dtype=">f8")],
+        np.array([1, float("nan")], dtype=np.object_),
+    ],
+)
+def test_dumps_non_finite_floats_like_json_module(codec, obj):
+    document = serialization.dumps({"x": obj}).decode("utf-8")
+
+    assert "null" not in document
+    assert document == json.dumps({"x": obj}, cls=serialization._JSONEncoder)
+
+
+def test_dumps_large_floats(codec):
+    # their sum overflows, but they are finite
+    assert round_trip([1e308, 1e308]) == [1e308, 1e308]
+
+
+def test_dumps_integers_out_of_64_bit_range(codec):
+    assert round_trip({"x": 2**70}) == {"x": 2**70}
+
+
+def test_dumps_unsupported_object(codec):
+    with pytest.raises(TypeError):
+        serialization.dumps({"x": object()})
+
+
+def test_loads(codec):
+    assert serialization.loads(b'{"a": [1, 2.5, "b", null]}') == {
+        "a": [1, 2.5, "b", None]
+    }
+    assert serialization.loads('{"a": 1}') == {"a": 1}
+
+
+def test_loads_non_finite_floats(codec):
+    obj = serialization.loads(b'{"a": NaN, "b": Infinity, "c": -Infinity}')
+
+    assert math.isnan(obj["a"])
+    assert obj["b"] == math.inf
+    assert obj["c"] == -math.inf
+
+
+def test_loads_invalid_document(codec):
+    with pytest.raises(ValueError):
+        serialization.loads(b'{"a": ')
+
+
+def test_codec_disabled_by_environment(monkeypatch):
+    monkeypatch.setenv(serialization.JSON_CODEC, "JSON")
+
+    assert serialization.get_codec() == serialization.CODEC_JSON
@@ -0,0 +1,163 @@
+#
+#   Copyright 2022 Logical Clocks AB
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from hsml.client import transport
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.server.requests.append(self.headers.get("Range"))
+        status = self.server.statuses.pop(0) if self.server.statuses else 200
+        body = b"ok"
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.do_GET()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.requests = []
+    server.statuses = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def url(server):
+    return "http://127.0.0.1:{}/".format(server.server_address[1])
+
+
+def test_session_retries_unavailable_responses(server):
+    server.statuses = [503, 503]
+    session = transport.create_session(max_retries=3, backoff_factor=0)
+
+    response = session.get(url(server))
+
+    assert response.status_code == 200
+    assert len(server.requests) == 3
+
+
+def test_session_does_not_retry_range_requests(server):
+    server.statuses = [503, 503]
+    session = transport.create_session(max_retries=3, backoff_factor=0)
+
+    response = session.get(url(server), headers={"Range": "bytes=0-1"})
+
+    assert response.status_code == 503
+    assert server.requests == ["bytes=0-1"]
+
+
+def test_session_reuses_connections(server):
+    session = transport.create_session()
+
+    for _ in range(5):
+        session.get(url(server))
+
+    metrics = transport.get_metrics(session)
+    assert metrics["requests"] == 5
+    assert metrics["pool_misses"] == 1
+    assert metrics["pool_hits"] == 4
+
+
+def test_range_requests_share_connection_pools(server):
+    session = transport.create_session()
+
+    session.get(url(server))
+    session.get(url(server), headers={"Range": "bytes=0-1"})
+
+    assert transport.get_metrics(session)["pool_misses"] == 1
+
+
+def test_session_does_not_retry_non_idempotent_requests(server):
+    server.statuses = [503, 503]
+    session = transport.create_session(max_retries=3, backoff_factor=0)
+
+    response = session.post(url(server), data=b"{}")
+
+    assert response.status_code == 503
+    assert len(server.requests) == 1
+
+
+def test_adapter_settings_from_environment(monkeypatch):
+    monkeypatch.setenv(transport.PooledHTTPAdapter.POOL_MAXSIZE, "5")
+    monkeypatch.setenv(transport.PooledHTTPAdapter.MAX_RETRIES, "7")
+
+    adapter = transport.PooledHTTPAdapter()
+
+    assert adapter._pool_maxsize == 5
+    assert adapter.max_retries.total == 7
+    assert transport.PooledHTTPAdapter(max_retries=1).max_retries.total == 1
+
+
+def test_retry_with_urllib3_before_1_26(monkeypatch):
+    class LegacyRetry:
+        DEFAULT_METHOD_WHITELIST = frozenset(["GET", "PUT"])
+
+        def __init__(self, method_whitelist, **kwargs):
+            self.method_whitelist = method_whitelist
+            self.total = kwargs["total"]
+
+    monkeypatch.setattr(transport, "Retry", LegacyRetry)
+
+    retry = transport._create_retry(total=3)
+
+    assert retry.method_whitelist == frozenset(["GET", "PUT"])
+    assert retry.total == 3
+
+
+def test_executor_is_shared():
+    assert transport.get_executor() is transport.get_executor()
+
+
+@pytest.fixture
+def async_executor(monkeypatch):
+    """Creates the executor of asynchronous requests again, with the settings of the test."""
+    monkeypatch.setattr(transport, "_async_executor", None)
+    yield
+    if transport._async_executor is not None:
+        transport._async_executor.shutdown()
+
+
+def test_async_executor_is_separate(async_executor):
+    executor = transport.get_async_executor()
+
+    assert executor is transport.get_async_executor()
+    assert executor is not transport.get_executor()
+    assert executor._max_workers == transport.DEFAULT_ASYNC_MAX_WORKERS
+
+
+def test_async_executor_size_from_environment(async_executor, monkeypatch):
+    monkeypatch.setenv(transport.ASYNC_MAX_WORKERS, "3")
+
+    assert transport.get_async_executor()._max_workers == 3
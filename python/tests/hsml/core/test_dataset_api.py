@@ -0,0 +1,325 @@
+#
+#   Copyright 2022 Logical Clocks AB
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+import os
+import threading
+import time
+
+import pytest
+
+from hsml.client.exceptions import RestAPIError
+from hsml.core import dataset_api
+from tests.fakes import FakeResponse
+
+
+@pytest.fixture(autouse=True)
+def manifests_dir(tmp_path, monkeypatch):
+    path = str(tmp_path / "manifests")
+    monkeypatch.setattr(dataset_api.UploadManifest, "MANIFESTS_DIR", path)
+    return path
+
+
+@pytest.fixture
+def local_file(tmp_path):
+    path = tmp_path / "model.bin"
+    path.write_bytes(bytes(range(10)))
+    return str(path)
+
+
+class FlowServer:
+    """Flow upload endpoint keeping the chunks it received."""
+
+    def __init__(self, fail=None):
+        self.chunks = {}
+        self.fail = fail or {}  # chunk number -> status codes returned on next posts
+        self.lock = threading.Lock()
+        self.active = 0
+        self.max_active = 0
+        self.delay = 0
+
+    def __call__(self, method, path_params, **kwargs):
+        if method == "GET":
+            params = kwargs["query_params"]
+            return FakeResponse(
+                200 if params["flowChunkNumber"] in self.chunks else 204
+            )
+        params = kwargs["data"]
+        number = params["flowChunkNumber"]
+        with self.lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            time.sleep(self.delay)
+            if self.fail.get(number):
+                return FakeResponse(self.fail[number].pop(0))
+            self.chunks[number] = kwargs["files"]["file"][1]
+            return FakeResponse(200)
+        finally:
+            with self.lock:
+                self.active -= 1
+
+    def content(self):
+        return b"".join(self.chunks[n] for n in sorted(self.chunks))
+
+    def posts(self, fake_client):
+        return [
+            r[2]["data"]["flowChunkNumber"]
+            for r in fake_client.requests
+            if r[0] == "POST"
+        ]
+
+
+def test_upload_splits_file_into_flow_chunks(fake_client, local_file):
+    server = FlowServer()
+    fake_client.handler = server
+
+    dataset_api.DatasetApi().upload(local_file, "Models/mnist/1", chunk_size=4)
+
+    assert server.content() == bytes(range(10))
+    assert sorted(server.posts(fake_client)) == [1, 2, 3]
+    params = fake_client.requests[0][2]["data"]
+    assert params["flowTotalChunks"] == 3
+    assert params["flowTotalSize"] == 10
+    assert params["flowIdentifier"] == "10_model.bin"
+
+
+def test_upload_sends_chunks_concurrently(fake_client, tmp_path):
+    path = tmp_path / "model.bin"
+    path.write_bytes(b"x" * 64)
+    server = FlowServer()
+    server.delay = 0.05
+    fake_client.handler = server
+
+    dataset_api.DatasetApi().upload(
+        str(path), "Models/mnist/1", chunk_size=4, simultaneous_uploads=3
+    )
+
+    assert len(server.chunks) == 16
+    assert 1 < server.max_active <= 3
+
+
+def test_upload_retries_failed_chunks(fake_client, local_file):
+    server = FlowServer(fail={2: [500, 503]})
+    fake_client.handler = server
+
+    dataset_api.DatasetApi().upload(
+        local_file, "Models/mnist/1", chunk_size=4, chunk_retry_interval=0
+    )
+
+    assert server.content() == bytes(range(10))
+    assert server.posts(fake_client).count(2) == 3
+
+
+def test_upload_does_not_retry_client_errors(fake_client, local_file):
+    server = FlowServer(fail={2: [400]})
+    fake_client.handler = server
+
+    with pytest.raises(RestAPIError):
+        dataset_api.DatasetApi().upload(
+            local_file, "Models/mnist/1", chunk_size=4, chunk_retry_interval=0
+        )
+
+    assert server.posts(fake_client).count(2) == 1
+
+
+def test_upload_rejects_invalid_chunk_size(fake_client, local_file):
+    with pytest.raises(ValueError):
+        dataset_api.DatasetApi().upload(local_file, "Models/mnist/1", chunk_size=0)
+
+
+def test_upload_resumes_from_acknowledged_chunks(
+    fake_client, local_file, manifests_dir
+):
+    server = FlowServer(fail={3: [400]})
+    fake_client.handler = server
+    with pytest.raises(RestAPIError):
+        dataset_api.DatasetApi().upload(
+            local_file, "Models/mnist/1", chunk_size=4, simultaneous_uploads=1
+        )
+    assert len(os.listdir(manifests_dir)) == 1
+
+    fake_client.requests.clear()
+    dataset_api.DatasetApi().upload(
+        local_file, "Models/mnist/1", chunk_size=4, simultaneous_uploads=1
+    )
+
+    assert server.posts(fake_client) == [3]
+    assert server.content() == bytes(range(10))
+    assert os.listdir(manifests_dir) == []
+
+
+def test_upload_resends_acknowledged_chunks_missing_on_server(fake_client, local_file):
+    server = FlowServer(fail={3: [400]})
+    fake_client.handler = server
+    with pytest.raises(RestAPIError):
+        dataset_api.DatasetApi().upload(
+            local_file, "Models/mnist/1", chunk_size=4, simultaneous_uploads=1
+        )
+
+    del server.chunks[1]  # e.g., expired on the server
+    fake_client.requests.clear()
+    dataset_api.DatasetApi().upload(
+        local_file, "Models/mnist/1", chunk_size=4, simultaneous_uploads=1
+    )
+
+    assert server.posts(fake_client) == [1, 3]
+    assert server.content() == bytes(range(10))
+
+
+def test_walk_pages_through_nested_directories(fake_client):
+    listings = {
+        "Models/mnist": [
+            {"path": "Models/mnist/1", "dir": True},
+            {"path": "Models/mnist/README.md", "dir": False},
+        ],
+        "Models/mnist/1": [{"path": "Models/mnist/1/model.pkl", "dir": False}],
+    }
+
+    def handler(method, path_params, **kwargs):
+        items = listings[path_params[-1]]
+        offset = kwargs["query_params"]["offset"]
+        limit = kwargs["query_params"]["limit"]
+        return {
+            "count": len(items),
+            "items": [{"attributes": a} for a in items[offset : offset + limit]],
+        }
+
+    fake_client.handler = handler
+
+    entries = list(dataset_api.DatasetApi().walk("Models/mnist", page_size=1))
+
+    assert [e["path"] for e in entries] == [
+        "Models/mnist/1",
+        "Models/mnist/1/model.pkl",
+        "Models/mnist/README.md",
+    ]
+
+
+class RangeServer:
+    """Download endpoint serving byte ranges of a file."""
+
+    def __init__(self, content, support_ranges=True):
+        self.content = content
+        self.support_ranges = support_ranges
+        self.truncate = set()  # first bytes of ranges truncated on their next request
+        self.ranges = []
+
+    def __call__(self, method, path_params, **kwargs):
+        headers = kwargs.get("headers") or {}
+        if "Range" not in headers or not self.support_ranges:
+            return FakeResponse(200, self.content)
+        first, last = map(int, headers["Range"][len("bytes=") :].split("-"))
+        self.ranges.append((first, last))
+        if first >= len(self.content):
+            return FakeResponse(
+                416, headers={"Content-Range": "bytes */{}".format(len(self.content))}
+            )
+        last = min(last, len(self.content) - 1)
+        data = self.content[first : last + 1]
+        if first in self.truncate:
+            self.truncate.discard(first)
+            data = data[: len(data) // 2]
+        return FakeResponse(
+            206,
+            data,
+            {"Content-Range": "bytes {}-{}/{}".format(first, last, len(self.content))},
+        )
+
+
+def download(fake_client, tmp_path, server, **kwargs):
+    fake_client.handler = server
+    local_path = str(tmp_path / "downloaded")
+    dataset_api.DatasetApi().download("Models/mnist/1/model.bin", local_path, **kwargs)
+    with open(local_path, "rb") as f:
+        return f.read()
+
+
+def test_download_in_concurrent_ranges(fake_client, tmp_path):
+    content = os.urandom(1000)
+    server = RangeServer(content)
+
+    assert download(fake_client, tmp_path, server, range_size=64) == content
+    assert sorted(server.ranges) == [
+        (first, min(first + 63, 999)) for first in range(0, 1000, 64)
+    ]
+
+
+def test_download_file_smaller_than_range(fake_client, tmp_path):
+    server = RangeServer(b"model")
+
+    assert download(fake_client, tmp_path, server, range_size=64) == b"model"
+    assert server.ranges == [(0, 63)]
+
+
+def test_download_without_range_support(fake_client, tmp_path):
+    content = os.urandom(1000)
+    server = RangeServer(content, support_ranges=False)
+
+    assert download(fake_client, tmp_path, server, range_size=64) == content
+    assert len(fake_client.requests) == 1
+
+
+def test_download_empty_file(fake_client, tmp_path):
+    server = RangeServer(b"")
+
+    assert download(fake_client, tmp_path, server, range_size=64) == b""
+    assert "Range" not in (fake_client.requests[-1][2]["headers"] or {})
+
+
+def test_download_resumes_incomplete_ranges(fake_client, tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        dataset_api.DatasetApi, "DEFAULT_UPLOAD_CHUNK_RETRY_INTERVAL", 0
+    )
+    content = os.urandom(1000)
+    server = RangeServer(content)
+    server.truncate = {0, 128}
+
+    assert download(fake_client, tmp_path, server, range_size=64) == content
+    assert (32, 63) in server.ranges
+    assert (160, 191) in server.ranges
+
+
+def test_download_fails_after_max_range_retries(fake_client, tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        dataset_api.DatasetApi, "DEFAULT_UPLOAD_CHUNK_RETRY_INTERVAL", 0
+    )
+    server = RangeServer(os.urandom(1000))
+
+    def handler(method, path_params, **kwargs):
+        if kwargs["headers"]["Range"].startswith("bytes=128-"):
+            return FakeResponse(503)
+        return server(method, path_params, **kwargs)
+
+    with pytest.raises(RestAPIError):
+        download(fake_client, tmp_path, handler, range_size=64, max_range_retries=2)
+
+
+def test_upload_manifest_exists(manifests_dir):
+    params = dataset_api.DatasetApi()._get_flow_base_params("1.tar", 1, 10)
+    assert not dataset_api.UploadManifest.exists("Models/mnist", {"1.tar"})
+
+    manifest = dataset_api.UploadManifest("Models/mnist", params)
+    manifest.open({})
+    manifest.close()
+    with open(os.path.join(manifests_dir, "truncated"), "w") as f:
+        f.write('{"uploadPath": "Models/mnist"')
+
+    assert dataset_api.UploadManifest.exists("Models/mnist", {"1.tar", "1.tar.gz"})
+    assert not dataset_api.UploadManifest.exists("Models/mnist", {"2.tar"})
+    assert not dataset_api.UploadManifest.exists("Models/other", {"1.tar"})
+
+    manifest.remove()
+    assert not dataset_api.UploadManifest.exists("Models/mnist", {"1.tar"})
@@ -0,0 +1,208 @@
+#
+#   Copyright 2022 Logical Clocks AB
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+import numpy as np
+import pytest
+
+from hsml import client
+from hsml.client import auth
+from hsml.client import base as client_base
+from hsml.client.istio import external as ist_external
+from hsml.core import serving_api
+from tests.fakes import (
+    StateHandler,
+    echo_predictions,
+    echo_tensors,
+    make_deployment,
+    state_json,
+)
+
+
+@pytest.fixture
+def prepared_routes(monkeypatch):
+    """Routes prepared by clients, in order."""
+    routes = []
+    prepare_route = client_base.Client._prepare_route
+
+    def _prepare_route(self, *args, **kwargs):
+        routes.append(prepare_route(self, *args, **kwargs))
+        return routes[-1]
+
+    monkeypatch.setattr(client_base.Client, "_prepare_route", _prepare_route)
+    return routes
+
+
+def test_route_prepared_once_per_deployment(serving, prepared_routes):
+    serving.istio.handler = echo_predictions
+    deployment = make_deployment()
+
+    for i in range(3):
+        assert deployment.predict(inputs=[[i]]) == {"predictions": [[i]]}
+
+    assert len(prepared_routes) == 1
+    assert prepared_routes[0].url.endswith("/v1/models/mnist:predict")
+    for request in serving.istio.requests:
+        assert request.headers["host"] == "mnist.test.example.com"
+        assert request.headers["Authorization"] == "ApiKey key"
+        assert request.headers["content-type"] == "application/json"
+
+
+def test_routes_prepared_per_protocol_and_payload(serving, prepared_routes):
+    serving.istio.handler = echo_tensors
+    deployment = make_deployment()
+
+    deployment.predict(inputs=np.zeros(1), binary=True)
+    deployment.predict(inputs=np.zeros(1), binary=True)
+    deployment.inference_protocol = "V2"
+    deployment._model_schema = {}
+    deployment.predict(inputs=[1])
+
+    assert len(prepared_routes) == 2
+    binary_request, _, json_request = serving.istio.requests
+    assert binary_request.headers["content-type"] == "application/octet-stream"
+    assert "Inference-Header-Content-Length" in binary_request.headers
+    assert json_request.headers["content-type"] == "application/json"
+    assert "Inference-Header-Content-Length" not in json_request.headers
+
+
+def test_routes_not_shared_between_deployments(serving, prepared_routes):
+    serving.istio.handler = echo_predictions
+
+    make_deployment("first").predict(inputs=[[1]])
+    make_deployment("second").predict(inputs=[[1]])
+
+    assert [r.path for r in serving.istio.requests] == [
+        "/v1/models/first:predict",
+        "/v1/models/second:predict",
+    ]
+    assert serving.istio.requests[1].headers["host"] == "second.test.example.com"
+
+
+def test_route_dropped_when_name_changes(serving):
+    serving.istio.handler = echo_predictions
+    deployment = make_deployment()
+    deployment.predict(inputs=[[1]])
+
+    deployment.name = "renamed"
+    deployment.predict(inputs=[[1]])
+
+    assert serving.istio.requests[1].path == "/v1/models/renamed:predict"
+    assert serving.istio.requests[1].headers["host"] == "renamed.test.example.com"
+
+
+def test_route_dropped_when_serving_tool_changes(serving):
+    serving.istio.handler = serving.hopsworks.handler = echo_predictions
+    deployment = make_deployment()
+    deployment.predict(inputs=[[1]])
+
+    deployment.serving_tool = "DEFAULT"
+    deployment.predict(inputs=[[1]])
+
+    assert len(serving.istio.requests) == 1
+    assert serving.hopsworks.requests[0].path == (
+        "/project/119/inference/models/mnist:predict"
+    )
+
+
+def test_route_dropped_when_status_changes(serving, prepared_routes):
+    serving.istio.handler = echo_predictions
+    statuses = ["Running", "Running", "Stopped"]
+    serving.hopsworks.handler = lambda request: (
+        200,
+        state_json(statuses.pop(0)),
+        None,
+    )
+    deployment = make_deployment()
+
+    deployment.get_state(refresh=True)
+    deployment.predict(inputs=[[1]])
+    deployment.get_state(refresh=True)
+    deployment.predict(inputs=[[1]])
+    assert len(prepared_routes) == 1
+
+    deployment.get_state(refresh=True)
+    deployment.predict(inputs=[[1]])
+    assert len(prepared_routes) == 2
+
+
+def test_route_dropped_when_client_is_closed(serving, monkeypatch):
+    serving.istio.handler = echo_predictions
+    deployment = make_deployment()
+    deployment.predict(inputs=[[1]])
+
+    client.get_istio_instance()._close()
+    monkeypatch.setattr(
+        client,
+        "_istio_client",
+        ist_external.Client("127.0.0.1", serving.istio.port, "test", "new-key"),
+    )
+    deployment.predict(inputs=[[1]])
+
+    assert serving.istio.requests[1].headers["Authorization"] == "ApiKey new-key"
+
+
+def test_route_headers_prepared_again_when_auth_changes(serving, prepared_routes):
+    serving.istio.handler = echo_predictions
+    deployment = make_deployment()
+    deployment.predict(inputs=[[1]])
+
+    client.get_istio_instance()._auth = auth.ApiKeyAuth("refreshed-key")
+    deployment.predict(inputs=[[1]])
+
+    assert len(prepared_routes) == 1
+    assert serving.istio.requests[1].headers["Authorization"] == "ApiKey refreshed-key"
+    assert serving.istio.requests[1].headers["host"] == "mnist.test.example.com"
+
+
+def test_get_state_returns_entity_tag(serving):
+    serving.hopsworks.handler = StateHandler(etag='"v1"')
+
+    state, etag = serving_api.ServingApi().get_state(make_deployment())
+
+    assert state.status == "Running"
+    assert state.available_predictor_instances == 1
+    assert etag == '"v1"'
+    request = serving.hopsworks.requests[0]
+    assert request.path == "/project/119/serving/1"
+    assert "If-None-Match" not in request.headers
+
+
+def test_get_state_not_modified(serving):
+    serving.hopsworks.handler = StateHandler(etag='"v1"')
+
+    state, etag = serving_api.ServingApi().get_state(make_deployment(), etag='"v1"')
+
+    assert state is None
+    assert etag == '"v1"'
+    assert serving.hopsworks.requests[0].headers["If-None-Match"] == '"v1"'
+
+
+def test_get_state_modified(serving):
+    serving.hopsworks.handler = StateHandler(status="Stopped", etag='"v2"')
+
+    state, etag = serving_api.ServingApi().get_state(make_deployment(), etag='"v1"')
+
+    assert state.status == "Stopped"
+    assert etag == '"v2"'
+
+
+def test_get_state_without_entity_tags(serving):
+    serving.hopsworks.handler = StateHandler()
+
+    state, etag = serving_api.ServingApi().get_state(make_deployment())
+
+    assert state.status == "Running"
+    assert etag is None
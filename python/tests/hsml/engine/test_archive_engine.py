@@ -0,0 +1,170 @@
+#
+#   Copyright 2022 Logical Clocks AB
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+import gzip
+import io
+import os
+import tarfile
+import tempfile
+
+import pytest
+
+from hsml.engine import archive_engine
+
+
+@pytest.fixture
+def model_dir(tmp_path):
+    path = tmp_path / "model"
+    (path / "variables").mkdir(parents=True)
+    (path / "saved_model.pb").write_bytes(b"graph" * 1000)
+    (path / "variables" / "variables.index").write_bytes(b"index")
+    (path / "variables" / "variables.data").write_bytes(os.urandom(5000))
+    return str(path)
+
+
+def read_archive(path, archive_name="1", codec="NONE", exclude=None):
+    with archive_engine.ArchiveEngine().stream(
+        path, archive_name, codec, exclude=exclude
+    ) as archive:
+        data = archive.read()
+    assert len(data) == archive.size
+    return archive.name, data
+
+
+def extract(data):
+    with tarfile.open(fileobj=io.BytesIO(data)) as tar:
+        return {
+            os.path.normpath(m.name): tar.extractfile(m).read() if m.isreg() else None
+            for m in tar.getmembers()
+        }
+
+
+def test_stream_directory(model_dir):
+    name, data = read_archive(model_dir)
+
+    assert name == "1.tar"
+    members = extract(data)
+    assert members["saved_model.pb"] == b"graph" * 1000
+    assert members["variables/variables.index"] == b"index"
+    assert members["variables"] is None
+
+
+def test_stream_file(model_dir):
+    _, data = read_archive(os.path.join(model_dir, "saved_model.pb"))
+
+    assert extract(data) == {"saved_model.pb": b"graph" * 1000}
+
+
+def test_stream_in_small_reads(model_dir):
+    with archive_engine.ArchiveEngine().stream(model_dir, "1", "NONE") as archive:
+        chunks = []
+        while True:
+            chunk = archive.read(1000)
+            if not chunk:
+                break
+            chunks.append(chunk)
+
+    assert b"".join(chunks) == read_archive(model_dir)[1]
+
+
+def test_stream_excludes_files(model_dir):
+    _, data = read_archive(model_dir, exclude={"variables/variables.data"})
+
+    members = extract(data)
+    assert "variables/variables.data" not in members
+    assert "variables/variables.index" in members
+
+
+def test_stream_is_reproducible(model_dir):
+    assert read_archive(model_dir)[1] == read_archive(model_dir)[1]
+
+
+def test_stream_fails_if_files_change_while_archiving(model_dir):
+    # larger than the pipe buffer, so the archive is not fully written before reading
+    weights_path = os.path.join(model_dir, "weights.safetensors")
+    with open(weights_path, "wb") as f:
+        f.write(os.urandom(1048576))
+
+    with archive_engine.ArchiveEngine().stream(model_dir, "1", "NONE") as archive:
+        with open(weights_path, "wb"):
+            pass  # truncate
+        with pytest.raises(IOError):
+            archive.read()
+
+
+def test_stream_closed_before_fully_read(model_dir):
+    with archive_engine.ArchiveEngine().stream(model_dir, "1", "NONE") as archive:
+        assert len(archive.read(10)) == 10
+
+
+def test_gzip_archive(model_dir):
+    name, data = read_archive(model_dir, codec="GZIP")
+
+    assert name == "1.tar.gz"
+    assert extract(gzip.decompress(data)) == extract(read_archive(model_dir)[1])
+    assert data[4:8] == b"\x00\x00\x00\x00"  # no timestamp
+
+
+def test_gzip_archive_compressed_in_parallel_blocks(model_dir, monkeypatch):
+    monkeypatch.setattr(archive_engine._GzipCodec, "BLOCK_SIZE", 1024)
+    with open(os.path.join(model_dir, "weights.onnx"), "wb") as f:
+        f.write(os.urandom(10000))
+
+    _, data = read_archive(model_dir, codec="GZIP")
+
+    assert extract(gzip.decompress(data)) == extract(read_archive(model_dir)[1])
+
+
+def test_gzip_archive_not_written_to_disk(model_dir, monkeypatch):
+    def no_temporary_file(*args, **kwargs):
+        raise AssertionError("archives must not be written to disk")
+
+    for name in ["SpooledTemporaryFile", "TemporaryFile", "NamedTemporaryFile"]:
+        monkeypatch.setattr(tempfile, name, no_temporary_file)
+    monkeypatch.setattr(tempfile, "mkstemp", no_temporary_file)
+
+    _, data = read_archive(model_dir, codec="GZIP")
+
+    assert extract(gzip.decompress(data)) == extract(read_archive(model_dir)[1])
+
+
+def test_auto_codec_compresses_compressible_models(model_dir):
+    assert read_archive(model_dir, codec="AUTO")[0] == "1.tar.gz"
+
+
+def test_auto_codec_stores_incompressible_models(tmp_path):
+    (tmp_path / "config.json").write_bytes(b"{}")
+    (tmp_path / "model.safetensors").write_bytes(os.urandom(100000))
+
+    assert read_archive(str(tmp_path), codec="AUTO")[0] == "1.tar"
+
+
+def test_auto_codec_stores_large_models(model_dir, monkeypatch):
+    monkeypatch.setattr(archive_engine.ArchiveEngine, "AUTO_MAX_COMPRESSED_SIZE", 1000)
+
+    assert read_archive(model_dir, codec="AUTO")[0] == "1.tar"
+    assert read_archive(model_dir, codec="GZIP")[0] == "1.tar.gz"
+
+
+def test_auto_codec_samples_files_without_known_extension(tmp_path):
+    (tmp_path / "weights").write_bytes(os.urandom(1048576))
+
+    assert read_archive(str(tmp_path), codec="AUTO")[0] == "1.tar"
+
+
+def test_invalid_codec(model_dir):
+    with pytest.raises(ValueError):
+        archive_engine.ArchiveEngine().stream(model_dir, "1", "ZSTD")
@@ -0,0 +1,167 @@
+#
+#   Copyright 2022 Logical Clocks AB
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+import threading
+import time
+
+import pytest
+
+from hsml.client.exceptions import ModelServingException
+from hsml.engine import batching_engine
+from tests.fakes import echo_predictions, make_deployment
+
+
+class Sender:
+    """Inference function echoing the instances of each batch as predictions."""
+
+    def __init__(self, error=None, drop=False):
+        self.batches = []
+        self.error = error
+        self.drop = drop
+
+    def __call__(self, payload):
+        self.batches.append(payload["instances"])
+        if self.error is not None:
+            raise self.error
+        predictions = payload["instances"][1:] if self.drop else payload["instances"]
+        return {"predictions": predictions, "model": "mnist"}
+
+
+def results(futures):
+    return [future.result(5) for future in futures]
+
+
+def test_submit_combines_instances_into_one_batch():
+    sender = Sender()
+    engine = batching_engine.BatchingEngine(sender, max_batch_size=4, max_latency=1000)
+
+    futures = [engine.submit([[1], [2]]), engine.submit([[3]]), engine.submit([[4]])]
+
+    assert results(futures) == [
+        {"predictions": [[1], [2]], "model": "mnist"},
+        {"predictions": [[3]], "model": "mnist"},
+        {"predictions": [[4]], "model": "mnist"},
+    ]
+    assert sender.batches == [[[1], [2], [3], [4]]]
+
+
+def test_submit_splits_batches_at_max_batch_size():
+    sender = Sender()
+    engine = batching_engine.BatchingEngine(sender, max_batch_size=2, max_latency=100)
+
+    futures = [engine.submit([[i]]) for i in range(5)]
+
+    assert [r["predictions"] for r in results(futures)] == [[[i]] for i in range(5)]
+    assert sorted(sender.batches) == [[[0], [1]], [[2], [3]], [[4]]]
+
+
+def test_submit_does_not_split_instances_of_a_call():
+    sender = Sender()
+    engine = batching_engine.BatchingEngine(sender, max_batch_size=3, max_latency=100)
+
+    futures = [engine.submit([[1], [2]]), engine.submit([[3], [4]])]
+
+    assert [r["predictions"] for r in results(futures)] == [[[1], [2]], [[3], [4]]]
+    assert sorted(sender.batches) == [[[1], [2]], [[3], [4]]]
+
+
+def test_submit_sends_partial_batch_after_max_latency():
+    sender = Sender()
+    engine = batching_engine.BatchingEngine(sender, max_batch_size=10, max_latency=50)
+
+    start = time.monotonic()
+    assert engine.submit([[1]]).result(5)["predictions"] == [[1]]
+
+    assert time.monotonic() - start >= 0.05
+    assert sender.batches == [[[1]]]
+
+
+def test_submit_propagates_errors_to_every_caller():
+    engine = batching_engine.BatchingEngine(
+        Sender(error=IOError("failed")), max_batch_size=2, max_latency=1000
+    )
+
+    futures = [engine.submit([[1]]), engine.submit([[2]])]
+
+    for future in futures:
+        with pytest.raises(IOError):
+            future.result(5)
+
+
+def test_submit_fails_if_predictions_do_not_match_instances():
+    engine = batching_engine.BatchingEngine(
+        Sender(drop=True), max_batch_size=2, max_latency=1000
+    )
+
+    futures = [engine.submit([[1]]), engine.submit([[2]])]
+
+    for future in futures:
+        with pytest.raises(ModelServingException):
+            future.result(5)
+
+
+def test_close_sends_submitted_instances():
+    sender = Sender()
+    engine = batching_engine.BatchingEngine(sender, max_batch_size=10, max_latency=1000)
+    future = engine.submit([[1]])
+
+    engine.close()
+
+    assert future.result(5)["predictions"] == [[1]]
+    with pytest.raises(ModelServingException):
+        engine.submit([[2]])
+
+
+def test_invalid_batching_settings():
+    with pytest.raises(ValueError):
+        batching_engine.BatchingEngine(Sender(), max_batch_size=0)
+    with pytest.raises(ValueError):
+        batching_engine.BatchingEngine(Sender(), max_latency=-1)
+
+
+def test_predict_with_client_batching(serving):
+    serving.istio.handler = echo_predictions
+    deployment = make_deployment()
+    deployment.enable_client_batching(max_batch_size=8, max_latency=1000)
+    responses = [None] * 8
+
+    def predict(i):
+        responses[i] = deployment.predict(inputs=[[i]])
+
+    threads = [threading.Thread(target=predict, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    deployment.disable_client_batching()
+
+    assert responses == [{"predictions": [[i]]} for i in range(8)]
+    assert len(serving.istio.requests) == 1
+    assert sorted(serving.istio.requests[0].json()["instances"]) == [
+        [i] for i in range(8)
+    ]
+
+
+def test_predict_with_data_is_not_batched(serving):
+    serving.istio.handler = echo_predictions
+    deployment = make_deployment()
+    deployment.enable_client_batching(max_batch_size=8, max_latency=1000)
+
+    response = deployment.predict(data={"instances": [[1]], "key": "value"})
+    deployment.disable_client_batching()
+
+    assert response == {"predictions": [[1]]}
+    assert serving.istio.requests[0].json() == {"instances": [[1]], "key": "value"}
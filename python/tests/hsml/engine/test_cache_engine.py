@@ -0,0 +1,222 @@
+#
+#   Copyright 2022 Logical Clocks AB
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+import os
+import time
+
+import pytest
+
+from hsml.engine import cache_engine
+
+
+def release_entries_in_use():
+    """Release the entries used by this process, as if it exited."""
+    with cache_engine._entries_in_use_lock:
+        for lock in cache_engine._entries_in_use.values():
+            lock.release()
+        cache_engine._entries_in_use.clear()
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    path = str(tmp_path / "cache")
+    monkeypatch.setenv(cache_engine.CacheEngine.CACHE_DIR, path)
+    yield path
+    release_entries_in_use()
+
+
+class Populator:
+    def __init__(self, content=b"model", fail=False):
+        self.content = content
+        self.fail = fail
+        self.calls = 0
+
+    def __call__(self, data_dir):
+        self.calls += 1
+        os.makedirs(os.path.join(data_dir, "mnist", "1"))
+        with open(os.path.join(data_dir, "mnist", "1", "model.pkl"), "wb") as f:
+            f.write(self.content)
+        if self.fail:
+            raise IOError("download failed")
+
+
+def get(engine, populator, key=("model", 1, "mnist", 1), digest="a"):
+    return engine.get(list(key), digest, os.path.join("mnist", "1"), populator)
+
+
+def read(path):
+    with open(os.path.join(path, "model.pkl"), "rb") as f:
+        return f.read()
+
+
+def test_cache_disabled_by_default(monkeypatch):
+    monkeypatch.delenv(cache_engine.CacheEngine.CACHE_DIR, raising=False)
+
+    assert not cache_engine.CacheEngine().enabled
+
+
+def test_cache_disabled_with_zero_size(cache_dir, monkeypatch):
+    monkeypatch.setenv(cache_engine.CacheEngine.CACHE_MAX_SIZE, "0")
+
+    assert not cache_engine.CacheEngine().enabled
+
+
+def test_get_populates_entry_once(cache_dir):
+    engine = cache_engine.CacheEngine()
+    populator = Populator()
+
+    path = get(engine, populator)
+
+    assert engine.enabled
+    assert path.startswith(cache_dir)
+    assert read(path) == b"model"
+    assert get(engine, populator) == path
+    assert populator.calls == 1
+
+
+def test_get_populates_new_entry_when_digest_changes(cache_dir):
+    engine = cache_engine.CacheEngine()
+
+    path = get(engine, Populator(b"v1"), digest="a")
+    new_path = get(engine, Populator(b"v2"), digest="b")
+
+    assert new_path != path
+    assert read(new_path) == b"v2"
+
+
+def test_get_repopulates_entry_with_missing_data(cache_dir):
+    engine = cache_engine.CacheEngine()
+    populator = Populator()
+    path = get(engine, populator)
+    os.remove(os.path.join(path, "model.pkl"))
+
+    assert read(get(engine, populator)) == b"model"
+    assert populator.calls == 2
+
+
+def test_get_repopulates_entry_with_modified_data(cache_dir):
+    engine = cache_engine.CacheEngine()
+    populator = Populator()
+    path = get(engine, populator)
+    with open(os.path.join(path, "model.pkl"), "ab") as f:
+        f.write(b"corrupted")
+
+    assert read(get(engine, populator)) == b"model"
+    assert populator.calls == 2
+
+
+def test_get_leaves_no_partial_entry_when_populating_fails(cache_dir):
+    engine = cache_engine.CacheEngine()
+
+    with pytest.raises(IOError):
+        get(engine, Populator(fail=True))
+
+    assert [
+        name
+        for name in os.listdir(cache_dir)
+        if os.path.isdir(os.path.join(cache_dir, name))
+    ] == []
+    assert read(get(engine, Populator())) == b"model"
+
+
+def test_evict_least_recently_used_entries(cache_dir, monkeypatch):
+    monkeypatch.setenv(cache_engine.CacheEngine.CACHE_MAX_SIZE, "10")
+    engine = cache_engine.CacheEngine()
+
+    first = get(engine, Populator(b"12345"), digest="a")
+    second = get(engine, Populator(b"12345"), digest="b")
+    release_entries_in_use()
+    time.sleep(0.01)
+    get(engine, Populator(b"12345"), digest="b")  # mark as recently used
+    release_entries_in_use()
+    third = get(engine, Populator(b"12345"), digest="c")
+
+    assert not os.path.exists(first)
+    assert read(second) == b"12345"
+    assert read(third) == b"12345"
+
+
+def use_in_other_process(path):
+    """Mark the entry of a cached path as in use, as another process would."""
+    entry_dir = os.path.dirname(os.path.dirname(os.path.dirname(path)))
+    lock = cache_engine._FileLock(
+        entry_dir + cache_engine.CacheEngine.ENTRY_IN_USE_SUFFIX, shared=True
+    )
+    lock.acquire()
+    return lock
+
+
+def test_evict_keeps_entries_in_use_by_other_processes(cache_dir, monkeypatch):
+    monkeypatch.setenv(cache_engine.CacheEngine.CACHE_MAX_SIZE, "10")
+    engine = cache_engine.CacheEngine()
+    paths = []
+    locks = []
+    for digest in ("a", "b"):
+        paths.append(get(engine, Populator(b"12345"), digest=digest))
+        locks.append(use_in_other_process(paths[-1]))
+
+    with pytest.warns(UserWarning, match="exceeds its maximum size"):
+        paths.append(get(engine, Populator(b"12345"), digest="c"))
+
+    assert [read(path) for path in paths] == [b"12345"] * 3
+    for lock in locks:
+        lock.release()
+
+
+def test_evict_entries_used_by_this_process(cache_dir, monkeypatch):
+    monkeypatch.setenv(cache_engine.CacheEngine.CACHE_MAX_SIZE, "10")
+    engine = cache_engine.CacheEngine()
+
+    paths = []
+    for digest in ("a", "b", "c", "d"):
+        paths.append(get(engine, Populator(b"12345"), digest=digest))
+        time.sleep(0.01)
+
+    assert [os.path.exists(path) for path in paths] == [False, False, True, True]
+    # the locks of evicted entries are released
+    assert len(cache_engine._entries_in_use) == 2
+
+
+def test_evict_keeps_entry_used_by_this_and_other_processes(cache_dir, monkeypatch):
+    monkeypatch.setenv(cache_engine.CacheEngine.CACHE_MAX_SIZE, "10")
+    engine = cache_engine.CacheEngine()
+    first = get(engine, Populator(b"12345"), digest="a")
+    lock = use_in_other_process(first)
+    time.sleep(0.01)
+    second = get(engine, Populator(b"12345"), digest="b")
+
+    get(engine, Populator(b"12345"), digest="c")
+    lock.release()
+
+    # the oldest entry is still used by the other process, the next one is evicted
+    assert read(first) == b"12345"
+    assert not os.path.exists(second)
+    assert len(cache_engine._entries_in_use) == 2
+
+
+def test_evict_removes_stale_files(cache_dir):
+    engine = cache_engine.CacheEngine()
+    get(engine, Populator(), digest="a")
+    stale_tmp_dir = os.path.join(cache_dir, ".tmp-0123-4567")
+    os.makedirs(stale_tmp_dir)
+    for name in ("0123.lock", "0123.use"):
+        open(os.path.join(cache_dir, name), "w").close()
+
+    get(engine, Populator(), digest="b")
+
+    assert not os.path.exists(stale_tmp_dir)
+    assert not os.path.exists(os.path.join(cache_dir, "0123.lock"))
+    assert not os.path.exists(os.path.join(cache_dir, "0123.use"))
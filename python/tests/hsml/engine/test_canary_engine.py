@@ -0,0 +1,176 @@
+#
+#   Copyright 2022 Logical Clocks AB
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+import asyncio
+import random
+
+import pytest
+
+from hsml.engine import canary_engine
+
+BASELINE = "baseline"
+CANARY = "canary"
+
+
+@pytest.fixture(autouse=True)
+def seeded_random(monkeypatch):
+    monkeypatch.setattr(canary_engine, "random", random.Random(0))
+
+
+def make_engine(traffic_percentage=10):
+    return canary_engine.CanaryEngine(CANARY, traffic_percentage)
+
+
+def record(engine, target, latencies=(), errors=0):
+    for latency in latencies:
+        engine._record(target, latency)
+    for _ in range(errors):
+        engine._record(target, None)
+
+
+@pytest.mark.parametrize("traffic_percentage", [0, 100, -1, 150])
+def test_invalid_traffic_percentage(traffic_percentage):
+    with pytest.raises(ValueError):
+        make_engine(traffic_percentage)
+
+
+def test_send_splits_traffic():
+    engine = make_engine(traffic_percentage=20)
+
+    targets = [engine.send(BASELINE, lambda target: target) for _ in range(2000)]
+
+    assert 300 < targets.count(CANARY) < 500
+    stats = engine.get_stats()
+    assert stats[CANARY]["predictions"] == targets.count(CANARY)
+    assert stats[BASELINE]["predictions"] == targets.count(BASELINE)
+    assert stats[CANARY]["errors"] == stats[BASELINE]["errors"] == 0
+
+
+def test_send_records_errors():
+    engine = make_engine(traffic_percentage=50)
+
+    def predict(target):
+        if target == CANARY:
+            raise IOError("failed")
+        return target
+
+    failures = 0
+    for _ in range(100):
+        try:
+            engine.send(BASELINE, predict)
+        except IOError:
+            failures += 1
+
+    stats = engine.get_stats()
+    assert stats[CANARY]["errors"] == stats[CANARY]["predictions"] == failures
+    assert stats[CANARY]["error_rate"] == 1
+    assert stats[CANARY]["latency_p95"] is None
+    assert stats[BASELINE]["error_rate"] == 0
+    assert stats[BASELINE]["latency_p95"] is not None
+
+
+def test_send_async():
+    engine = make_engine(traffic_percentage=50)
+
+    async def predict(target):
+        return target
+
+    async def send_all():
+        return await asyncio.gather(
+            *[engine.send_async(BASELINE, predict) for _ in range(100)]
+        )
+
+    targets = asyncio.run(send_all())
+
+    assert set(targets) == {BASELINE, CANARY}
+    assert engine.get_stats()[CANARY]["predictions"] == targets.count(CANARY)
+
+
+def test_get_stats_without_predictions():
+    assert make_engine().get_stats()[CANARY] == {
+        "predictions": 0,
+        "errors": 0,
+        "error_rate": None,
+        "latency_p50": None,
+        "latency_p95": None,
+    }
+
+
+def test_get_stats_latencies():
+    engine = make_engine()
+    record(engine, CANARY, latencies=[i / 100 for i in range(1, 101)], errors=25)
+
+    stats = engine.get_stats()[CANARY]
+
+    assert stats["predictions"] == 125
+    assert stats["error_rate"] == 0.2
+    assert stats["latency_p50"] == pytest.approx(0.505)
+    assert stats["latency_p95"] == pytest.approx(0.9505)
+
+
+def test_latency_window_keeps_recent_predictions(monkeypatch):
+    monkeypatch.setattr(canary_engine.CanaryEngine, "LATENCY_WINDOW", 10)
+    engine = make_engine()
+    record(engine, CANARY, latencies=[10] * 10 + [1] * 10)
+
+    assert engine.get_stats()[CANARY]["latency_p95"] == 1
+
+
+def test_evaluate_waits_for_min_predictions():
+    engine = make_engine()
+    record(engine, BASELINE, latencies=[0.1] * 10)
+    record(engine, CANARY, latencies=[0.1] * 9)
+
+    assert engine.evaluate(10, 0.2, 0.01) is None
+
+
+def test_evaluate_waits_for_predictions_to_both_deployments():
+    engine = make_engine()
+    record(engine, BASELINE, latencies=[0.1])
+
+    assert engine.evaluate(0, 0.2, 0.01) is None
+
+
+def test_evaluate_promotes_canary_within_limits():
+    engine = make_engine()
+    record(engine, BASELINE, latencies=[0.1] * 99, errors=1)
+    record(engine, CANARY, latencies=[0.115] * 98, errors=2)
+
+    promoted, _ = engine.evaluate(100, 0.2, 0.01)
+
+    assert promoted
+
+
+def test_evaluate_rolls_back_canary_with_more_errors():
+    engine = make_engine()
+    record(engine, BASELINE, latencies=[0.1] * 100)
+    record(engine, CANARY, latencies=[0.1] * 95, errors=5)
+
+    promoted, reason = engine.evaluate(100, 0.2, 0.01)
+
+    assert not promoted
+    assert "error rate 5.00%" in reason
+
+
+def test_evaluate_rolls_back_slower_canary():
+    engine = make_engine()
+    record(engine, BASELINE, latencies=[0.1] * 100)
+    record(engine, CANARY, latencies=[0.125] * 100)
+
+    promoted, reason = engine.evaluate(100, 0.2, 0.01)
+
+    assert not promoted
+    assert "p95 latency 125.0 ms" in reason
@@ -0,0 +1,137 @@
+#
+#   Copyright 2022 Logical Clocks AB
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+import asyncio
+import threading
+import time
+from concurrent import futures
+
+import pytest
+
+from hsml.engine import hedging_engine
+
+
+class Sender:
+    """Request function answering after the delay of each call, or failing."""
+
+    def __init__(self, delays, errors=None):
+        self.delays = list(delays)
+        self.errors = errors or {}
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def _next(self):
+        with self.lock:
+            call = self.calls
+            self.calls += 1
+        return call, self.delays[min(call, len(self.delays) - 1)]
+
+    def __call__(self):
+        call, delay = self._next()
+        time.sleep(delay)
+        if call in self.errors:
+            raise self.errors[call]
+        return call
+
+    async def send_async(self):
+        call, delay = self._next()
+        await asyncio.sleep(delay)
+        if call in self.errors:
+            raise self.errors[call]
+        return call
+
+
+def test_send_without_hedging_if_fast():
+    sender = Sender([0])
+
+    assert hedging_engine.HedgingEngine(delay=1).send(sender) == 0
+    assert sender.calls == 1
+
+
+def test_send_hedges_slow_request():
+    sender = Sender([1, 0])
+
+    start = time.monotonic()
+    assert hedging_engine.HedgingEngine(delay=0.05).send(sender) == 1
+
+    assert time.monotonic() - start < 0.5
+    assert sender.calls == 2
+
+
+def test_send_hedges_up_to_max_hedges():
+    sender = Sender([0.3])
+
+    assert hedging_engine.HedgingEngine(delay=0.01, max_hedges=2).send(sender) == 0
+    assert sender.calls == 3
+
+
+def test_send_waits_for_hedge_if_request_fails():
+    sender = Sender([0.1, 0.2], errors={0: IOError("failed")})
+
+    assert hedging_engine.HedgingEngine(delay=0.01).send(sender) == 1
+
+
+def test_send_raises_error_if_all_requests_fail():
+    sender = Sender([0.05], errors={0: IOError("first"), 1: IOError("second")})
+
+    with pytest.raises(IOError):
+        hedging_engine.HedgingEngine(delay=0.01).send(sender)
+    assert sender.calls == 2
+
+
+def test_send_times_out():
+    with pytest.raises(futures.TimeoutError):
+        hedging_engine.HedgingEngine(delay=0.01).send(Sender([1]), timeout=0.1)
+
+
+def test_delay_from_recent_latencies():
+    engine = hedging_engine.HedgingEngine()
+    sender = Sender([0])
+
+    for _ in range(engine.MIN_LATENCIES - 1):
+        engine.send(sender)
+    assert engine.get_delay() is None
+
+    engine.send(sender)
+    assert 0 <= engine.get_delay() < 0.1
+    assert sender.calls == engine.MIN_LATENCIES
+
+
+def test_send_async_hedges_slow_request():
+    sender = Sender([1, 0])
+
+    response = asyncio.run(
+        hedging_engine.HedgingEngine(delay=0.05).send_async(sender.send_async)
+    )
+
+    assert response == 1
+    assert sender.calls == 2
+
+
+def test_send_async_times_out():
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(
+            hedging_engine.HedgingEngine(delay=0.01).send_async(
+                Sender([1]).send_async, timeout=0.1
+            )
+        )
+
+
+def test_invalid_hedging_settings():
+    with pytest.raises(ValueError):
+        hedging_engine.HedgingEngine(delay=-1)
+    with pytest.raises(ValueError):
+        hedging_engine.HedgingEngine(max_hedges=0)
@@ -0,0 +1,445 @@
+#
+#   Copyright 2022 Logical Clocks AB
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+import contextlib
+import hashlib
+import json
+import os
+from unittest import mock
+
+import pytest
+
+from hsml.client.exceptions import RestAPIError
+from hsml.core import dataset_api
+from hsml.engine import model_engine
+from tests.fakes import FakeResponse
+
+
+class FakeModel:
+    def __init__(self, version=None):
+        self._name = "mnist"
+        self._version = version
+        self._input_example = None
+        self._model_schema = None
+        self.shared_registry_project_name = None
+        self.training_metrics = None
+        self.model_registry_id = 1
+
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def version(self):
+        return self._version
+
+    @property
+    def version_path(self):
+        return "/Projects/test/Models/mnist/{}".format(self._version)
+
+    def get_url(self):
+        return "https://hopsworks/models/mnist/{}".format(self._version)
+
+
+def rest_api_error(status_code):
+    return RestAPIError("https://hopsworks", FakeResponse(status_code))
+
+
+@pytest.fixture
+def engine(fake_client):
+    engine = model_engine.ModelEngine()
+    engine._dataset_api = mock.Mock()
+    engine._model_api = mock.Mock()
+    engine._archive_engine = mock.Mock()
+    engine._engine = mock.Mock()
+    return engine
+
+
+def registered_versions(versions):
+    def get(name, version, model_registry_id, shared_registry_project_name):
+        if version not in versions:
+            raise rest_api_error(404)
+        return FakeModel(version)
+
+    return get
+
+
+def existing_paths(*paths):
+    return lambda path: path in ("Models", "Models/mnist") + paths
+
+
+def test_save_keeps_version_path_when_upload_is_interrupted(engine, tmp_path):
+    engine._dataset_api.path_exists.side_effect = existing_paths()
+    engine._upload_local_model = mock.Mock(side_effect=KeyboardInterrupt)
+
+    with pytest.raises(KeyboardInterrupt):
+        engine.save(FakeModel(1), str(tmp_path))
+
+    engine._engine.mkdir.assert_called_once()
+    engine._dataset_api.rm.assert_not_called()
+
+
+def test_save_removes_version_path_when_registration_fails(engine, tmp_path):
+    engine._dataset_api.path_exists.side_effect = existing_paths()
+    engine._upload_local_model = mock.Mock()
+    engine._model_api.put.side_effect = rest_api_error(500)
+
+    with pytest.raises(RestAPIError):
+        engine.save(FakeModel(1), str(tmp_path))
+
+    engine._dataset_api.rm.assert_called_once_with("/Projects/test/Models/mnist/1")
+
+
+@pytest.fixture
+def manifests_dir(tmp_path, monkeypatch):
+    path = str(tmp_path / "manifests")
+    monkeypatch.setattr(dataset_api.UploadManifest, "MANIFESTS_DIR", path)
+    return path
+
+
+def interrupt_upload(file_name, upload_path="Models/mnist"):
+    manifest = dataset_api.UploadManifest(
+        upload_path,
+        dataset_api.DatasetApi()._get_flow_base_params(file_name, 1, 10),
+    )
+    manifest.open({1: 0})
+    manifest.close()
+
+
+def save_with_unregistered_version(engine, tmp_path, upload_configuration=None):
+    engine._dataset_api.path_exists.side_effect = existing_paths(
+        "Models/mnist/2", "/Projects/test/Models/mnist/2"
+    )
+    engine._dataset_api.list.return_value = {
+        "items": [
+            {"attributes": {"path": "/Projects/test/Models/mnist/2"}},
+            {"attributes": {"path": "/Projects/test/Models/mnist/1"}},
+        ]
+    }
+    versions = {1}
+    engine._model_api.get.side_effect = registered_versions(versions)
+
+    def put(model_instance, params):
+        versions.add(model_instance.version)
+        return model_instance
+
+    engine._model_api.put.side_effect = put
+    engine._upload_local_model = mock.Mock()
+
+    return engine.save(
+        FakeModel(), str(tmp_path), upload_configuration=upload_configuration
+    )
+
+
+@pytest.mark.parametrize("file_name", ["2.tar", "2.tar.gz"])
+def test_save_resumes_version_interrupted_by_this_client(
+    engine, tmp_path, manifests_dir, file_name
+):
+    interrupt_upload(file_name)
+
+    model_instance = save_with_unregistered_version(engine, tmp_path)
+
+    assert model_instance.version == 2
+    engine._upload_local_model.assert_called_once()
+    assert engine._upload_local_model.call_args[0][1] == 2
+    engine._engine.mkdir.assert_not_called()
+
+
+@pytest.mark.parametrize(
+    "file_name, upload_path",
+    [("1.tar", "Models/mnist"), ("2.tar", "Models/other"), ("12.tar", "Models/mnist")],
+)
+def test_save_does_not_reuse_version_saved_by_another_client(
+    engine, tmp_path, manifests_dir, file_name, upload_path
+):
+    interrupt_upload(file_name, upload_path)
+
+    model_instance = save_with_unregistered_version(engine, tmp_path)
+
+    assert model_instance.version == 3
+    assert engine._upload_local_model.call_args[0][1] == 3
+    engine._engine.mkdir.assert_called_once()
+
+
+def test_save_resumes_unregistered_version_if_requested(
+    engine, tmp_path, manifests_dir
+):
+    model_instance = save_with_unregistered_version(
+        engine, tmp_path, upload_configuration={"resume": True}
+    )
+
+    assert model_instance.version == 2
+
+
+def test_save_does_not_resume_if_not_requested(engine, tmp_path, manifests_dir):
+    interrupt_upload("2.tar")
+
+    model_instance = save_with_unregistered_version(
+        engine, tmp_path, upload_configuration={"resume": False}
+    )
+
+    assert model_instance.version == 3
+
+
+def test_save_rejects_registered_version(engine, tmp_path):
+    engine._dataset_api.path_exists.side_effect = existing_paths("Models/mnist/1")
+    engine._model_api.get.side_effect = registered_versions({1})
+
+    with pytest.raises(model_engine.ModelRegistryException):
+        engine.save(FakeModel(1), str(tmp_path))
+
+
+@contextlib.contextmanager
+def archive_stream(*args, **kwargs):
+    archive = mock.Mock(size=10)
+    archive.name = "1.tar"
+    yield archive
+
+
+def test_upload_local_model_keeps_chunks_of_interrupted_upload(engine, tmp_path):
+    engine._archive_engine.stream.side_effect = archive_stream
+    engine._dataset_api.upload_stream.side_effect = rest_api_error(503)
+
+    with pytest.raises(RestAPIError):
+        engine._upload_local_model(str(tmp_path), 1, "Models/mnist")
+
+    engine._dataset_api.rm.assert_not_called()
+
+
+def test_upload_local_model_cleanup_does_not_mask_upload_error(engine, tmp_path):
+    engine._archive_engine.stream.side_effect = archive_stream
+    unzip_error = rest_api_error(500)
+    engine._dataset_api.unzip.side_effect = unzip_error
+    engine._dataset_api.rm.side_effect = rest_api_error(503)
+
+    with pytest.warns(UserWarning, match="Could not remove"):
+        with pytest.raises(RestAPIError) as e:
+            engine._upload_local_model(str(tmp_path), 1, "Models/mnist")
+
+    assert e.value is unzip_error
+    engine._dataset_api.rm.assert_called_once()
+
+
+def download_tree(entries, contents):
+    def download(path, local_path):
+        if path not in contents:
+            raise rest_api_error(404)
+        with open(local_path, "wb") as f:
+            f.write(contents[path])
+
+    def walk(path):
+        return iter(entries)
+
+    return walk, download
+
+
+def test_download_files_concurrently_into_local_tree(engine, tmp_path, monkeypatch):
+    monkeypatch.setattr(model_engine.tempfile, "gettempdir", lambda: str(tmp_path))
+    version_path = "/Projects/test/Models/mnist/1"
+    contents = {
+        "hdfs://namenode:8020" + version_path + "/model.pkl": b"model",
+        "hdfs://namenode:8020" + version_path + "/assets/vocab.txt": b"vocab",
+    }
+    entries = [
+        {"path": "hdfs://namenode:8020" + version_path + "/assets", "dir": True},
+        {"path": "hdfs://namenode:8020" + version_path + "/assets/vocab.txt"},
+        {"path": "hdfs://namenode:8020" + version_path + "/model.pkl"},
+    ]
+    walk, download = download_tree(entries, contents)
+    engine._dataset_api.walk.side_effect = walk
+    engine._dataset_api.download.side_effect = download
+    engine._cache_engine = mock.Mock(enabled=False)
+
+    local_path = engine.download(FakeModel(1))
+
+    assert local_path.endswith(os.path.join("mnist", "1"))
+    with open(os.path.join(local_path, "model.pkl"), "rb") as f:
+        assert f.read() == b"model"
+    with open(os.path.join(local_path, "assets", "vocab.txt"), "rb") as f:
+        assert f.read() == b"vocab"
+
+
+def test_download_failure_removes_local_files(engine, tmp_path, monkeypatch):
+    monkeypatch.setattr(model_engine.tempfile, "gettempdir", lambda: str(tmp_path))
+    version_path = "/Projects/test/Models/mnist/1"
+    entries = [
+        {"path": version_path + "/model.pkl"},
+        {"path": version_path + "/missing.pkl"},
+    ]
+    walk, download = download_tree(entries, {version_path + "/model.pkl": b"x"})
+    engine._dataset_api.walk.side_effect = walk
+    engine._dataset_api.download.side_effect = download
+    engine._cache_engine = mock.Mock(enabled=False)
+
+    with pytest.raises(RestAPIError):
+        engine.download(FakeModel(1))
+
+    assert os.listdir(str(tmp_path)) == []
+
+
+@pytest.fixture
+def local_model(tmp_path):
+    path = tmp_path / "model"
+    path.mkdir()
+    (path / "weights.bin").write_bytes(b"weights")
+    (path / "config.json").write_bytes(b"{}")
+    return str(path)
+
+
+def remote_versions(engine, manifests):
+    """Previous model versions, with the manifests of those saved with deduplication."""
+    engine._dataset_api.list.return_value = {
+        "items": [
+            {"attributes": {"path": "Models/mnist/{}".format(version)}}
+            for version in manifests
+        ]
+    }
+    manifest_paths = {
+        "Models/mnist/{}/{}".format(version, engine.MANIFEST_FILE): manifest
+        for version, manifest in manifests.items()
+        if manifest is not None
+    }
+
+    def download(path, local_path):
+        with open(local_path, "w") as f:
+            json.dump(manifest_paths[path], f)
+
+    engine._dataset_api.path_exists.side_effect = lambda path: path in manifest_paths
+    engine._dataset_api.download.side_effect = download
+    uploaded = []
+
+    def upload(local_path, upload_path):
+        with open(local_path) as f:
+            uploaded.append((json.load(f), upload_path))
+
+    engine._dataset_api.upload.side_effect = upload
+    engine._archive_engine.stream.side_effect = archive_stream
+    return uploaded
+
+
+def test_upload_local_model_reuses_files_of_previous_versions(engine, local_model):
+    manifest = engine._get_local_manifest(local_model)
+    uploaded = remote_versions(
+        engine,
+        {1: {"files": {"old/weights.bin": manifest["files"]["weights.bin"]}}},
+    )
+
+    engine._upload_local_model(local_model, 2, "Models/mnist", {"deduplicate": True})
+
+    exclude = engine._archive_engine.stream.call_args[1]["exclude"]
+    assert "weights.bin" in exclude
+    assert "config.json" not in exclude
+    engine._dataset_api.copy.assert_called_once_with(
+        "Models/mnist/1/old/weights.bin", "Models/mnist/2/weights.bin"
+    )
+    assert uploaded == [(manifest, "Models/mnist/2")]
+
+
+def test_upload_local_model_uploads_changed_files(engine, local_model):
+    remote_versions(
+        engine,
+        {
+            1: {"files": {"weights.bin": {"size": 7, "sha256": "0" * 64}}},
+            3: {"files": {}},  # later version, not a previous one
+        },
+    )
+
+    engine._upload_local_model(local_model, 2, "Models/mnist", {"deduplicate": True})
+
+    assert "weights.bin" not in engine._archive_engine.stream.call_args[1]["exclude"]
+    engine._dataset_api.copy.assert_not_called()
+
+
+def test_upload_local_model_without_deduplication(engine, local_model):
+    uploaded = remote_versions(engine, {1: None})
+
+    engine._upload_local_model(local_model, 2, "Models/mnist")
+
+    engine._dataset_api.list.assert_not_called()
+    assert engine._archive_engine.stream.call_args[1]["exclude"] == {
+        engine.MANIFEST_FILE
+    }
+    assert uploaded == []
+
+
+def test_local_manifest(engine, local_model):
+    manifest = engine._get_local_manifest(local_model)
+
+    assert manifest["files"]["weights.bin"] == {
+        "size": 7,
+        "sha256": hashlib.sha256(b"weights").hexdigest(),
+    }
+    assert set(manifest["files"]) == {"weights.bin", "config.json"}
+
+
+def test_copy_hopsfs_model(engine):
+    source_path = "/Projects/test/Resources/mnist"
+    engine._dataset_api.walk.return_value = iter(
+        [
+            {"path": "hdfs://namenode:8020" + source_path + "/assets", "dir": True},
+            {"path": "hdfs://namenode:8020" + source_path + "/assets/vocab.txt"},
+            {"path": "hdfs://namenode:8020" + source_path + "/model.pkl"},
+        ]
+    )
+
+    engine._copy_hopsfs_model(
+        "hdfs://namenode:8020" + source_path + "/", "Models/mnist/1"
+    )
+
+    engine._dataset_api.walk.assert_called_once_with(source_path)
+    engine._dataset_api.mkdir.assert_called_once_with("Models/mnist/1/assets")
+    assert sorted(c[0] for c in engine._dataset_api.copy.call_args_list) == [
+        (
+            "hdfs://namenode:8020" + source_path + "/assets/vocab.txt",
+            "Models/mnist/1/assets/vocab.txt",
+        ),
+        (
+            "hdfs://namenode:8020" + source_path + "/model.pkl",
+            "Models/mnist/1/model.pkl",
+        ),
+    ]
+
+
+def test_copy_file_retries_server_errors(engine, monkeypatch):
+    monkeypatch.setattr(engine, "COPY_RETRY_INTERVAL", 0)
+    engine._dataset_api = model_engine.dataset_api.DatasetApi()
+    monkeypatch.setattr(
+        engine._dataset_api,
+        "copy",
+        mock.Mock(side_effect=[rest_api_error(503), None]),
+    )
+    monkeypatch.setattr(engine._dataset_api, "path_exists", lambda path: True)
+    monkeypatch.setattr(engine._dataset_api, "rm", mock.Mock())
+
+    engine._copy_files([("a", "b")])
+
+    assert engine._dataset_api.copy.call_count == 2
+    # the failed copy may have been completed before failing
+    engine._dataset_api.rm.assert_called_once_with("b")
+
+
+def test_copy_file_does_not_retry_client_errors(engine, monkeypatch):
+    monkeypatch.setattr(engine, "COPY_RETRY_INTERVAL", 0)
+    engine._dataset_api = model_engine.dataset_api.DatasetApi()
+    monkeypatch.setattr(
+        engine._dataset_api, "copy", mock.Mock(side_effect=rest_api_error(400))
+    )
+
+    with pytest.raises(RestAPIError):
+        engine._copy_files([("a", "b"), ("c", "d")])
+
+    copies = [c[0] for c in engine._dataset_api.copy.call_args_list]
+    assert len(copies) == len(set(copies))  # not retried
@@ -0,0 +1,1062 @@
+#
+#   Copyright 2022 Logical Clocks AB
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+import asyncio
+import random
+import threading
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from hsml import client
+from hsml.client import transport
+from hsml.client.exceptions import ModelServingException, RestAPIError
+from hsml.constants import DEPLOYMENT, PREDICTOR_STATE
+from hsml.deployment import Deployment
+from hsml.engine import serving_engine
+from hsml.model_serving import ModelServing
+from hsml.predictor_state import PredictorState
+from tests.fakes import (
+    FakeResponse,
+    StateHandler,
+    echo_predictions,
+    echo_tensors,
+    make_deployment,
+    state_json,
+)
+
+
+@pytest.fixture(autouse=True)
+def no_retry_backoff(monkeypatch):
+    monkeypatch.setattr(serving_engine.ServingEngine, "INFERENCE_RETRY_BACKOFF", 0)
+    monkeypatch.setattr(serving_engine.ServingEngine, "BATCH_RETRY_INTERVAL", 0)
+
+
+def failing(statuses, handler=echo_predictions):
+    """Inference handler failing with the given status codes before answering."""
+    statuses = list(statuses)
+
+    def handle(request):
+        if statuses:
+            return statuses.pop(0), {"errorMsg": "failed"}, None
+        return handler(request)
+
+    return handle
+
+
+class ActiveCounter:
+    """Inference handler counting the requests being answered concurrently."""
+
+    def __init__(self, handler=echo_predictions, delay=0.05):
+        self.handler = handler
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.active = 0
+        self.max_active = 0
+
+    def __call__(self, request):
+        with self.lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            time.sleep(self.delay)
+            return self.handler(request)
+        finally:
+            with self.lock:
+                self.active -= 1
+
+
+def test_predict_async_sends_request_to_istio(serving):
+    serving.istio.handler = echo_predictions
+
+    response = asyncio.run(make_deployment().predict_async(inputs=[[1, 2]]))
+
+    assert response == {"predictions": [[1, 2]]}
+    request = serving.istio.requests[0]
+    assert request.path == "/v1/models/mnist:predict"
+    assert request.headers["host"] == "mnist.test.example.com"
+    assert request.json() == {"instances": [[1, 2]]}
+    assert serving.hopsworks.requests == []
+
+
+def test_predict_async_sends_request_to_hopsworks_if_not_kserve(serving):
+    serving.hopsworks.handler = echo_predictions
+
+    response = asyncio.run(
+        make_deployment(serving_tool="DEFAULT").predict_async(data={"instances": [[1]]})
+    )
+
+    assert response == {"predictions": [[1]]}
+    assert serving.hopsworks.requests[0].path == (
+        "/project/119/inference/models/mnist:predict"
+    )
+    assert serving.istio.requests == []
+
+
+def test_predict_async_sends_requests_concurrently(serving):
+    serving.istio.handler = counter = ActiveCounter()
+    deployment = make_deployment()
+
+    async def predict_all():
+        return await asyncio.gather(
+            *[deployment.predict_async(inputs=[[i]]) for i in range(8)]
+        )
+
+    responses = asyncio.run(predict_all())
+
+    assert responses == [{"predictions": [[i]]} for i in range(8)]
+    assert counter.max_active > 1
+
+
+def test_predict_async_retries_unavailable_deployment(serving):
+    serving.istio.handler = failing([503, 502])
+
+    response = asyncio.run(make_deployment().predict_async(inputs=[[1]]))
+
+    assert response == {"predictions": [[1]]}
+    assert len(serving.istio.requests) == 3
+
+
+def test_predict_async_fails_if_deployment_not_found(serving):
+    serving.istio.handler = failing([404])
+
+    with pytest.raises(ModelServingException):
+        asyncio.run(make_deployment().predict_async(inputs=[[1]]))
+
+    assert len(serving.istio.requests) == 1
+
+
+def test_predict_async_does_not_retry_client_errors(serving):
+    serving.istio.handler = failing([400])
+
+    with pytest.raises(RestAPIError):
+        asyncio.run(make_deployment().predict_async(inputs=[[1]]))
+
+    assert len(serving.istio.requests) == 1
+
+
+def test_predict_async_fails_after_timeout(serving):
+    def handler(request):
+        time.sleep(0.5)
+        return echo_predictions(request)
+
+    serving.istio.handler = handler
+
+    with pytest.raises(ModelServingException, match="timeout"):
+        asyncio.run(make_deployment().predict_async(inputs=[[1]], timeout=0.1))
+
+
+def sent_instances(server):
+    return [request.json()["instances"] for request in server.requests]
+
+
+def test_predict_batch_dataframe(serving):
+    serving.istio.handler = echo_predictions
+    df = pd.DataFrame({"a": range(5), "b": range(5, 10)})
+
+    predictions = list(make_deployment().predict_batch(df, batch_size=2))
+
+    assert predictions == [[i, i + 5] for i in range(5)]
+    assert sorted(len(i) for i in sent_instances(serving.istio)) == [1, 2, 2]
+
+
+def test_predict_batch_iterable(serving):
+    serving.istio.handler = echo_predictions
+    rows = (np.array([i]) for i in range(5))
+
+    predictions = list(make_deployment().predict_batch(rows, batch_size=3))
+
+    assert predictions == [[i] for i in range(5)]
+
+
+def test_predict_batch_keeps_order_of_rows(serving):
+    def handler(request):
+        # later batches are answered first
+        time.sleep(0.1 - 0.02 * request.json()["instances"][0][0])
+        return echo_predictions(request)
+
+    serving.istio.handler = handler
+
+    predictions = list(
+        make_deployment().predict_batch(
+            np.arange(5).reshape(5, 1), batch_size=1, concurrency=5
+        )
+    )
+
+    assert predictions == [[i] for i in range(5)]
+
+
+def test_predict_batch_bounds_concurrent_requests(serving):
+    serving.istio.handler = counter = ActiveCounter()
+
+    list(make_deployment().predict_batch(list(range(20)), batch_size=1, concurrency=3))
+
+    assert len(serving.istio.requests) == 20
+    assert 1 < counter.max_active <= 3
+
+
+def test_predict_batch_retries_server_errors(serving):
+    serving.istio.handler = failing([500, 503])
+
+    predictions = list(make_deployment().predict_batch([[1], [2]], max_retries=2))
+
+    assert predictions == [[1], [2]]
+    assert len(serving.istio.requests) == 3
+
+
+def test_predict_batch_fails_after_max_retries(serving):
+    serving.istio.handler = failing([503, 503])
+
+    with pytest.raises(RestAPIError):
+        list(make_deployment().predict_batch([[1], [2]], max_retries=1))
+
+    assert len(serving.istio.requests) == 2
+
+
+def test_predict_batch_does_not_retry_client_errors(serving):
+    serving.istio.handler = failing([400])
+
+    with pytest.raises(RestAPIError):
+        list(make_deployment().predict_batch([[1], [2]], max_retries=3))
+
+    assert len(serving.istio.requests) == 1
+
+
+def test_predict_batch_fails_if_predictions_do_not_match_instances(serving):
+    serving.istio.handler = lambda request: (200, {"predictions": [1]}, None)
+
+    with pytest.raises(ModelServingException):
+        list(make_deployment().predict_batch([[1], [2]]))
+
+
+def test_predict_batch_as_numpy(serving):
+    serving.istio.handler = echo_predictions
+    data = np.arange(10, dtype=np.float64).reshape(5, 2)
+
+    predictions = make_deployment().predict_batch(data, batch_size=2, as_numpy=True)
+
+    np.testing.assert_array_equal(predictions, data)
+
+
+def test_predict_batch_as_numpy_without_rows(serving):
+    predictions = make_deployment().predict_batch(np.empty((0, 2)), as_numpy=True)
+
+    assert predictions.shape == (0,)
+    assert serving.istio.requests == []
+
+
+def test_predict_batch_invalid_settings(serving):
+    with pytest.raises(ValueError):
+        make_deployment().predict_batch([[1]], batch_size=0)
+    with pytest.raises(ValueError):
+        make_deployment().predict_batch([[1]], concurrency=0)
+
+
+def test_predict_binary_tensors(serving):
+    serving.istio.handler = echo_tensors
+    inputs = {"x": np.arange(6, dtype=np.float32).reshape(2, 3)}
+
+    response = make_deployment().predict(inputs=inputs, binary=True)
+
+    request = serving.istio.requests[0]
+    assert request.path == "/v2/models/mnist/infer"
+    assert request.headers["content-type"] == "application/octet-stream"
+    assert request.headers["host"] == "mnist.test.example.com"
+    header_length = int(request.headers["Inference-Header-Content-Length"])
+    assert request.body[header_length:] == inputs["x"].tobytes()
+    (output,) = response["outputs"]
+    np.testing.assert_array_equal(output["data"], inputs["x"])
+
+
+def test_predict_async_binary_tensors(serving):
+    serving.istio.handler = echo_tensors
+    tensor = np.array(["a", "b"], dtype=np.object_)
+
+    response = asyncio.run(make_deployment().predict_async(inputs=tensor, binary=True))
+
+    assert response["outputs"][0]["data"].tolist() == [b"a", b"b"]
+
+
+def test_predict_binary_tensors_requires_kserve(serving):
+    with pytest.raises(ModelServingException):
+        make_deployment(serving_tool="DEFAULT").predict(inputs=np.zeros(2), binary=True)
+
+    assert serving.istio.requests == []
+
+
+def make_v2_deployment(model_schema=None):
+    deployment = make_deployment()
+    deployment.inference_protocol = "V2"
+    deployment._model_schema = model_schema or {}
+    return deployment
+
+
+def test_predict_v2_tensor(serving):
+    serving.istio.handler = echo_tensors
+    inputs = np.arange(6, dtype=np.float32).reshape(2, 3)
+
+    response = make_v2_deployment().predict(inputs=inputs)
+
+    request = serving.istio.requests[0]
+    assert request.path == "/v2/models/mnist/infer"
+    assert request.headers["host"] == "mnist.test.example.com"
+    assert request.json() == {
+        "inputs": [
+            {
+                "name": "input-0",
+                "shape": [2, 3],
+                "datatype": "FP32",
+                "data": [0, 1, 2, 3, 4, 5],
+            }
+        ]
+    }
+    (output,) = response["outputs"]
+    assert output["data"].dtype == np.float32
+    np.testing.assert_array_equal(output["data"], inputs)
+
+
+def test_predict_v2_tensors_named_and_typed_after_model_schema(serving):
+    serving.istio.handler = echo_tensors
+    deployment = make_v2_deployment(
+        {
+            "input_schema": {
+                "tensor_schema": [
+                    {"name": "ids", "type": "int32", "shape": [-1]},
+                    {"name": "words", "type": "str", "shape": [-1]},
+                ]
+            }
+        }
+    )
+
+    deployment.predict(inputs=[[1, 2], ["a", "b"]])
+
+    ids, words = serving.istio.requests[0].json()["inputs"]
+    assert ids == {"name": "ids", "shape": [2], "datatype": "INT32", "data": [1, 2]}
+    assert words == {
+        "name": "words",
+        "shape": [2],
+        "datatype": "BYTES",
+        "data": ["a", "b"],
+    }
+
+
+def test_predict_v2_named_inputs(serving):
+    serving.istio.handler = echo_tensors
+
+    make_v2_deployment().predict(
+        inputs={"x": pd.Series([1.5, 2.5]), "y": np.array([True])}
+    )
+
+    x, y = serving.istio.requests[0].json()["inputs"]
+    assert (x["name"], x["datatype"], x["data"]) == ("x", "FP64", [1.5, 2.5])
+    assert (y["name"], y["datatype"], y["data"]) == ("y", "BOOL", [True])
+
+
+def test_predict_v2_data(serving):
+    serving.istio.handler = echo_tensors
+    data = {"inputs": [{"name": "x", "shape": [1], "datatype": "INT64", "data": [7]}]}
+
+    response = make_v2_deployment().predict(data=data)
+
+    assert serving.istio.requests[0].json() == data
+    assert response["outputs"][0]["data"].tolist() == [7]
+
+
+def test_predict_v2_data_without_inputs(serving):
+    with pytest.raises(ModelServingException):
+        make_v2_deployment().predict(data={"instances": [[1]]})
+
+    assert serving.istio.requests == []
+
+
+def test_predict_v2_requires_kserve(serving):
+    deployment = make_deployment(serving_tool="DEFAULT")
+    deployment.inference_protocol = "V2"
+
+    with pytest.raises(ModelServingException):
+        deployment.predict(inputs=[1])
+
+
+def test_predict_v2_requires_istio_client(serving, monkeypatch):
+    monkeypatch.setattr(client, "_istio_client", None)
+
+    with pytest.raises(ModelServingException):
+        make_v2_deployment().predict(inputs=[1])
+
+
+def test_invalid_inference_protocol(serving):
+    with pytest.raises(ValueError):
+        make_deployment().inference_protocol = "V3"
+
+
+def test_predict_batch_v2(serving):
+    serving.istio.handler = echo_tensors
+    data = np.arange(10).reshape(5, 2)
+
+    predictions = make_v2_deployment().predict_batch(data, batch_size=2, as_numpy=True)
+
+    np.testing.assert_array_equal(predictions, data)
+    assert sorted(r.json()["inputs"][0]["shape"] for r in serving.istio.requests) == [
+        [1, 2],
+        [2, 2],
+        [2, 2],
+    ]
+
+
+def test_get_model_metadata(serving):
+    metadata = {"name": "mnist", "inputs": [], "outputs": []}
+    serving.istio.handler = lambda request: (200, metadata, None)
+
+    assert make_v2_deployment().get_model_metadata() == metadata
+    assert serving.istio.requests[0].method == "GET"
+    assert serving.istio.requests[0].path == "/v2/models/mnist"
+
+
+def test_get_model_metadata_of_deployment_not_running(serving):
+    serving.istio.handler = lambda request: (404, {}, None)
+
+    with pytest.raises(ModelServingException):
+        make_v2_deployment().get_model_metadata()
+
+
+def test_is_model_ready(serving):
+    statuses = [200, 404]
+    serving.istio.handler = lambda request: (statuses.pop(0), {}, None)
+    deployment = make_v2_deployment()
+
+    assert deployment.is_model_ready()
+    assert not deployment.is_model_ready()
+    assert serving.istio.requests[0].path == "/v2/models/mnist/ready"
+
+
+def test_predict_retries_unavailable_deployment(serving):
+    serving.istio.handler = failing([503, 504, 502])
+
+    assert make_deployment().predict(inputs=[[1]]) == {"predictions": [[1]]}
+    assert len(serving.istio.requests) == 4
+
+
+def test_predict_fails_after_max_retries(serving):
+    serving.istio.handler = failing([503] * 4)
+
+    with pytest.raises(RestAPIError):
+        make_deployment().predict(inputs=[[1]])
+
+    assert len(serving.istio.requests) == 4
+
+
+def test_predict_retries_as_long_as_deadline_allows(serving):
+    serving.istio.handler = failing([503] * 6)
+
+    response = make_deployment().predict(inputs=[[1]], timeout=5)
+
+    assert response == {"predictions": [[1]]}
+    assert len(serving.istio.requests) == 7
+
+
+def test_predict_does_not_retry_past_deadline(serving, monkeypatch):
+    monkeypatch.setattr(serving_engine.ServingEngine, "INFERENCE_RETRY_BACKOFF", 1)
+    monkeypatch.setattr(serving_engine.random, "uniform", lambda low, high: high)
+    serving.istio.handler = failing([503])
+
+    with pytest.raises(RestAPIError):
+        make_deployment().predict(inputs=[[1]], timeout=0.5)
+
+    assert len(serving.istio.requests) == 1
+
+
+def test_retry_delay_has_full_jitter(monkeypatch):
+    bounds = []
+    monkeypatch.setattr(
+        serving_engine.random,
+        "uniform",
+        lambda low, high: bounds.append((low, high)) or high,
+    )
+    monkeypatch.setattr(serving_engine.ServingEngine, "INFERENCE_RETRY_BACKOFF", 0.1)
+    error = RestAPIError("url", FakeResponse(503))
+    engine = serving_engine.ServingEngine()
+
+    for attempt in range(6):
+        engine._get_retry_delay(error, attempt, None, max_retries=10)
+
+    assert bounds == [(0, 0.1), (0, 0.2), (0, 0.4), (0, 0.8), (0, 1.6), (0, 2)]
+
+
+def test_predict_hedges_slow_request(serving):
+    def handler(request):
+        if len(serving.istio.requests) == 1:
+            time.sleep(1)
+        return echo_predictions(request)
+
+    serving.istio.handler = handler
+    deployment = make_deployment()
+    deployment.enable_request_hedging(delay=0.05)
+
+    start = time.monotonic()
+    assert deployment.predict(inputs=[[1]]) == {"predictions": [[1]]}
+
+    assert time.monotonic() - start < 0.5
+    assert len(serving.istio.requests) == 2
+
+
+def test_predict_async_hedges_slow_request(serving):
+    def handler(request):
+        if len(serving.istio.requests) == 1:
+            time.sleep(1)
+        return echo_predictions(request)
+
+    serving.istio.handler = handler
+    deployment = make_deployment()
+    deployment.enable_request_hedging(delay=0.05)
+
+    response = asyncio.run(deployment.predict_async(inputs=[[1]]))
+
+    assert response == {"predictions": [[1]]}
+    assert len(serving.istio.requests) == 2
+
+
+def test_predict_not_hedged_once_disabled(serving):
+    serving.istio.handler = echo_predictions
+    deployment = make_deployment()
+    deployment.enable_request_hedging(delay=0)
+    deployment.disable_request_hedging()
+
+    deployment.predict(inputs=[[1]])
+
+    assert len(serving.istio.requests) == 1
+
+
+class BulkServingApi:
+    """Serving API keeping the status of each deployment by name, where deployments reach
+    the status requested by an action by the next time the states are fetched."""
+
+    def __init__(self, statuses, delay=0.05):
+        self.statuses = dict(statuses)
+        self.targets = {}
+        self.actions = []
+        self.threads = set()
+        self.counter = ActiveCounter(handler=lambda request: None, delay=delay)
+
+    def get_all(self):
+        self.statuses.update(self.targets)
+        self.targets.clear()
+        deployments = []
+        for name, status in self.statuses.items():
+            deployment = make_deployment(name)
+            deployment._predictor._set_state(
+                PredictorState.from_response_json(state_json(status))
+            )
+            deployments.append(deployment)
+        return deployments
+
+    def post(self, deployment_instance, action):
+        self.threads.add(threading.current_thread().name)
+        self.counter(None)
+        self.actions.append((deployment_instance.name, action))
+        if action == DEPLOYMENT.ACTION_START:
+            self.statuses[deployment_instance.name] = PREDICTOR_STATE.STATUS_STARTING
+            self.targets[deployment_instance.name] = PREDICTOR_STATE.STATUS_RUNNING
+        else:
+            self.statuses[deployment_instance.name] = PREDICTOR_STATE.STATUS_STOPPING
+            self.targets[deployment_instance.name] = PREDICTOR_STATE.STATUS_STOPPED
+
+
+@pytest.fixture
+def bulk_engine(serving, monkeypatch):
+    def shared_executor():
+        raise AssertionError("bulk operations must not use the transport executor")
+
+    monkeypatch.setattr(serving_engine.transport, "get_executor", shared_executor)
+    return serving_engine.ServingEngine()
+
+
+def test_start_all(bulk_engine):
+    bulk_engine._serving_api = api = BulkServingApi(
+        {
+            "a": PREDICTOR_STATE.STATUS_STOPPED,
+            "b": PREDICTOR_STATE.STATUS_STOPPED,
+            "c": PREDICTOR_STATE.STATUS_RUNNING,
+        }
+    )
+
+    report = bulk_engine.start_all(["a", "b", "c"], await_status=5)
+
+    assert report == {
+        name: {"status": PREDICTOR_STATE.STATUS_RUNNING, "error": None}
+        for name in ["a", "b", "c"]
+    }
+    assert sorted(api.actions) == [
+        ("a", DEPLOYMENT.ACTION_START),
+        ("b", DEPLOYMENT.ACTION_START),
+    ]
+
+
+def test_stop_all_reports_errors_per_deployment(bulk_engine):
+    bulk_engine._serving_api = api = BulkServingApi(
+        {
+            "a": PREDICTOR_STATE.STATUS_RUNNING,
+            "b": PREDICTOR_STATE.STATUS_STOPPED,
+        }
+    )
+
+    report = bulk_engine.stop_all(["a", "b", "missing"], await_status=5)
+
+    assert report["a"] == {"status": PREDICTOR_STATE.STATUS_STOPPED, "error": None}
+    assert report["b"] == {"status": PREDICTOR_STATE.STATUS_STOPPED, "error": None}
+    assert report["missing"] == {"status": None, "error": "Deployment not found"}
+    assert api.actions == [("a", DEPLOYMENT.ACTION_STOP)]
+
+
+def test_start_all_reports_deployments_that_cannot_start(bulk_engine):
+    bulk_engine._serving_api = BulkServingApi(
+        {
+            "a": PREDICTOR_STATE.STATUS_STOPPED,
+            "b": PREDICTOR_STATE.STATUS_STOPPING,
+        }
+    )
+
+    report = bulk_engine.start_all(["a", "b"], await_status=5)
+
+    assert report["a"] == {"status": PREDICTOR_STATE.STATUS_RUNNING, "error": None}
+    assert report["b"]["status"] == PREDICTOR_STATE.STATUS_STOPPING
+    assert "stopping" in report["b"]["error"]
+
+
+def test_start_all_without_waiting(bulk_engine):
+    bulk_engine._serving_api = BulkServingApi({"a": PREDICTOR_STATE.STATUS_STOPPED})
+
+    report = bulk_engine.start_all(["a"], await_status=0)
+
+    assert report == {"a": {"status": PREDICTOR_STATE.STATUS_STOPPED, "error": None}}
+
+
+def test_bulk_operations_run_on_dedicated_bounded_executor(bulk_engine, monkeypatch):
+    monkeypatch.setattr(serving_engine.ServingEngine, "BULK_MAX_WORKERS", 3)
+    names = ["d{}".format(i) for i in range(9)]
+    bulk_engine._serving_api = api = BulkServingApi(
+        {name: PREDICTOR_STATE.STATUS_STOPPED for name in names}
+    )
+
+    report = bulk_engine.start_all(names, await_status=5)
+
+    assert all(result["error"] is None for result in report.values())
+    assert 1 < api.counter.max_active <= 3
+    assert len(api.threads) <= 3
+    assert all(thread.startswith("hsml-bulk") for thread in api.threads)
+    # the pool is shut down once all requests are sent
+    assert not any(
+        thread.name.startswith("hsml-bulk") for thread in threading.enumerate()
+    )
+
+
+def state_requests(server):
+    return [r for r in server.requests if r.path == "/project/119/serving/1"]
+
+
+def test_get_state_reused_within_ttl(serving):
+    serving.hopsworks.handler = StateHandler()
+    deployment = make_deployment()
+    deployment.state_ttl = 60
+
+    state = deployment.get_state()
+
+    assert deployment.get_state() is state
+    assert deployment.is_running()
+    assert len(state_requests(serving.hopsworks)) == 1
+
+
+def test_get_state_refresh(serving):
+    serving.hopsworks.handler = handler = StateHandler()
+    deployment = make_deployment()
+    deployment.state_ttl = 60
+    deployment.get_state()
+
+    handler.status = "Stopped"
+
+    assert deployment.get_state(refresh=True).status == "Stopped"
+    assert deployment.is_stopped()
+    assert len(state_requests(serving.hopsworks)) == 2
+
+
+def test_get_state_not_cached_if_ttl_is_zero(serving):
+    serving.hopsworks.handler = StateHandler()
+    deployment = make_deployment()
+    deployment.state_ttl = 0
+
+    deployment.get_state()
+    deployment.get_state()
+
+    assert len(state_requests(serving.hopsworks)) == 2
+
+
+def test_get_state_fetched_again_after_ttl_if_modified(serving):
+    serving.hopsworks.handler = handler = StateHandler(etag='"v1"')
+    deployment = make_deployment()
+    deployment.state_ttl = 0.05
+    state = deployment.get_state()
+
+    time.sleep(0.06)
+    assert deployment.get_state() is state  # not modified
+
+    handler.status, handler.etag = "Stopped", '"v2"'
+    time.sleep(0.06)
+    assert deployment.get_state().status == "Stopped"
+
+    first, second, third = state_requests(serving.hopsworks)
+    assert "If-None-Match" not in first.headers
+    assert second.headers["If-None-Match"] == '"v1"'
+    assert third.headers["If-None-Match"] == '"v1"'
+
+
+def test_get_state_not_modified_renews_ttl(serving):
+    serving.hopsworks.handler = StateHandler(etag='"v1"')
+    deployment = make_deployment()
+    deployment.state_ttl = 0.1
+    deployment.get_state()
+
+    time.sleep(0.11)
+    deployment.get_state()
+    deployment.get_state()
+
+    assert len(state_requests(serving.hopsworks)) == 2
+
+
+def test_start_invalidates_cached_state(serving):
+    handler = StateHandler(status="Stopped")
+
+    def start(request):
+        if request.method == "POST":
+            handler.status = "Running"
+        return handler(request)
+
+    serving.hopsworks.handler = start
+    deployment = make_deployment()
+    deployment.state_ttl = 60
+    assert deployment.is_stopped()
+
+    deployment.start(await_running=5)
+
+    assert deployment.is_running()
+    assert [r.method for r in serving.hopsworks.requests] == [
+        "GET",
+        "GET",
+        "POST",
+        "GET",
+    ]
+
+
+def test_state_ttl_cannot_be_negative(serving):
+    with pytest.raises(ValueError):
+        make_deployment().state_ttl = -1
+
+
+class WatchServingApi:
+    """Serving API returning the next of the given snapshots of deployment statuses, by
+    name, every time the deployments are fetched, and the last one once all were returned."""
+
+    def __init__(self, *snapshots):
+        self.snapshots = list(snapshots)
+        self.model_names = []
+
+    def get_all(self, model_name=None):
+        self.model_names.append(model_name)
+        snapshot = (
+            self.snapshots.pop(0) if len(self.snapshots) > 1 else self.snapshots[0]
+        )
+        deployments = []
+        for id, (name, status) in enumerate(snapshot.items(), start=1):
+            deployment = make_deployment(name)
+            deployment._predictor._id = id
+            deployment._predictor._set_state(
+                PredictorState.from_response_json(state_json(status))
+            )
+            deployments.append(deployment)
+        return deployments
+
+
+def changes_of(changes):
+    return [
+        (
+            change.type,
+            change.deployment_name,
+            change.state.status if change.state is not None else None,
+        )
+        for change in changes
+    ]
+
+
+@pytest.fixture
+def model_serving(serving):
+    return ModelServing("test", 119)
+
+
+WATCHED_SNAPSHOTS = [
+    {"a": "Stopped", "b": "Running"},
+    {"a": "Stopped", "b": "Running"},
+    {"a": "Starting", "b": "Running"},
+    {"a": "Running"},
+]
+WATCHED_CHANGES = [
+    ("ADDED", "a", "Stopped"),
+    ("ADDED", "b", "Running"),
+    ("MODIFIED", "a", "Starting"),
+    ("MODIFIED", "a", "Running"),
+    ("DELETED", "b", None),
+]
+
+
+def test_watch(model_serving):
+    model_serving._serving_engine._serving_api = api = WatchServingApi(
+        *WATCHED_SNAPSHOTS
+    )
+
+    changes = list(model_serving.watch(interval=0.01, timeout=0.1))
+
+    assert changes_of(changes) == WATCHED_CHANGES
+    assert changes[2].changes == ["status"]
+    assert changes[2].previous_state.status == "Stopped"
+    assert len(api.model_names) > len(WATCHED_SNAPSHOTS)
+
+
+def test_watch_until_closed(model_serving):
+    model_serving._serving_engine._serving_api = api = WatchServingApi(
+        *WATCHED_SNAPSHOTS
+    )
+    watch = model_serving.watch(interval=0)
+
+    changes = [next(watch) for _ in WATCHED_CHANGES]
+    watch.close()
+
+    assert changes_of(changes) == WATCHED_CHANGES
+    assert len(api.model_names) == len(WATCHED_SNAPSHOTS)
+
+
+def test_watch_filtered_by_model(model_serving):
+    model_serving._serving_engine._serving_api = api = WatchServingApi({})
+
+    assert list(model_serving.watch(SimpleNamespace(name="mnist"), 0, 0)) == []
+    assert api.model_names == ["mnist"]
+
+
+def test_watch_async(model_serving):
+    model_serving._serving_engine._serving_api = WatchServingApi(*WATCHED_SNAPSHOTS)
+
+    async def watch():
+        return [
+            change
+            async for change in model_serving.watch_async(interval=0.01, timeout=0.1)
+        ]
+
+    assert changes_of(asyncio.run(watch())) == WATCHED_CHANGES
+
+
+@pytest.fixture
+def canary(serving, monkeypatch):
+    """Records the canary deployments saved, started and deleted, and the deployments
+    updated, which start with the given status."""
+    recorded = SimpleNamespace(
+        saved=[], started=[], deleted=[], updated=[], status="Running"
+    )
+
+    def save(deployment_instance, await_update=60):
+        deployment_instance._predictor._id = 2
+        recorded.saved.append(deployment_instance.name)
+
+    def start(deployment_instance, await_running=60):
+        recorded.started.append(deployment_instance.name)
+
+    def get_state(deployment_instance, refresh=False):
+        return PredictorState.from_response_json(state_json(recorded.status))
+
+    def delete(self, deployment_instance, force=False):
+        recorded.deleted.append((deployment_instance.name, force))
+
+    def update(self, deployment_instance, await_status):
+        recorded.updated.append(deployment_instance)
+
+    monkeypatch.setattr(Deployment, "save", save)
+    monkeypatch.setattr(Deployment, "start", start)
+    monkeypatch.setattr(Deployment, "get_state", get_state)
+    monkeypatch.setattr(serving_engine.ServingEngine, "delete", delete)
+    monkeypatch.setattr(serving_engine.ServingEngine, "update", update)
+    return recorded
+
+
+def canary_predictor(model_version=2):
+    predictor = make_deployment().predictor
+    predictor._model_version = model_version
+    predictor._id = None
+    return predictor
+
+
+def test_start_canary_sends_share_of_predictions(canary, serving, monkeypatch):
+    monkeypatch.setattr(serving_engine.canary_engine, "random", random.Random(0))
+    serving.istio.handler = echo_predictions
+    deployment = make_deployment()
+
+    canary_deployment = deployment.start_canary(canary_predictor(), 50)
+
+    assert canary_deployment.name == "mnistcanary"
+    assert canary.saved == canary.started == ["mnistcanary"]
+    for i in range(40):
+        assert deployment.predict(inputs=[[i]]) == {"predictions": [[i]]}
+    paths = [r.path for r in serving.istio.requests]
+    stats = deployment.get_canary_stats()
+    assert paths.count("/v1/models/mnistcanary:predict") == (
+        stats["canary"]["predictions"]
+    )
+    assert paths.count("/v1/models/mnist:predict") == stats["baseline"]["predictions"]
+    assert 0 < stats["canary"]["predictions"] < 40
+
+
+def test_start_canary_deletes_canary_not_running(canary):
+    canary.status = "Failed"
+    deployment = make_deployment()
+
+    with pytest.raises(ModelServingException):
+        deployment.start_canary(canary_predictor())
+
+    assert canary.deleted == [("mnistcanary", True)]
+    with pytest.raises(ModelServingException):
+        deployment.get_canary_stats()
+
+
+def test_start_canary_only_once(canary):
+    deployment = make_deployment()
+    deployment.start_canary(canary_predictor())
+
+    with pytest.raises(ModelServingException):
+        deployment.start_canary(canary_predictor(model_version=3))
+
+    assert canary.saved == ["mnistcanary"]
+
+
+def test_promote_canary(canary):
+    deployment = make_deployment()
+    deployment.start_canary(canary_predictor())
+
+    deployment.promote_canary()
+
+    assert canary.updated == [deployment]
+    assert deployment.model_version == 2
+    assert deployment.id == 1
+    assert deployment.name == "mnist"
+    assert canary.deleted == [("mnistcanary", True)]
+    with pytest.raises(ModelServingException):
+        deployment.get_canary_stats()
+
+
+def test_rollback_canary(canary):
+    deployment = make_deployment()
+    deployment.start_canary(canary_predictor())
+
+    deployment.rollback_canary()
+
+    assert canary.updated == []
+    assert deployment.model_version == 1
+    assert canary.deleted == [("mnistcanary", True)]
+    with pytest.raises(ModelServingException):
+        deployment.rollback_canary()
+
+
+def test_run_canary_promotes_canary(canary, serving):
+    serving.istio.handler = echo_predictions
+    deployment = make_deployment()
+    done = threading.Event()
+
+    def predict():
+        while not done.is_set():
+            deployment.predict(inputs=[[1]])
+
+    thread = threading.Thread(target=predict)
+    thread.start()
+    try:
+        report = deployment.run_canary(
+            canary_predictor(),
+            traffic_percentage=50,
+            min_predictions=5,
+            max_latency_increase=10,
+            timeout=5,
+        )
+    finally:
+        done.set()
+        thread.join()
+
+    assert report["promoted"]
+    assert report["canary"]["predictions"] >= 5
+    assert report["baseline"]["predictions"] >= 5
+    assert canary.updated == [deployment]
+    assert deployment.model_version == 2
+    assert canary.deleted == [("mnistcanary", True)]
+
+
+def test_run_canary_rolls_back_without_enough_predictions(canary):
+    deployment = make_deployment()
+
+    report = deployment.run_canary(canary_predictor(), timeout=0)
+
+    assert not report["promoted"]
+    assert report["reason"].startswith("Not enough predictions")
+    assert canary.updated == []
+    assert deployment.model_version == 1
+    assert canary.deleted == [("mnistcanary", True)]
+
+
+@pytest.fixture
+def async_executor(monkeypatch):
+    """Executor of asynchronous requests of 8 threads, while clients keep 2 connections."""
+    monkeypatch.setenv(transport.PooledHTTPAdapter.POOL_MAXSIZE, "2")
+    monkeypatch.setenv(transport.ASYNC_MAX_WORKERS, "8")
+    monkeypatch.setattr(transport, "_async_executor", None)
+    yield
+    transport.get_async_executor().shutdown()
+
+
+def test_predict_async_concurrency_not_bound_by_connection_pool(
+    async_executor, serving
+):
+    serving.istio.handler = counter = ActiveCounter(delay=0.1)
+    deployment = make_deployment()
+
+    async def predict_all():
+        return await asyncio.gather(
+            *[deployment.predict_async(inputs=[[i]]) for i in range(16)]
+        )
+
+    responses = asyncio.run(predict_all())
+
+    assert responses == [{"predictions": [[i]]} for i in range(16)]
+    assert 2 < counter.max_active <= 8
+
+
+def test_predict_async_not_blocked_by_busy_shared_executor(serving):
+    serving.istio.handler = echo_predictions
+    executor = transport.get_executor()
+    release = threading.Event()
+    busy = [executor.submit(release.wait, 5) for _ in range(executor._max_workers)]
+    try:
+        response = asyncio.run(
+            asyncio.wait_for(make_deployment().predict_async(inputs=[[1]]), 2)
+        )
+    finally:
+        release.set()
+        for future in busy:
+            future.result()
+
+    assert response == {"predictions": [[1]]}
@@ -0,0 +1,109 @@
+#
+#   Copyright 2022 Logical Clocks AB
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+from types import SimpleNamespace
+
+import pytest
+
+from hsml.constants import DEPLOYMENT_STATE_CHANGE
+from hsml.deployment_state_change import DeploymentStateChange
+from hsml.predictor_state import PredictorState
+from tests.fakes import state_json
+
+DEPLOYMENT = SimpleNamespace(name="mnist")
+
+
+def state(status="Running", available_instances=1, condition_type=None):
+    condition = (
+        {"type": condition_type, "status": True, "reason": "reason"}
+        if condition_type is not None
+        else None
+    )
+    return PredictorState.from_response_json(
+        state_json(status, available_instances, condition)
+    )
+
+
+def test_added():
+    current = state()
+
+    change = DeploymentStateChange.from_states(DEPLOYMENT, current, None)
+
+    assert change.type == DEPLOYMENT_STATE_CHANGE.TYPE_ADDED
+    assert change.deployment_name == "mnist"
+    assert change.state is current
+    assert change.previous_state is None
+    assert change.changes == []
+
+
+def test_deleted():
+    previous = state()
+
+    change = DeploymentStateChange.from_states(DEPLOYMENT, None, previous)
+
+    assert change.type == DEPLOYMENT_STATE_CHANGE.TYPE_DELETED
+    assert change.state is None
+    assert change.previous_state is previous
+    assert repr(change) == (
+        "DeploymentStateChange(type: 'Deleted', deployment: 'mnist', status: 'Running')"
+    )
+
+
+def test_unchanged():
+    assert DeploymentStateChange.from_states(DEPLOYMENT, state(), state()) is None
+
+
+@pytest.mark.parametrize(
+    "current, previous, changes",
+    [
+        (
+            state("Running"),
+            state("Starting"),
+            [DEPLOYMENT_STATE_CHANGE.FIELD_STATUS],
+        ),
+        (
+            state("Starting", condition_type="STARTED"),
+            state("Starting", condition_type="INITIALIZED"),
+            [DEPLOYMENT_STATE_CHANGE.FIELD_CONDITION],
+        ),
+        (
+            state("Starting", condition_type="STARTED"),
+            state("Starting"),
+            [DEPLOYMENT_STATE_CHANGE.FIELD_CONDITION],
+        ),
+        (
+            state(available_instances=2),
+            state(available_instances=1),
+            [DEPLOYMENT_STATE_CHANGE.FIELD_AVAILABLE_INSTANCES],
+        ),
+        (
+            state("Stopped", available_instances=0, condition_type="STOPPED"),
+            state("Running", available_instances=1, condition_type="READY"),
+            [
+                DEPLOYMENT_STATE_CHANGE.FIELD_STATUS,
+                DEPLOYMENT_STATE_CHANGE.FIELD_CONDITION,
+                DEPLOYMENT_STATE_CHANGE.FIELD_AVAILABLE_INSTANCES,
+            ],
+        ),
+    ],
+)
+def test_modified(current, previous, changes):
+    change = DeploymentStateChange.from_states(DEPLOYMENT, current, previous)
+
+    assert change.type == DEPLOYMENT_STATE_CHANGE.TYPE_MODIFIED
+    assert change.state is current
+    assert change.previous_state is previous
+    assert change.changes == changes
@@ -0,0 +1,264 @@
+#
+#   Copyright 2022 Logical Clocks AB
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+import json
+
+import numpy as np
+import pytest
+
+from hsml import util
+
+
+def encode(inputs):
+    request = util.BinaryInferenceRequest(inputs)
+    body = b"".join(bytes(part) for part in request)
+    assert len(body) == len(request)
+    return json.loads(body[: request.header_length]), body[request.header_length :]
+
+
+def as_response(header, buffers):
+    """Turn an encoded request into a response with the inputs as outputs."""
+    response_header = json.dumps({"outputs": header["inputs"]}).encode("utf-8")
+    return response_header + buffers, len(response_header)
+
+
+def round_trip(inputs):
+    return util.decode_inference_response(*as_response(*encode(inputs)))["outputs"]
+
+
+def test_binary_request_header():
+    header, buffers = encode(
+        {"x": np.zeros((2, 3), dtype=np.float32), "y": np.arange(4, dtype=np.int64)}
+    )
+
+    assert header == {
+        "inputs": [
+            {
+                "name": "x",
+                "shape": [2, 3],
+                "datatype": "FP32",
+                "parameters": {"binary_data_size": 24},
+            },
+            {
+                "name": "y",
+                "shape": [4],
+                "datatype": "INT64",
+                "parameters": {"binary_data_size": 32},
+            },
+        ],
+        "parameters": {"binary_data_output": True},
+    }
+    assert len(buffers) == 56
+
+
+def test_binary_request_single_array_named_input_0():
+    header, _ = encode(np.ones(2))
+
+    assert header["inputs"][0]["name"] == "input-0"
+    assert header["inputs"][0]["datatype"] == "FP64"
+
+
+@pytest.mark.parametrize(
+    "dtype", [np.bool_, np.uint8, np.int16, np.int32, np.int64, np.float16, np.float64]
+)
+def test_binary_round_trip(dtype):
+    tensor = (np.arange(-6, 6) % 3).astype(dtype).reshape(3, 4)
+
+    (output,) = round_trip({"x": tensor})
+
+    assert output["data"].dtype == tensor.dtype
+    np.testing.assert_array_equal(output["data"], tensor)
+    assert "binary_data_size" not in output["parameters"]
+
+
+def test_binary_buffers_are_little_endian():
+    tensor = np.array([1, -2], dtype=">i4")
+
+    _, buffers = encode(tensor)
+
+    assert buffers == np.array([1, -2], dtype="<i4").tobytes()
+    np.testing.assert_array_equal(round_trip(tensor)[0]["data"], [1, -2])
+
+
+def test_binary_non_contiguous_tensor():
+    tensor = np.arange(12, dtype=np.int32).reshape(3, 4)[:, ::2]
+
+    np.testing.assert_array_equal(round_trip(tensor)[0]["data"], tensor)
+
+
+def test_binary_bytes_tensor():
+    tensor = np.array([["a", "bc"], ["", "déf"]], dtype=np.object_)
+
+    header, buffers = encode(tensor)
+    (output,) = round_trip(tensor)
+
+    assert header["inputs"][0]["datatype"] == "BYTES"
+    assert buffers[:5] == b"\x01\x00\x00\x00a"
+    assert output["data"].shape == (2, 2)
+    assert output["data"].tolist() == [[b"a", b"bc"], [b"", "déf".encode("utf-8")]]
+
+
+def test_binary_request_rejects_unsupported_inputs():
+    with pytest.raises(ValueError):
+        util.BinaryInferenceRequest([1, 2])
+    with pytest.raises(ValueError):
+        util.BinaryInferenceRequest({})
+    with pytest.raises(ValueError):
+        util.BinaryInferenceRequest(np.zeros(2, dtype=np.complex64))
+
+
+def test_decode_json_response():
+    content = json.dumps(
+        {
+            "outputs": [
+                {"name": "y", "shape": [2, 1], "datatype": "FP32", "data": [1, 2]},
+                {"name": "z", "shape": [1], "datatype": "BYTES", "data": ["a"]},
+            ]
+        }
+    ).encode("utf-8")
+
+    y, z = util.decode_inference_response(content)["outputs"]
+
+    assert y["data"].dtype == np.float32
+    assert y["data"].shape == (2, 1)
+    assert z["data"].tolist() == ["a"]
+
+
+def test_decode_mixed_binary_and_json_outputs():
+    header = json.dumps(
+        {
+            "outputs": [
+                {"name": "y", "shape": [2], "datatype": "INT8", "data": [1, 2]},
+                {
+                    "name": "z",
+                    "shape": [2],
+                    "datatype": "UINT8",
+                    "parameters": {"binary_data_size": 2},
+                },
+            ]
+        }
+    ).encode("utf-8")
+
+    y, z = util.decode_inference_response(header + b"\x03\x04", len(header))["outputs"]
+
+    assert y["data"].tolist() == [1, 2]
+    assert z["data"].tolist() == [3, 4]
+
+
+class Clock:
+    """Fake monotonic clock, advanced by the waits of `util.poll`."""
+
+    def __init__(self, monkeypatch):
+        self.now = 0.0
+        self.waits = []
+        monkeypatch.setattr(util.time, "monotonic", lambda: self.now)
+
+    def wait(self, seconds):
+        self.waits.append(round(seconds, 6))
+        self.now += seconds
+
+
+class Results:
+    """Function returning None until the given call."""
+
+    def __init__(self, ready_at=None):
+        self.ready_at = ready_at
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return "ready" if self.calls == self.ready_at else None
+
+
+def test_poll_returns_available_result_without_waiting(monkeypatch):
+    clock = Clock(monkeypatch)
+
+    assert util.poll(Results(1), 10, wait_fn=clock.wait) == "ready"
+    assert clock.waits == []
+
+
+def test_poll_backs_off_after_fast_polls(monkeypatch):
+    clock = Clock(monkeypatch)
+
+    result = util.poll(
+        Results(8),
+        100,
+        initial_interval=0.5,
+        max_interval=5,
+        fast_polls=3,
+        backoff=2,
+        jitter=0,
+        wait_fn=clock.wait,
+    )
+
+    assert result == "ready"
+    assert clock.waits == [0.5, 0.5, 0.5, 1, 2, 4, 5]
+
+
+def test_poll_calls_function_when_timeout_expires(monkeypatch):
+    clock = Clock(monkeypatch)
+    results = Results()
+
+    assert util.poll(results, 2.2, jitter=0, wait_fn=clock.wait) is None
+
+    assert clock.waits == [0.5, 0.5, 0.5, 0.7]
+    assert results.calls == 5
+
+
+def test_poll_returns_result_of_last_call(monkeypatch):
+    clock = Clock(monkeypatch)
+
+    assert util.poll(Results(5), 2.2, jitter=0, wait_fn=clock.wait) == "ready"
+
+
+def test_poll_with_zero_timeout(monkeypatch):
+    clock = Clock(monkeypatch)
+    results = Results()
+
+    assert util.poll(results, 0, wait_fn=clock.wait) is None
+    assert results.calls == 1
+    assert clock.waits == []
+
+
+def test_poll_intervals_vary_by_jitter(monkeypatch):
+    clock = Clock(monkeypatch)
+
+    util.poll(Results(50), 1000, initial_interval=1, jitter=0.2, wait_fn=clock.wait)
+
+    assert all(0.8 <= wait <= 1.2 for wait in clock.waits[:3])
+    assert all(4 <= wait <= 6 for wait in clock.waits[10:])
+    assert len(set(clock.waits)) > 1
+
+
+def test_poll_with_wait_returning_early(monkeypatch):
+    clock = Clock(monkeypatch)
+    results = Results(3)
+
+    def notified_wait(seconds):
+        # e.g., woken up by a notification after a tenth of the interval
+        clock.wait(seconds / 10)
+
+    assert util.poll(results, 10, jitter=0, wait_fn=notified_wait) == "ready"
+    assert clock.now == pytest.approx(0.1)
+
+
+def test_poll_sleeps_by_default(monkeypatch):
+    waits = []
+    monkeypatch.setattr(util.time, "sleep", waits.append)
+
+    util.poll(Results(2), 10, initial_interval=0.01, jitter=0)
+
+    assert waits == [0.01]